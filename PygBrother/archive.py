@@ -0,0 +1,365 @@
+# Tiered retention for PygBrother
+# Comments and mod actions older than a cutoff are moved out of the hot tables
+# into zstd-compressed Parquet files, one directory per table, subreddit and
+# month:
+#
+#   ARCHIVE_DIR/comments/subreddit=python/month=2024-05/part-<id>.parquet
+#
+# manifest.json lists every file with its row count and created_utc range, so
+# a lookup only opens the files that can hold what it asks for. query() reads
+# the live table and the archive together, so history keeps working while the
+# hot tables stay small. Needs pyarrow.
+#
+# set -x ARCHIVE_DIR archive   # in main.py, with ARCHIVE_AFTER_DAYS, to archive in the background
+# set -x ARCHIVE_AFTER_DAYS 180
+# python -m PygBrother.archive run --after-days 180
+# python -m PygBrother.archive show comments --subreddit python --where author_id=some_user
+
+import argparse
+import json
+import os
+import uuid
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from threading import Event, Lock, Thread
+from typing import Any, Callable, Optional
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from sqlalchemy import DateTime, Integer, Table, delete, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session as SQLAlchemySession
+from .models import Base, CommentModel, ModActionModel
+from .search import drop_documents
+
+from .log import get_logger
+logger = get_logger()
+
+ARCHIVED_TABLES: dict[str, type[Base]] = {
+    CommentModel.__tablename__: CommentModel,
+    ModActionModel.__tablename__: ModActionModel,
+}
+MANIFEST: str = 'manifest.json'
+# Directory name for rows without a subreddit
+NO_SUBREDDIT: str = '_none'
+
+
+def _utc(value: Optional[datetime]) -> Optional[datetime]:
+    # The hot tables store naive UTC datetimes
+    if value is None or value.tzinfo is not None:
+        return value
+    return value.replace(tzinfo=timezone.utc)
+
+
+def _naive(value: Optional[datetime]) -> Optional[datetime]:
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def arrow_schema(table: Table) -> pa.Schema:
+    """Parquet schema for the columns of ``table``; timestamps are UTC."""
+    fields: list[pa.Field] = []
+    for column in table.columns:
+        if isinstance(column.type, DateTime):
+            arrow_type = pa.timestamp('us', tz='UTC')
+        elif isinstance(column.type, Integer):
+            arrow_type = pa.int64()
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type))
+    return pa.schema(fields)
+
+
+@dataclass
+class ArchiveFile:
+    table: str
+    subreddit: str
+    # YYYY-MM of created_utc
+    month: str
+    # Relative to the archive root
+    path: str
+    rows: int
+    min_created_utc: str
+    max_created_utc: str
+
+
+class Archive:
+    """
+    Parquet archive of rows moved out of the hot tables, under ``root``.
+
+    Files are only ever added: each call to :meth:`write` creates new part
+    files and then rewrites the manifest atomically, so a reader sees either
+    the old or the new set of files.
+    """
+
+    def __init__(self, root: str | Path) -> None:
+        self.root: Path = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._lock: Lock = Lock()
+        self.files: list[ArchiveFile] = self._load()
+
+    def _load(self) -> list[ArchiveFile]:
+        path = self.root / MANIFEST
+        if not path.exists():
+            return []
+        with path.open() as manifest:
+            return [ArchiveFile(**entry) for entry in json.load(manifest)['files']]
+
+    def _save(self) -> None:
+        path = self.root / MANIFEST
+        temporary = path.with_suffix('.json.tmp')
+        with temporary.open('w') as manifest:
+            json.dump({'files': [asdict(entry) for entry in self.files]}, manifest, indent=1)
+            manifest.flush()
+            os.fsync(manifest.fileno())
+        os.replace(temporary, path)
+
+    def write(self, table: str, rows: list[dict[str, Any]]) -> list[ArchiveFile]:
+        """
+        Write ``rows`` of ``table`` as one zstd-compressed Parquet file per
+        subreddit and month, and add them to the manifest.
+        """
+        schema = arrow_schema(ARCHIVED_TABLES[table].__table__)
+        groups: dict[tuple[str, str], list[dict[str, Any]]] = {}
+        for row in rows:
+            row = {**row, 'created_utc': _utc(row['created_utc'])}
+            groups.setdefault((row.get('subreddit') or NO_SUBREDDIT, f"{row['created_utc']:%Y-%m}"), []).append(row)
+        written: list[ArchiveFile] = []
+        for (subreddit, month), group in sorted(groups.items()):
+            directory = Path(table) / f"subreddit={subreddit}" / f"month={month}"
+            (self.root / directory).mkdir(parents=True, exist_ok=True)
+            relative = directory / f"part-{uuid.uuid4().hex}.parquet"
+            temporary = self.root / relative.with_suffix('.tmp')
+            arrow_table = pa.Table.from_pylist(group, schema=schema).sort_by('created_utc')
+            pq.write_table(arrow_table, temporary, compression='zstd')
+            with temporary.open('rb') as part:
+                os.fsync(part.fileno())
+            os.replace(temporary, self.root / relative)
+            created = [row['created_utc'] for row in group]
+            written.append(ArchiveFile(
+                table, subreddit, month, relative.as_posix(), len(group), min(created).isoformat(), max(created).isoformat(),
+            ))
+        with self._lock:
+            self.files.extend(written)
+            self._save()
+        return written
+
+    def select(self, table: str, subreddit: Optional[str] = None, since: Optional[datetime] = None, until: Optional[datetime] = None) -> list[ArchiveFile]:
+        """Files of ``table`` that can hold rows of ``subreddit`` created in ``[since, until)``."""
+        since, until = _utc(since), _utc(until)
+        with self._lock:
+            files = list(self.files)
+        return [
+            entry for entry in files
+            if entry.table == table
+            and (subreddit is None or entry.subreddit == subreddit)
+            and (since is None or datetime.fromisoformat(entry.max_created_utc) >= since)
+            and (until is None or datetime.fromisoformat(entry.min_created_utc) < until)
+        ]
+
+    def read(
+        self,
+        table: str,
+        subreddit: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        where: Optional[dict[str, Any]] = None,
+    ) -> list[dict[str, Any]]:
+        """Archived rows of ``table``, filtered like :func:`query`."""
+        files = self.select(table, subreddit, since, until)
+        if not files:
+            return []
+        condition: Optional[pc.Expression] = None
+        filters: dict[str, Any] = dict(where or {})
+        if subreddit is not None:
+            filters['subreddit'] = subreddit
+        parts: list[pc.Expression] = [pc.field(name) == value for name, value in filters.items()]
+        if since is not None:
+            parts.append(pc.field('created_utc') >= pa.scalar(_utc(since), pa.timestamp('us', tz='UTC')))
+        if until is not None:
+            parts.append(pc.field('created_utc') < pa.scalar(_utc(until), pa.timestamp('us', tz='UTC')))
+        for part in parts:
+            condition = part if condition is None else condition & part
+        dataset = ds.dataset(
+            [str(self.root / entry.path) for entry in files],
+            schema=arrow_schema(ARCHIVED_TABLES[table].__table__),
+            format='parquet',
+        )
+        return dataset.to_table(filter=condition).to_pylist()
+
+
+def query(
+    session: SQLAlchemySession,
+    archive: Optional[Archive],
+    table: str,
+    subreddit: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    where: Optional[dict[str, Any]] = None,
+    limit: Optional[int] = None,
+) -> list[dict[str, Any]]:
+    """
+    Rows of ``comments`` or ``modactions`` from the live table and the
+    archive together, newest first.
+
+    A row found in both, after an archive run was interrupted or an old item
+    was fetched again, is returned once, from the live table. Archived rows
+    keep their old ``id``, which no longer refers to anything.
+
+    Args:
+        where: Column values to match exactly, e.g. ``{'author_id': name}``.
+        limit: At most this many rows.
+
+    Returns:
+        list[dict[str, Any]]: One dict of column values per row, with UTC
+        ``created_utc``.
+    """
+    model_table: Table = ARCHIVED_TABLES[table].__table__
+    statement = select(model_table).order_by(model_table.c.created_utc.desc())
+    if subreddit is not None:
+        statement = statement.where(model_table.c.subreddit == subreddit)
+    if since is not None:
+        statement = statement.where(model_table.c.created_utc >= _naive(since))
+    if until is not None:
+        statement = statement.where(model_table.c.created_utc < _naive(until))
+    for name, value in (where or {}).items():
+        statement = statement.where(model_table.c[name] == value)
+    if limit is not None:
+        statement = statement.limit(limit)
+    rows: dict[str, dict[str, Any]] = {}
+    for row in session.execute(statement).mappings():
+        rows[row['reddit_id']] = {**row, 'created_utc': _utc(row['created_utc'])}
+    if archive is not None:
+        for row in archive.read(table, subreddit, since, until, where):
+            rows.setdefault(row['reddit_id'], row)
+    ordered = sorted(rows.values(), key=lambda row: row['created_utc'], reverse=True)
+    return ordered if limit is None else ordered[:limit]
+
+
+def get(session: SQLAlchemySession, archive: Optional[Archive], table: str, reddit_id: str) -> Optional[dict[str, Any]]:
+    """One row of ``comments`` or ``modactions`` by reddit_id, live or archived."""
+    found = query(session, archive, table, where={'reddit_id': reddit_id}, limit=1)
+    return found[0] if found else None
+
+
+class Archiver:
+    """
+    Moves rows older than ``after`` from the hot tables into ``archive``,
+    ``batch_size`` rows per transaction.
+
+    Each batch is written to Parquet and added to the manifest before it is
+    deleted from the database, so rows are never only in flight. Posts and
+    users stay in the database, as do the user_stats and comment_tree
+    entries of archived rows; their full-text search entries are dropped.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], SQLAlchemySession],
+        archive: Archive | str | Path,
+        after: timedelta,
+        tables: tuple[str, ...] = tuple(ARCHIVED_TABLES),
+        batch_size: int = 10000,
+        interval: float = 3600,
+    ) -> None:
+        self.session_factory: Callable[[], SQLAlchemySession] = session_factory
+        self.archive: Archive = archive if isinstance(archive, Archive) else Archive(archive)
+        self.after: timedelta = after
+        self.tables: tuple[str, ...] = tables
+        self.batch_size: int = batch_size
+        self.interval: float = interval
+        self.stop_event: Event = Event()
+        self._worker: Optional[Thread] = None
+
+    def start(self) -> None:
+        self._worker = Thread(target=self._run, name="Archiver", daemon=True)
+        self._worker.start()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        if self._worker is not None:
+            self._worker.join()
+
+    def _run(self) -> None:
+        while not self.stop_event.is_set():
+            try:
+                self.run_once()
+            except (SQLAlchemyError, OSError, pa.ArrowException) as e:
+                logger.error(f"Error archiving old rows: {e}")
+            self.stop_event.wait(self.interval)
+
+    def run_once(self, now: Optional[datetime] = None) -> dict[str, int]:
+        """
+        Archive every row older than the cutoff.
+
+        Returns:
+            dict[str, int]: Rows archived per table.
+        """
+        # Compared against the naive UTC datetimes in the hot tables
+        cutoff = _naive(now or datetime.now(timezone.utc)) - self.after
+        archived: dict[str, int] = {}
+        for table in self.tables:
+            archived[table] = 0
+            while not self.stop_event.is_set():
+                moved = self._archive_batch(table, cutoff)
+                archived[table] += moved
+                if moved < self.batch_size:
+                    break
+            if archived[table]:
+                logger.info(f"Archived {archived[table]} {table} older than {cutoff:%Y-%m-%d}.")
+        return archived
+
+    def _archive_batch(self, table: str, cutoff: datetime) -> int:
+        model_table: Table = ARCHIVED_TABLES[table].__table__
+        with self.session_factory() as session:
+            rows = [dict(row) for row in session.execute(
+                select(model_table).where(model_table.c.created_utc < cutoff).order_by(model_table.c.id).limit(self.batch_size)
+            ).mappings()]
+            if not rows:
+                return 0
+            self.archive.write(table, rows)
+            drop_documents(session, table, rows)
+            session.execute(delete(model_table).where(model_table.c.id.in_([row['id'] for row in rows])))
+            session.commit()
+        return len(rows)
+
+
+def main() -> None:
+    from dotenv import load_dotenv
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from .main import database_url_from_env
+    parser = argparse.ArgumentParser(description="Archive old comments and mod actions to Parquet, or look them up.")
+    parser.add_argument('command', choices=('run', 'show'))
+    parser.add_argument('table', nargs='?', choices=tuple(ARCHIVED_TABLES), help="Table, for show.")
+    parser.add_argument('--archive', default=os.environ.get('ARCHIVE_DIR', 'archive'), help="Archive directory; defaults to ARCHIVE_DIR.")
+    parser.add_argument('--after-days', type=float, default=float(os.environ.get('ARCHIVE_AFTER_DAYS', '180')))
+    parser.add_argument('--subreddit')
+    parser.add_argument('--since', type=datetime.fromisoformat)
+    parser.add_argument('--until', type=datetime.fromisoformat)
+    parser.add_argument('--where', action='append', default=[], metavar='COLUMN=VALUE')
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--url', help="Database URL; defaults to DATABASE_URL.")
+    args = parser.parse_args()
+    load_dotenv()
+    engine = create_engine(args.url or database_url_from_env())
+    Session = sessionmaker(bind=engine)
+    archive = Archive(args.archive)
+    if args.command == 'run':
+        Archiver(Session, archive, timedelta(days=args.after_days)).run_once()
+    else:
+        if not args.table:
+            parser.error("show needs a table")
+        where = dict(condition.split('=', 1) for condition in args.where)
+        with Session() as session:
+            for row in query(session, archive, args.table, args.subreddit, args.since, args.until, where, args.limit):
+                print(f"{row['created_utc']:%Y-%m-%d %H:%M} {row['reddit_id']} r/{row['subreddit']}: "
+                      f"{ {key: value for key, value in row.items() if key not in ('id', 'reddit_id', 'created_utc', 'subreddit')} }")
+    engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
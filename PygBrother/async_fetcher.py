@@ -0,0 +1,319 @@
+import asyncio
+import inspect
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Generic, Hashable, Optional, TypeVar
+import asyncpraw
+import asyncprawcore
+from asyncpraw.models import Subreddit
+from .events import CommentEvent, ModActionEvent, PostEvent
+from .reddit_fetcher import STREAMS, split_subreddits, subreddit_of, submission_key
+from .scheduler import AsyncRateLimiter
+from .metrics import DISPATCH_SECONDS, ERRORS, HANDOFF_LAG, ITEMS, QUEUE_DEPTH
+
+from .log import get_logger
+logger = get_logger()
+
+T = TypeVar('T')
+
+# A subscriber may be a plain function or a coroutine function
+Subscriber = Callable[[T], Optional[Awaitable[None]]]
+
+
+class AsyncPublisher(Generic[T]):
+    """
+    asyncio counterpart of :class:`~.reddit_fetcher.Publisher` and
+    :class:`~.reddit_fetcher.QueuedPublisher`.
+
+    Subscribers may be plain callables or coroutine functions. With
+    ``workers=0`` :meth:`notify` runs every subscriber before it returns.
+    Otherwise items go to ``workers`` bounded queues, each drained by its own
+    task; items with the same ``key`` share a queue and so keep their order,
+    and :meth:`notify` only waits when that queue is full. A failing subscriber
+    is logged and the others still run.
+    """
+
+    def __init__(
+        self,
+        name: str = "publisher",
+        workers: int = 0,
+        maxsize: int = 1000,
+        key: Optional[Callable[[T], Hashable]] = None,
+    ) -> None:
+        self.name: str = name
+        self.key: Optional[Callable[[T], Hashable]] = key
+        self.subscribers: list[tuple[Subscriber[T], Optional[str]]] = []
+        self._next: int = 0
+        self._queues: list[asyncio.Queue[Optional[T]]] = [asyncio.Queue(max(1, maxsize // workers)) for _ in range(workers)]
+        self._tasks: list[asyncio.Task[None]] = []
+        QUEUE_DEPTH.set_function(self.depth, name)
+
+    def subscribe(self, callback: Subscriber[T], subreddit: Optional[str] = None) -> None:
+        """
+        Call ``callback`` for every published item, or only for items from ``subreddit``
+        when a fetcher serves several subreddits.
+        """
+        self.subscribers.append((callback, subreddit.lower() if subreddit is not None else None))
+
+    async def notify(self, item: T) -> None:
+        if not self._queues:
+            await self._dispatch(item)
+            return
+        if not self._tasks:
+            # Started on first use, so the publisher can be built outside the event loop
+            self._tasks = [asyncio.create_task(self._work(queue), name=f"{self.name}-{i}") for i, queue in enumerate(self._queues)]
+        if self.key is not None:
+            queue = self._queues[hash(self.key(item)) % len(self._queues)]
+        else:
+            queue = self._queues[self._next % len(self._queues)]
+            self._next += 1
+        await queue.put(item)
+
+    def depth(self) -> int:
+        return sum(queue.qsize() for queue in self._queues)
+
+    async def close(self) -> None:
+        """Wait until every queued item was delivered."""
+        for queue in self._queues:
+            if self._tasks:
+                await queue.put(None)
+        await asyncio.gather(*self._tasks)
+        self._tasks = []
+
+    async def _work(self, queue: asyncio.Queue[Optional[T]]) -> None:
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+            await self._dispatch(item)
+
+    async def _dispatch(self, item: T) -> None:
+        with DISPATCH_SECONDS.time(self.name):
+            for callback, subreddit in self.subscribers:
+                if subreddit is not None and subreddit_of(item) != subreddit:
+                    continue
+                try:
+                    result = callback(item)
+                    if inspect.isawaitable(result):
+                        await result
+                except Exception as e:
+                    ERRORS.inc(self.name, type(e).__name__)
+                    logger.exception(f"Subscriber {getattr(callback, '__qualname__', callback)} of {self.name} failed")
+
+
+class AsyncRedditFetcher:
+    """
+    Streams posts, comments and mod actions with asyncpraw, one task per
+    stream on a single event loop, instead of one thread per stream.
+
+    Build it with :meth:`create`, which logs in and checks the subreddits.
+    Items are always published as :mod:`.events` records, since asyncpraw
+    objects would need awaiting to load anything they lack. Streams share an
+    :class:`~.scheduler.AsyncRateLimiter`, and back off and reopen on their own
+    after an error. Checkpoints and catch-up are left to the threaded
+    :class:`~.reddit_fetcher.RedditFetcher`.
+    """
+
+    def __init__(
+        self,
+        reddit: asyncpraw.Reddit,
+        subreddit_names: list[str],
+        username: str,
+        publisher_factory: Optional[Callable[[str], AsyncPublisher[Any]]] = None,
+        requests_per_minute: float = 100.0,
+    ) -> None:
+        self.reddit: asyncpraw.Reddit = reddit
+        self.username: str = username
+        self.subreddit_names: list[str] = subreddit_names
+        self.subreddit: Subreddit = Subreddit(reddit, display_name="+".join(subreddit_names))
+        make_publisher: Callable[[str], AsyncPublisher[Any]] = publisher_factory or (lambda name: AsyncPublisher(name))
+        self.post_publisher: AsyncPublisher[PostEvent] = make_publisher("posts")
+        self.comment_publisher: AsyncPublisher[CommentEvent] = make_publisher("comments")
+        self.modaction_publisher: AsyncPublisher[ModActionEvent] = make_publisher("modactions")
+        self.rate_limiter: AsyncRateLimiter = AsyncRateLimiter(requests_per_minute)
+        self.min_backoff: float = 1.0
+        self.max_backoff: float = 16.0
+        # Seconds between an item's created_utc and its hand-off to subscribers, per stream
+        self.stream_lag: dict[str, float] = {}
+        self._stop: asyncio.Event = asyncio.Event()
+        self._stream_enabled: dict[str, asyncio.Event] = {name: asyncio.Event() for name in STREAMS}
+        for enabled in self._stream_enabled.values():
+            enabled.set()
+        self._recheck_lock: asyncio.Lock = asyncio.Lock()
+
+    @classmethod
+    async def create(
+        cls,
+        subreddit: str | list[str],
+        praw_config: Dict[str, str],
+        publisher_factory: Optional[Callable[[str], AsyncPublisher[Any]]] = None,
+        requests_per_minute: float = 100.0,
+        reddit_kwargs: Optional[dict[str, Any]] = None,
+    ) -> 'AsyncRedditFetcher':
+        """
+        Log in to Reddit and keep the subreddits the account can moderate.
+
+        Raises:
+            PermissionError: If none of the subreddits can be moderated.
+        """
+        reddit = asyncpraw.Reddit(
+            client_id=praw_config['client_id'],
+            client_secret=praw_config['client_secret'],
+            refresh_token=praw_config.get('refresh_token', ''),
+            user_agent=praw_config['user_agent'],
+            **(reddit_kwargs or {}),
+        )
+        try:
+            me = await reddit.user.me()
+        except asyncprawcore.exceptions.OAuthException as e:
+            logger.error(f"Failed to authenticate Reddit user: {str(e)}")
+            await reddit.close()
+            raise
+        logger.info(f"Logged in to Reddit as u/{me.name}")
+        names: list[str] = split_subreddits(subreddit) if isinstance(subreddit, str) else list(subreddit)
+        fetcher = cls(reddit, names, me.name, publisher_factory, requests_per_minute)
+        moderated = {sub.display_name.lower() async for sub in reddit.user.moderator_subreddits(limit=None)}
+        # One listing call covers every sub we moderate; only the rest are checked one by one
+        usable = [name for name in names if name.lower() in moderated or await fetcher._is_usable(name)]
+        if not usable:
+            await reddit.close()
+            raise PermissionError(f"u/{me.name} cannot moderate any of r/{'+'.join(names)}")
+        fetcher._use(usable)
+        return fetcher
+
+    async def _is_usable(self, name: str) -> bool:
+        try:
+            subreddit = await self.reddit.subreddit(name, fetch=True)
+            if not subreddit.user_is_moderator:
+                logger.error(f"Skipping r/{name}: u/{self.username} is not a mod in r/{subreddit.display_name}")
+                return False
+            return True
+        except asyncprawcore.exceptions.Forbidden:
+            logger.error(f"Skipping r/{name}: r/{name} is private or quarantined.")
+        except asyncprawcore.exceptions.NotFound:
+            logger.error(f"Skipping r/{name}: r/{name} is banned.")
+        return False
+
+    def _use(self, names: list[str]) -> None:
+        self.subreddit_names = names
+        self.subreddit = Subreddit(self.reddit, display_name="+".join(names))
+
+    async def recheck_subreddits(self) -> bool:
+        """
+        Drop subreddits that became unusable and rebuild the combined subreddit from the rest.
+
+        Returns:
+            bool: ``True`` if at least one subreddit is left to fetch from.
+        """
+        async with self._recheck_lock:
+            names = [name for name in self.subreddit_names if await self._is_usable(name)]
+            if not names:
+                logger.error("No subreddit left to fetch from.")
+                return False
+            if names != self.subreddit_names:
+                self._use(names)
+                logger.info(f"Now fetching from r/{self.subreddit.display_name}")
+            return True
+
+    def _open_stream(self, name: str) -> AsyncIterator[Any]:
+        options: dict[str, Any] = {'skip_existing': True, 'pause_after': -1}
+        if name == "posts":
+            return self.subreddit.stream.submissions(**options)
+        if name == "comments":
+            return self.subreddit.stream.comments(**options)
+        return self.subreddit.mod.stream.log(**options)
+
+    async def _drain(self, name: str, stream: AsyncIterator[Any]) -> int:
+        # With pause_after=-1 each pass issues exactly one request, then yields None
+        found = 0
+        async for item in stream:
+            if item is None:
+                break
+            await self._process(name, item)
+            found += 1
+        return found
+
+    async def _process(self, name: str, item: Any) -> None:
+        if name == "posts":
+            post = PostEvent.from_praw(item)
+            self._record_lag(name, post.created_utc)
+            await self.post_publisher.notify(post)
+        elif name == "comments":
+            comment = CommentEvent.from_praw(item)
+            self._record_lag(name, comment.created_utc)
+            await self.comment_publisher.notify(comment)
+        else:
+            modaction = ModActionEvent.from_praw(item)
+            self._record_lag(name, modaction.created_utc)
+            await self.modaction_publisher.notify(modaction)
+
+    def _record_lag(self, stream: str, created_utc: Optional[float]) -> None:
+        if created_utc is None:
+            return
+        lag = time.time() - created_utc
+        self.stream_lag[stream] = lag
+        ITEMS.inc(stream)
+        HANDOFF_LAG.observe(lag, stream)
+
+    async def _wait_stop(self, seconds: float) -> None:
+        try:
+            await asyncio.wait_for(self._stop.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _poll_stream(self, name: str) -> None:
+        backoff: float = self.min_backoff
+        stream = self._open_stream(name)
+        while not self._stop.is_set():
+            if not self._stream_enabled[name].is_set():
+                await self._wait_stop(1.0)
+                continue
+            await self.rate_limiter.acquire(name)
+            try:
+                found = await self._drain(name, stream)
+            except asyncprawcore.exceptions.AsyncPrawcoreException as e:
+                ERRORS.inc("fetcher", type(e).__name__)
+                # The failed generator is finished, start a fresh one
+                logger.error(f"Error polling {name} stream, backing off {backoff}s: {e}")
+                if isinstance(e, (asyncprawcore.exceptions.Forbidden, asyncprawcore.exceptions.NotFound)):
+                    if not await self.recheck_subreddits():
+                        self.stop()
+                        break
+                stream = self._open_stream(name)
+                found = 0
+            if found:
+                backoff = self.min_backoff
+            else:
+                await self._wait_stop(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+        logger.debug(f"Stopped polling {name} stream.")
+
+    async def run(self) -> None:
+        """Stream new posts, comments and mod actions to the publishers until :meth:`stop`."""
+        logger.info(f"Starting to fetch content from r/{self.subreddit.display_name} using account {self.username}")
+        await asyncio.gather(*(self._poll_stream(name) for name in STREAMS))
+        logger.info(f"Stopped fetching from r/{self.subreddit.display_name}, draining publishers")
+        for publisher in (self.post_publisher, self.comment_publisher, self.modaction_publisher):
+            await publisher.close()
+
+    def pause_stream(self, name: str) -> None:
+        """Stop polling one stream (``posts``, ``comments`` or ``modactions``) until resumed."""
+        self._stream_enabled[name].clear()
+
+    def resume_stream(self, name: str) -> None:
+        self._stream_enabled[name].set()
+
+    def stop(self) -> None:
+        """Ask ``run`` to return once every stream finished its current request."""
+        self._stop.set()
+
+    async def close(self) -> None:
+        """Close the HTTP session of the Reddit client."""
+        await self.reddit.close()
+
+
+def make_async_publisher_factory(workers: int, maxsize: int = 1000) -> Callable[[str], AsyncPublisher[Any]]:
+    """Publishers with ``workers`` queues each, keeping the items of one submission in order within a stream."""
+    def factory(name: str) -> AsyncPublisher[Any]:
+        key = submission_key if name in ("posts", "comments") else None
+        return AsyncPublisher(name, workers=workers, maxsize=maxsize, key=key)
+    return factory
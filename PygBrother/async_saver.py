@@ -0,0 +1,130 @@
+import asyncio
+import time
+from typing import Optional
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from .batch_saver import observe_commit_lag, write_batch
+from .events import CommentEvent, ModActionEvent, PostEvent
+from .seen_index import SeenIndex
+from .metrics import DB_COMMIT_SECONDS, ERRORS, SAVE_SECONDS, get_registry
+
+from .log import get_logger
+logger = get_logger()
+
+
+class AsyncDatabaseSaver:
+    """
+    :class:`~.batch_saver.BatchDatabaseSaver` for the asyncio runtime.
+
+    Subscribe ``save_post``, ``save_comment`` and ``save_modaction`` to an
+    :class:`~.async_fetcher.AsyncRedditFetcher`. Events are buffered and
+    written in one transaction through an ``AsyncSession`` once
+    ``batch_size`` are pending, or every ``flush_interval`` seconds from a
+    background task, so the event loop never waits on the database driver.
+    Users are stored from the events alone, without their karma.
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker[AsyncSession],
+        batch_size: int = 500,
+        flush_interval: float = 2.0,
+        seen_index: Optional[SeenIndex] = None,
+        user_stats: bool = False,
+        comment_tree: bool = False,
+        search_index: bool = False,
+    ) -> None:
+        self.session_factory: async_sessionmaker[AsyncSession] = session_factory
+        self.seen_index: Optional[SeenIndex] = seen_index
+        self.batch_size: int = batch_size
+        self.flush_interval: float = flush_interval
+        self.user_stats: bool = user_stats
+        self.comment_tree: bool = comment_tree
+        self.search_index: bool = search_index
+        self._posts: dict[str, PostEvent] = {}
+        self._comments: dict[str, CommentEvent] = {}
+        self._modactions: dict[str, ModActionEvent] = {}
+        self._flush_lock: asyncio.Lock = asyncio.Lock()
+        self._stopped: asyncio.Event = asyncio.Event()
+        self._flusher: Optional[asyncio.Task[None]] = None
+
+    async def save_post(self, post: PostEvent) -> None:
+        self._posts[post.id] = post
+        await self._flush_if_full()
+
+    async def save_comment(self, comment: CommentEvent) -> None:
+        self._comments[comment.id] = comment
+        await self._flush_if_full()
+
+    async def save_modaction(self, modaction: ModActionEvent) -> None:
+        self._modactions[modaction.id] = modaction
+        await self._flush_if_full()
+
+    def pending(self) -> int:
+        return len(self._posts) + len(self._comments) + len(self._modactions)
+
+    def start(self) -> None:
+        """Flush every ``flush_interval`` seconds until :meth:`close`; needs a running event loop."""
+        if self._flusher is None and self.flush_interval > 0:
+            self._flusher = asyncio.create_task(self._flush_periodically(), name="AsyncDatabaseSaver")
+
+    async def flush(self) -> bool:
+        """
+        Write every buffered event in a single transaction.
+
+        On a database error the batch is rolled back, logged and discarded,
+        like :meth:`BatchDatabaseSaver.flush <.batch_saver.BatchDatabaseSaver.flush>`.
+
+        Returns:
+            bool: ``False`` if the batch could not be written.
+        """
+        async with self._flush_lock:
+            posts, self._posts = self._posts, {}
+            comments, self._comments = self._comments, {}
+            modactions, self._modactions = self._modactions, {}
+            if not (posts or comments or modactions):
+                return True
+            started = time.perf_counter()
+            async with self.session_factory() as session:
+                try:
+                    written = await session.run_sync(
+                        lambda sync_session: write_batch(
+                            sync_session, posts, comments, modactions, [], self.seen_index,
+                            user_stats=self.user_stats, comment_tree=self.comment_tree, search_index=self.search_index,
+                        )
+                    )
+                    with DB_COMMIT_SECONDS.time("async_saver"):
+                        await session.commit()
+                except SQLAlchemyError as e:
+                    await session.rollback()
+                    ERRORS.inc("async_saver", type(e).__name__)
+                    logger.error(f"Error saving batch of {len(posts) + len(comments) + len(modactions)} items: {e}")
+                    return False
+            SAVE_SECONDS.observe(time.perf_counter() - started, "batch")
+            if get_registry().enabled:
+                observe_commit_lag(posts, comments, modactions)
+            if self.seen_index is not None:
+                for table, reddit_ids in written.items():
+                    self.seen_index.add(table, reddit_ids)
+            logger.debug(f"Flushed {len(posts)} posts, {len(comments)} comments and {len(modactions)} mod actions.")
+            return True
+
+    async def close(self) -> None:
+        """Stop the periodic flusher and write whatever is still buffered."""
+        self._stopped.set()
+        if self._flusher is not None:
+            # Not cancelled: a flush in progress must get to its commit
+            await self._flusher
+            self._flusher = None
+        await self.flush()
+
+    async def _flush_if_full(self) -> None:
+        if self.pending() >= self.batch_size:
+            await self.flush()
+
+    async def _flush_periodically(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                await asyncio.wait_for(self._stopped.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                await self.flush()
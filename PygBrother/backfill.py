@@ -0,0 +1,250 @@
+# Historical backfill for PygBrother
+# Pages back through r/<SUBREDDIT>/new, /comments and the mod log, writing through
+# the bulk saver and recording a cursor after every page so it resumes after a crash.
+#
+# By default it uses half of REDDIT_REQUESTS_PER_MINUTE (BACKFILL_PRIORITY or
+# --priority), leaving the rest to a bot running on the same credentials.
+#
+# python -m PygBrother.backfill --until 2025-01-01
+# python -m PygBrother.backfill --until 2025-01-01 --streams comments --restart --priority 0.25
+
+import argparse
+import time
+from datetime import datetime, timezone
+from threading import Event, Thread
+from typing import Any, Callable, Iterable, Optional
+import prawcore
+from sqlalchemy.orm import Session as SQLAlchemySession
+from sqlalchemy.exc import SQLAlchemyError
+from .batch_saver import BatchDatabaseSaver
+from .models import BackfillCursorModel
+from .reddit_fetcher import STREAMS, RedditFetcher, stream_cursor
+
+from .log import get_logger
+logger = get_logger()
+
+
+class Backfiller:
+    """
+    Pages backwards through a fetcher's listings until ``until`` (a date) or
+    ``until_id`` (an item ID) is reached, or Reddit stops returning pages.
+
+    Every page is written through ``saver`` and flushed before its cursor is
+    stored in ``backfill_cursors``, so a restart continues from the last
+    committed page. Requests go through the fetcher's rate limiter as the
+    ``backfill`` consumer, registered with ``priority``: a plain
+    :class:`RateLimiter` caps it at that fraction of ``requests_per_minute``,
+    and an :class:`AdaptiveScheduler` gives it that fixed weight. Either way
+    the live streams keep the rest of the budget.
+
+    Reddit serves at most about 1000 items per listing, so ``new`` and
+    ``comments`` cannot reach further back than that. The mod log goes deeper.
+    """
+
+    def __init__(
+        self,
+        fetcher: RedditFetcher,
+        saver: BatchDatabaseSaver,
+        session_factory: Callable[[], SQLAlchemySession],
+        until: Optional[datetime] = None,
+        until_id: Optional[str] = None,
+        page_size: int = 100,
+        priority: float = 0.5,
+        progress_interval: float = 30.0,
+    ) -> None:
+        self.fetcher: RedditFetcher = fetcher
+        self.saver: BatchDatabaseSaver = saver
+        self.session_factory: Callable[[], SQLAlchemySession] = session_factory
+        self.until: Optional[datetime] = until
+        self.until_id: Optional[str] = until_id
+        # A page must fit in one batch so it is written by our own flush
+        self.page_size: int = min(page_size, saver.batch_size)
+        self.priority: float = priority
+        self.progress_interval: float = progress_interval
+        self.stop_event: Event = Event()
+        self._thread: Optional[Thread] = None
+
+    def start(self, streams: Iterable[str] = STREAMS, restart: bool = False) -> None:
+        """Run the backfill on a background thread, next to the live streams."""
+        self._thread = Thread(target=self.run, args=(tuple(streams), restart), name="Backfiller", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def run(self, streams: Iterable[str] = STREAMS, restart: bool = False) -> None:
+        limiter = self.fetcher.rate_limiter
+        limiter.register("backfill", self.priority)
+        try:
+            for stream in streams:
+                if self.stop_event.is_set():
+                    break
+                self._backfill_stream(stream, restart)
+        finally:
+            limiter.unregister("backfill")
+
+    def _listing(self, stream: str, after: Optional[str]) -> list[Any]:
+        params: dict[str, str] = {'after': after} if after else {}
+        subreddit = self.fetcher.subreddit
+        if stream == "posts":
+            return list(subreddit.new(limit=self.page_size, params=params))
+        if stream == "comments":
+            return list(subreddit.comments(limit=self.page_size, params=params))
+        return list(subreddit.mod.log(limit=self.page_size, params=params))
+
+    def _save(self, stream: str, item: Any) -> None:
+        if stream == "posts":
+            self.saver.save_post(item)
+        elif stream == "comments":
+            self.saver.save_comment(item)
+        else:
+            self.saver.save_modaction(self.fetcher.modaction_event(item))
+
+    def _reached_end(self, stream: str, item: Any) -> bool:
+        if self.until_id is not None and self.until_id in (item.id, stream_cursor(stream, item)):
+            return True
+        return self.until is not None and item.created_utc < self.until.timestamp()
+
+    def _backfill_stream(self, stream: str, restart: bool) -> None:
+        subreddit_key: str = self.fetcher.subreddit.display_name
+        state = self._load_cursor(subreddit_key, stream)
+        if state.done and not restart:
+            logger.info(f"Backfill of {stream} for r/{subreddit_key} already complete.")
+            return
+        cursor: Optional[str] = None if restart else state.cursor
+        items_done: int = 0 if restart else (state.items or 0)
+        started = time.monotonic()
+        items_this_run = 0
+        first_ts: Optional[float] = None
+        last_report = started
+        logger.info(f"Backfilling {stream} for r/{subreddit_key} from {cursor or 'the newest item'}")
+
+        while not self.stop_event.is_set():
+            if not self.fetcher.rate_limiter.acquire("backfill", self.stop_event):
+                return
+            try:
+                page = self._listing(stream, cursor)
+            except prawcore.exceptions.PrawcoreException as e:
+                logger.error(f"Error fetching {stream} page after {cursor}, retrying: {e}")
+                self.stop_event.wait(self.fetcher.max_backoff)
+                continue
+            finished = not page
+            kept = []
+            for item in page:
+                if self._reached_end(stream, item):
+                    finished = True
+                    break
+                kept.append(item)
+            for item in kept:
+                self._save(stream, item)
+            if not self.saver.flush():
+                logger.error(f"Backfill of {stream} stopped at {cursor}, the page could not be written; rerun to resume.")
+                return
+            if kept:
+                cursor = stream_cursor(stream, kept[-1])
+                items_done += len(kept)
+                items_this_run += len(kept)
+                first_ts = first_ts or kept[0].created_utc
+                oldest = datetime.fromtimestamp(kept[-1].created_utc, tz=timezone.utc)
+                self._store_cursor(subreddit_key, stream, cursor, oldest, items_done, finished)
+            elif finished:
+                self._store_cursor(subreddit_key, stream, cursor, None, items_done, True)
+            if finished or time.monotonic() - last_report >= self.progress_interval:
+                last_report = time.monotonic()
+                self._report(stream, items_this_run, items_done, started, first_ts, kept[-1].created_utc if kept else None)
+            if finished:
+                logger.info(f"Backfill of {stream} for r/{subreddit_key} complete, {items_done} items.")
+                return
+
+    def _report(self, stream: str, items_this_run: int, items_done: int, started: float, first_ts: Optional[float], oldest_ts: Optional[float]) -> None:
+        elapsed = max(time.monotonic() - started, 1e-6)
+        rate = items_this_run / elapsed
+        message = f"Backfill {stream}: {items_done} items, {rate:.1f} items/s"
+        if oldest_ts is not None:
+            message += f", reached {datetime.fromtimestamp(oldest_ts, tz=timezone.utc):%Y-%m-%d %H:%M}"
+            if first_ts is not None and self.until is not None and first_ts > oldest_ts:
+                # How fast we walk back in time tells how long the rest will take
+                span_rate = (first_ts - oldest_ts) / elapsed
+                remaining = max(0.0, oldest_ts - self.until.timestamp())
+                message += f", about {remaining / span_rate / 60:.0f} min left"
+        logger.info(message)
+
+    def _load_cursor(self, subreddit: str, stream: str) -> BackfillCursorModel:
+        session: SQLAlchemySession = self.session_factory()
+        try:
+            state = session.query(BackfillCursorModel).filter_by(subreddit=subreddit, stream=stream).first()
+            if state is None:
+                state = BackfillCursorModel(subreddit=subreddit, stream=stream, items=0, done=0)
+            session.expunge_all()
+            return state
+        finally:
+            session.close()
+
+    def _store_cursor(self, subreddit: str, stream: str, cursor: Optional[str], oldest: Optional[datetime], items: int, done: bool) -> None:
+        session: SQLAlchemySession = self.session_factory()
+        try:
+            state = session.query(BackfillCursorModel).filter_by(subreddit=subreddit, stream=stream).first()
+            if state is None:
+                state = BackfillCursorModel(subreddit=subreddit, stream=stream)
+                session.add(state)
+            state.cursor = cursor
+            if oldest is not None:
+                state.oldest_utc = oldest
+            state.items = items
+            state.done = int(done)
+            state.updated_utc = datetime.now(timezone.utc)
+            session.commit()
+        except SQLAlchemyError as e:
+            session.rollback()
+            logger.error(f"Error saving backfill cursor for {stream}: {e}")
+        finally:
+            session.close()
+
+
+def main() -> None:
+    from .main import database_url_from_env, praw_config_from_env
+    from .models import Base
+    from .schema import ensure_columns
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from dotenv import load_dotenv
+    import os
+
+    parser = argparse.ArgumentParser(description="Backfill historical posts, comments and mod actions.")
+    parser.add_argument('--until', type=datetime.fromisoformat, help="Stop at items older than this date (ISO format).")
+    parser.add_argument('--until-id', help="Stop at this item ID or fullname.")
+    parser.add_argument('--streams', default=",".join(STREAMS), help="Comma separated streams to backfill.")
+    parser.add_argument('--restart', action='store_true', help="Ignore saved cursors and start from the newest item.")
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--priority', type=float, help="Fraction of REDDIT_REQUESTS_PER_MINUTE to use (default BACKFILL_PRIORITY or 0.5).")
+    args = parser.parse_args()
+
+    load_dotenv()
+    priority: float = args.priority if args.priority is not None else float(os.environ.get('BACKFILL_PRIORITY', '0.5'))
+    until: Optional[datetime] = args.until
+    if until is not None and until.tzinfo is None:
+        until = until.replace(tzinfo=timezone.utc)
+    engine = create_engine(database_url_from_env())
+    Base.metadata.create_all(engine)
+    ensure_columns(engine)
+    Session = sessionmaker(bind=engine)
+    fetcher = RedditFetcher(
+        os.environ.get('SUBREDDIT', 'python'),
+        praw_config_from_env(),
+        requests_per_minute=float(os.environ.get('REDDIT_REQUESTS_PER_MINUTE', '100')),
+    )
+    saver = BatchDatabaseSaver(Session, batch_size=args.batch_size, flush_interval=0)
+    backfiller = Backfiller(fetcher, saver, Session, until=until, until_id=args.until_id, priority=priority)
+    logger.info(f"Backfilling at up to {priority * fetcher.rate_limiter.requests_per_minute:.0f} requests per minute.")
+    try:
+        backfiller.run([stream.strip() for stream in args.streams.split(",") if stream.strip()], restart=args.restart)
+    except KeyboardInterrupt:
+        logger.info("Backfill interrupted, it will resume from the last saved cursor.")
+    finally:
+        saver.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,387 @@
+import time
+from typing import Any, Callable, Optional
+from threading import Event, Lock, Thread
+from praw.models.mod_action import ModAction
+from praw.models.reddit.comment import Comment
+from praw.models.reddit.redditor import Redditor
+from praw.models.reddit.submission import Submission
+from sqlalchemy import Table, bindparam, select, update
+from sqlalchemy.orm import Session as SQLAlchemySession
+from sqlalchemy.exc import SQLAlchemyError
+from .events import CommentEvent, ModActionEvent, PostEvent, UserRef, unpack_modaction
+from .models import Base, PostModel, CommentModel, UserModel, ModActionModel, from_item
+from .bulk_loader import COPY_THRESHOLD, copy_rows, copy_supported, insert_ignore
+from .seen_index import SeenIndex
+from .user_stats import Activity, activities_from_rows, record_activity
+from .comment_tree import index_comments
+from .search import drop_documents, index_documents
+from .user_enricher import UserEnricher, author_fullname, mod_fullname
+from .metrics import COMMIT_LAG, DB_COMMIT_SECONDS, ERRORS, SAVE_SECONDS, get_registry
+
+from .log import get_logger
+logger = get_logger()
+
+
+def model_to_row(instance: Base) -> dict[str, Any]:
+    """
+    Turn an unsaved model instance into a plain row dict for Core inserts.
+
+    The autoincrement primary key is left out so the database assigns it.
+    Unset columns with a Python-side default get that default here, so every
+    row of a table has the same keys.
+    """
+    row: dict[str, Any] = {}
+    for column in instance.__table__.columns:
+        if column.primary_key:
+            continue
+        value = getattr(instance, column.key)
+        if value is None and column.default is not None:
+            if column.default.is_callable:
+                value = column.default.arg(None)
+            elif column.default.is_scalar:
+                value = column.default.arg
+            else:
+                continue
+        row[column.name] = value
+    return row
+
+
+class BatchDatabaseSaver:
+    """
+    Write-behind alternative to :class:`DatabaseSaver`.
+
+    Items handed to ``save_post``, ``save_comment`` and ``save_modaction`` are
+    buffered and written in one transaction per batch, once ``batch_size`` items
+    are pending or every ``flush_interval`` seconds, whichever comes first.
+    Rows are bulk inserted in foreign-key order (users, posts, comments, mod
+    actions) and duplicates are dropped by the database. On PostgreSQL, tables
+    with at least ``copy_threshold`` rows in a batch are loaded with COPY
+    instead (see :mod:`.bulk_loader`); ``None`` never uses it. With
+    ``user_stats``, the :mod:`.user_stats` tables are updated in the same
+    transaction, with ``comment_tree`` the :mod:`.comment_tree` index, and
+    with ``search_index`` the :mod:`.search` index. ``on_commit`` is called
+    per stream with the items of every committed batch.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], SQLAlchemySession],
+        batch_size: int = 500,
+        flush_interval: float = 2.0,
+        seen_index: Optional[SeenIndex] = None,
+        enricher: Optional[UserEnricher] = None,
+        copy_threshold: Optional[int] = COPY_THRESHOLD,
+        user_stats: bool = False,
+        comment_tree: bool = False,
+        search_index: bool = False,
+        on_commit: Optional[Callable[[str, list[str]], None]] = None,
+    ) -> None:
+        self.session_factory: Callable[[], SQLAlchemySession] = session_factory
+        self.seen_index: Optional[SeenIndex] = seen_index
+        self.enricher: Optional[UserEnricher] = enricher
+        self.on_commit: Optional[Callable[[str, list[str]], None]] = on_commit
+        self.batch_size: int = batch_size
+        self.flush_interval: float = flush_interval
+        self.copy_threshold: Optional[int] = copy_threshold
+        self.user_stats: bool = user_stats
+        self.comment_tree: bool = comment_tree
+        self.search_index: bool = search_index
+        self._posts: dict[str, Submission | PostEvent] = {}
+        self._comments: dict[str, Comment | CommentEvent] = {}
+        self._modactions: dict[str, dict[str, ModAction | Redditor] | ModActionEvent] = {}
+        self._lock: Lock = Lock()
+        self._flush_lock: Lock = Lock()
+        # Set when a flush started by a full buffer or the timer failed, for the next flush() to report
+        self._lost_batch: bool = False
+        self._stop_event: Event = Event()
+        self._flusher: Optional[Thread] = None
+        if flush_interval > 0:
+            self._flusher = Thread(target=self._flush_periodically, name="BatchDatabaseSaver", daemon=True)
+            self._flusher.start()
+
+    def save_post(self, post: Submission | PostEvent) -> None:
+        with self._lock:
+            self._posts[post.id] = post
+        self._flush_if_full()
+
+    def save_comment(self, comment: Comment | CommentEvent) -> None:
+        with self._lock:
+            self._comments[comment.id] = comment
+        self._flush_if_full()
+
+    # dic = {
+    #       "modaction": modaction,
+    #       "target": redditor_target
+    # }
+    # or a ModActionEvent
+    def save_modaction(self, dic: dict[str, ModAction | Redditor] | ModActionEvent) -> None:
+        with self._lock:
+            self._modactions[unpack_modaction(dic)[0].id] = dic
+        self._flush_if_full()
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._posts) + len(self._comments) + len(self._modactions)
+
+    def flush(self) -> bool:
+        """
+        Write every buffered item in a single transaction.
+
+        On a database error the batch is rolled back, logged and discarded,
+        matching what :class:`DatabaseSaver` does for a single item.
+
+        Returns:
+            bool: ``False`` if the batch could not be written, or a batch
+            flushed automatically since the last call could not.
+        """
+        written = self._write_buffered()
+        with self._lock:
+            lost, self._lost_batch = self._lost_batch, False
+        return written and not lost
+
+    def _auto_flush(self) -> None:
+        if not self._write_buffered():
+            with self._lock:
+                self._lost_batch = True
+
+    def _write_buffered(self) -> bool:
+        with self._flush_lock:
+            with self._lock:
+                posts, self._posts = self._posts, {}
+                comments, self._comments = self._comments, {}
+                modactions, self._modactions = self._modactions, {}
+            if not (posts or comments or modactions):
+                return True
+            session: SQLAlchemySession = self.session_factory()
+            new_users: list[tuple[str, Optional[str]]] = []
+            started = time.perf_counter()
+            try:
+                written = write_batch(
+                    session, posts, comments, modactions, new_users, self.seen_index,
+                    defer_profiles=self.enricher is not None, copy_threshold=self.copy_threshold,
+                    user_stats=self.user_stats, comment_tree=self.comment_tree, search_index=self.search_index,
+                )
+                with DB_COMMIT_SECONDS.time("batch_saver"):
+                    session.commit()
+                SAVE_SECONDS.observe(time.perf_counter() - started, "batch")
+                if get_registry().enabled:
+                    observe_commit_lag(posts, comments, modactions)
+                if self.seen_index is not None:
+                    for table, reddit_ids in written.items():
+                        self.seen_index.add(table, reddit_ids)
+                if self.enricher is not None:
+                    for name, fullname in new_users:
+                        self.enricher.enqueue(name, fullname)
+                if self.on_commit is not None:
+                    report_commit(self.on_commit, posts, comments, modactions)
+                logger.debug(f"Flushed {len(posts)} posts, {len(comments)} comments and {len(modactions)} mod actions.")
+                return True
+            except SQLAlchemyError as e:
+                session.rollback()
+                ERRORS.inc("batch_saver", type(e).__name__)
+                logger.error(f"Error saving batch of {len(posts) + len(comments) + len(modactions)} items: {e}")
+                return False
+            finally:
+                session.close()
+
+    def close(self) -> None:
+        """Stop the periodic flusher and write whatever is still buffered."""
+        self._stop_event.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+
+    def _flush_if_full(self) -> None:
+        if self.pending() >= self.batch_size:
+            self._auto_flush()
+
+    def _flush_periodically(self) -> None:
+        while not self._stop_event.wait(self.flush_interval):
+            self._auto_flush()
+
+
+def report_commit(
+    on_commit: Callable[[str, list[str]], None],
+    posts: dict[str, Any],
+    comments: dict[str, Any],
+    modactions: dict[str, Any],
+) -> None:
+    """Pass the fullnames of committed posts and comments, and the IDs of mod actions, to ``on_commit``."""
+    for stream, items in (("posts", posts), ("comments", comments)):
+        if items:
+            on_commit(stream, [item.fullname for item in items.values()])
+    if modactions:
+        on_commit("modactions", list(modactions))
+
+
+def observe_commit_lag(
+    posts: dict[str, Submission | PostEvent],
+    comments: dict[str, Comment | CommentEvent],
+    modactions: dict[str, dict[str, ModAction | Redditor] | ModActionEvent],
+) -> None:
+    """Record how long after creation each item of a committed batch reached the database."""
+    now = time.time()
+    for post in posts.values():
+        COMMIT_LAG.observe(now - post.created_utc, "posts")
+    for comment in comments.values():
+        COMMIT_LAG.observe(now - comment.created_utc, "comments")
+    for dic in modactions.values():
+        COMMIT_LAG.observe(now - unpack_modaction(dic)[0].created_utc, "modactions")
+
+
+def write_batch(
+    session: SQLAlchemySession,
+    posts: dict[str, Submission | PostEvent],
+    comments: dict[str, Comment | CommentEvent],
+    modactions: dict[str, dict[str, ModAction | Redditor] | ModActionEvent],
+    new_users: list[tuple[str, Optional[str]]],
+    seen_index: Optional[SeenIndex] = None,
+    defer_profiles: bool = False,
+    copy_threshold: Optional[int] = None,
+    user_stats: bool = False,
+    comment_tree: bool = False,
+    search_index: bool = False,
+) -> dict[str, list[str]]:
+    """
+    Insert one batch and return the reddit_ids now stored, per table.
+
+    With ``defer_profiles``, users are inserted without their profile and
+    appended to ``new_users`` so they can be handed to the enricher once the
+    transaction commits. ``seen_index`` saves lookups of rows already stored.
+    Tables with at least ``copy_threshold`` rows are loaded with COPY where the
+    driver supports it. With ``user_stats``, the rows that were actually
+    inserted are added to the user summary, with ``comment_tree`` the
+    comments are added to the thread index, and with ``search_index`` the
+    posts and comments to the full-text index.
+    Nothing is committed here, so a session driven through
+    ``AsyncSession.run_sync`` works as well.
+    """
+    # Gather every referenced post and user once, keyed by reddit_id
+    posts = dict(posts)
+    users: dict[str, Redditor | UserRef] = {}
+    fullnames: dict[str, Optional[str]] = {}
+
+    def add_user(redditor: Redditor | UserRef, fullname: Optional[str]) -> None:
+        users.setdefault(redditor.name, redditor)
+        fullnames[redditor.name] = fullnames.get(redditor.name) or fullname
+
+    for post in posts.values():
+        if post.author:
+            add_user(post.author, author_fullname(post))
+    for comment in comments.values():
+        if comment.author:
+            add_user(comment.author, author_fullname(comment))
+        if comment.submission and comment.submission.id not in posts:
+            posts[comment.submission.id] = comment.submission
+            if comment.submission.author:
+                add_user(comment.submission.author, author_fullname(comment.submission))
+    for dic in modactions.values():
+        modaction, target = unpack_modaction(dic)
+        if modaction.target_author and target is not None:
+            add_user(target, None)
+        if modaction.mod:
+            add_user(modaction.mod, mod_fullname(modaction))
+
+    # One IN query per table instead of one lookup per item; this also keeps
+    # UserModel.from_praw from fetching profiles we already have
+    users = _drop_existing(session, UserModel, users, seen_index)
+    filled = fill_stub_posts(session, posts, user_stats=user_stats, search_index=search_index)
+    posts = _drop_existing(session, PostModel, posts, seen_index)
+
+    if defer_profiles:
+        user_models = [UserModel.from_name(name, fullnames[name]) for name in users]
+        new_users.extend((name, fullnames[name]) for name in users)
+    else:
+        user_models = [from_item(UserModel, user) for user in users.values()]
+
+    batches: list[tuple[Table, list[dict[str, Any]]]] = [
+        (UserModel.__table__, [model_to_row(user) for user in user_models]),
+        (PostModel.__table__, [model_to_row(from_item(PostModel, post)) for post in posts.values()]),
+        (CommentModel.__table__, [model_to_row(from_item(CommentModel, comment)) for comment in comments.values()]),
+        (ModActionModel.__table__, [model_to_row(from_item(ModActionModel, unpack_modaction(dic)[0])) for dic in modactions.values()]),
+    ]
+    comment_rows: list[dict[str, Any]] = batches[2][1]
+    activities: list[Activity] = []
+    returning: bool = user_stats and session.get_bind().dialect.insert_executemany_returning
+    for table, rows in batches:
+        if not rows:
+            continue
+        inserted: Optional[list[str]] = None
+        if copy_threshold is not None and len(rows) >= copy_threshold and copy_supported(session):
+            inserted = copy_rows(session, table, rows)
+        elif returning:
+            inserted = list(session.scalars(insert_ignore(session, table).returning(table.c.reddit_id), rows))
+        else:
+            session.execute(insert_ignore(session, table), rows)
+        if user_stats and table is not UserModel.__table__:
+            # Without RETURNING, duplicates dropped by the database are counted too
+            new = set(inserted) if inserted is not None else None
+            activities.extend(activities_from_rows(table.name, (row for row in rows if new is None or row['reddit_id'] in new)))
+    if activities:
+        record_activity(session, activities)
+    if comment_tree and comment_rows:
+        index_comments(session, ((row['reddit_id'], row['post_id'], row['parent_id']) for row in comment_rows))
+    if search_index:
+        index_documents(session, PostModel.__tablename__, posts)
+        index_documents(session, CommentModel.__tablename__, comments)
+    return {
+        UserModel.__tablename__: list(users),
+        PostModel.__tablename__: list(posts) + filled,
+        CommentModel.__tablename__: list(comments),
+        ModActionModel.__tablename__: list(modactions),
+    }
+
+def fill_stub_posts(
+    session: SQLAlchemySession,
+    posts: dict[str, Submission | PostEvent],
+    user_stats: bool = False,
+    search_index: bool = False,
+) -> list[str]:
+    """
+    Overwrite stored stub posts, saved from a comment before the post itself
+    arrived, with the full posts among ``posts``. With ``user_stats`` and
+    ``search_index`` they are counted and reindexed as if newly inserted.
+    Nothing is committed here.
+
+    Returns:
+        list[str]: The reddit_ids of the posts filled in.
+    """
+    full = {reddit_id: post for reddit_id, post in posts.items() if post.created_utc is not None}
+    if not full:
+        return []
+    table = PostModel.__table__
+    stubs = session.execute(
+        select(table.c.id, table.c.reddit_id, table.c.title, table.c.body).where(table.c.reddit_id.in_(full), table.c.stub == 1)
+    ).mappings().all()
+    if not stubs:
+        return []
+    if search_index:
+        # A contentless index needs the old text to remove it
+        drop_documents(session, PostModel.__tablename__, [dict(stub) for stub in stubs])
+    rows = [model_to_row(from_item(PostModel, full[stub['reddit_id']])) for stub in stubs]
+    columns = [name for name in rows[0] if name != 'reddit_id']
+    session.execute(
+        update(table).where(table.c.reddit_id == bindparam('stub_reddit_id')).values({name: bindparam(name) for name in columns}),
+        [{**{name: row[name] for name in columns}, 'stub_reddit_id': row['reddit_id']} for row in rows],
+    )
+    filled = [row['reddit_id'] for row in rows]
+    if user_stats:
+        record_activity(session, activities_from_rows(PostModel.__tablename__, rows))
+    if search_index:
+        index_documents(session, PostModel.__tablename__, filled)
+    logger.debug(f"Filled in {len(filled)} posts first stored from their comments.")
+    return filled
+
+def _drop_existing(session: SQLAlchemySession, model: type[Base], items: dict[str, Any], seen_index: Optional[SeenIndex]) -> dict[str, Any]:
+    table: str = model.__tablename__
+    stored: set[str] = set()
+    unknown: list[str] = []
+    for reddit_id in items:
+        known = seen_index.known(table, reddit_id) if seen_index is not None else None
+        if known:
+            stored.add(reddit_id)
+        elif known is None:
+            unknown.append(reddit_id)
+    if unknown:
+        stored.update(session.scalars(select(model.reddit_id).where(model.reddit_id.in_(unknown))))
+    return {reddit_id: item for reddit_id, item in items.items() if reddit_id not in stored}
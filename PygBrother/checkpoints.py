@@ -0,0 +1,162 @@
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from threading import Lock
+from typing import Callable, Iterable, NamedTuple, Optional
+from sqlalchemy.orm import Session as SQLAlchemySession
+from sqlalchemy.exc import SQLAlchemyError
+from .models import StreamCheckpointModel
+
+from .log import get_logger
+logger = get_logger()
+
+
+# Items handed out but not yet confirmed as saved, per stream, before the store gives up
+PENDING_LIMIT: int = 100_000
+
+
+class Checkpoint(NamedTuple):
+    fullname: str
+    created_utc: float
+
+
+class _Pending:
+    def __init__(self, subreddit: str, created_utc: float) -> None:
+        self.subreddit: str = subreddit
+        self.created_utc: float = created_utc
+        self.confirmed: bool = False
+
+
+class CheckpointStore:
+    """
+    Last item handed to subscribers, per stream and subreddit, kept in the
+    ``stream_checkpoints`` table.
+
+    :meth:`update` only touches memory; the positions are written at most every
+    ``flush_interval`` seconds and on :meth:`flush`, so checkpointing costs one
+    small transaction every few seconds rather than one per item.
+
+    A saver that buffers or queues items stores them some time after the
+    hand-off, and a crash in between would lose them behind the checkpoint.
+    With ``wait_for_commit`` the fetcher registers items with :meth:`expect`
+    instead, and a position only moves once the saver has passed the item, and
+    every item of the stream handed out before it, to :meth:`confirm`. An item
+    whose save failed holds its stream back, so the next start catches up on
+    it again.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], SQLAlchemySession],
+        flush_interval: float = 5.0,
+        wait_for_commit: bool = False,
+    ) -> None:
+        self.session_factory: Callable[[], SQLAlchemySession] = session_factory
+        self.flush_interval: float = flush_interval
+        self.wait_for_commit: bool = wait_for_commit
+        self._dirty: dict[tuple[str, str], Checkpoint] = {}
+        # Per stream, in hand-off order
+        self._pending: dict[str, OrderedDict[str, _Pending]] = {}
+        self._stalled: set[str] = set()
+        self._last_flush: float = time.monotonic()
+        self._lock: Lock = Lock()
+
+    def load(self, stream: str, subreddits: Iterable[str]) -> dict[str, Checkpoint]:
+        names = [name.lower() for name in subreddits]
+        session: SQLAlchemySession = self.session_factory()
+        try:
+            rows = session.query(StreamCheckpointModel).filter(
+                StreamCheckpointModel.stream == stream,
+                StreamCheckpointModel.subreddit.in_(names),
+            ).all()
+            return {
+                row.subreddit: Checkpoint(row.fullname, row.created_utc.replace(tzinfo=timezone.utc).timestamp())
+                for row in rows
+            }
+        finally:
+            session.close()
+
+    def oldest(self, stream: str, subreddits: Iterable[str]) -> Optional[Checkpoint]:
+        """
+        The oldest checkpoint among ``subreddits``: resuming a combined listing from
+        there covers what every one of them missed.
+        """
+        checkpoints = self.load(stream, subreddits)
+        if not checkpoints:
+            return None
+        return min(checkpoints.values(), key=lambda checkpoint: checkpoint.created_utc)
+
+    def update(self, stream: str, subreddit: str, fullname: str, created_utc: float) -> None:
+        with self._lock:
+            key = (subreddit.lower(), stream)
+            current = self._dirty.get(key)
+            if current is None or created_utc >= current.created_utc:
+                self._dirty[key] = Checkpoint(fullname, created_utc)
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def expect(self, stream: str, subreddit: str, fullname: str, created_utc: float) -> None:
+        """Register an item that is about to be handed out, when waiting for commits."""
+        if not self.wait_for_commit:
+            return
+        with self._lock:
+            if stream in self._stalled:
+                return
+            pending = self._pending.setdefault(stream, OrderedDict())
+            pending[fullname] = _Pending(subreddit.lower(), created_utc)
+            if len(pending) > PENDING_LIMIT:
+                # Something is never confirmed; stay behind it until the next start
+                self._stalled.add(stream)
+                pending.clear()
+                logger.error(f"{PENDING_LIMIT} {stream} were never confirmed as saved, holding the {stream} checkpoint until restart")
+
+    def confirm(self, stream: str, fullnames: Iterable[str]) -> None:
+        """
+        Mark items as saved, for a saver's ``on_commit``. The checkpoint moves
+        over every confirmed item handed out before the first unconfirmed one.
+        """
+        advanced: list[tuple[str, _Pending]] = []
+        with self._lock:
+            pending = self._pending.get(stream)
+            if not pending:
+                return
+            for fullname in fullnames:
+                entry = pending.get(fullname)
+                if entry is not None:
+                    entry.confirmed = True
+            while pending:
+                fullname, entry = next(iter(pending.items()))
+                if not entry.confirmed:
+                    break
+                pending.popitem(last=False)
+                advanced.append((fullname, entry))
+        for fullname, entry in advanced:
+            self.update(stream, entry.subreddit, fullname, entry.created_utc)
+
+    def flush(self) -> None:
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+            self._last_flush = time.monotonic()
+        if not dirty:
+            return
+        session: SQLAlchemySession = self.session_factory()
+        try:
+            for (subreddit, stream), checkpoint in dirty.items():
+                row = session.query(StreamCheckpointModel).filter_by(subreddit=subreddit, stream=stream).first()
+                if row is None:
+                    row = StreamCheckpointModel(subreddit=subreddit, stream=stream)
+                    session.add(row)
+                row.fullname = checkpoint.fullname
+                row.created_utc = datetime.fromtimestamp(checkpoint.created_utc, tz=timezone.utc)
+                row.updated_utc = datetime.now(timezone.utc)
+            session.commit()
+        except SQLAlchemyError as e:
+            session.rollback()
+            logger.error(f"Error saving stream checkpoints: {e}")
+            # Keep them for the next attempt unless newer positions arrived meanwhile
+            with self._lock:
+                for key, checkpoint in dirty.items():
+                    self._dirty.setdefault(key, checkpoint)
+        finally:
+            session.close()
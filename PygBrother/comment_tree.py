@@ -0,0 +1,223 @@
+# Comment thread index for PygBrother
+# comment_tree keeps a materialised path per comment: the reddit_ids from the
+# top-level comment down to it, each followed by '/'. A whole subtree is then
+# one range scan on (post_id, path), in depth-first order, and the ancestors
+# of a comment are the ids in its path. The savers maintain it with each
+# batch. A comment whose parent is not stored yet is filed under the parent's
+# id with pending_parent set, and its subtree is grafted into place once the
+# parent arrives.
+#
+# set -x COMMENT_TREE 1   # in main.py, to keep the table up to date
+# python -m PygBrother.comment_tree rebuild   # from the stored comments
+# python -m PygBrother.comment_tree show some_comment_id
+
+import argparse
+from typing import Iterable, Optional
+from sqlalchemy import and_, create_engine, delete, literal, select, update
+from sqlalchemy.orm import Session as SQLAlchemySession, aliased, sessionmaker
+from sqlalchemy.sql import func
+from .bulk_loader import insert_ignore
+from .models import Base, CommentModel, CommentTreeModel
+
+from .log import get_logger
+logger = get_logger()
+
+SEPARATOR: str = '/'
+# Sorts after every character of a reddit_id and the separator, so
+# [path, path + SUBTREE_END) holds exactly the paths that start with path
+SUBTREE_END: str = '~'
+
+
+def parent_comment(parent_id: Optional[str]) -> Optional[str]:
+    """reddit_id of the parent comment for a ``parent_id`` fullname, ``None`` for a top-level comment."""
+    if parent_id and parent_id.startswith('t1_'):
+        return parent_id[3:]
+    return None
+
+
+def index_comments(session: SQLAlchemySession, comments: Iterable[tuple[str, Optional[str], Optional[str]]]) -> int:
+    """
+    Add comments to the thread index, in any order.
+
+    Comments whose parent is in the same call or already indexed get their
+    full path. The others wait under their parent's id, and are grafted with
+    their whole subtree once the parent is indexed. Comments already indexed
+    are skipped. Nothing is committed here.
+
+    Args:
+        comments: ``(reddit_id, post_id, parent_id)`` with ``parent_id`` a
+            fullname, as stored in :class:`CommentModel`.
+
+    Returns:
+        int: The number of comments added.
+    """
+    nodes: dict[str, tuple[str, Optional[str]]] = {
+        reddit_id: (post_id, parent_comment(parent_id))
+        for reddit_id, post_id, parent_id in comments if post_id
+    }
+    if not nodes:
+        return 0
+    tree = CommentTreeModel.__table__
+    lookup = set(nodes) | {parent for _, parent in nodes.values() if parent}
+    stored: dict[str, tuple[str, int]] = {
+        reddit_id: (path, depth) for reddit_id, path, depth in session.execute(
+            select(tree.c.reddit_id, tree.c.path, tree.c.depth).where(tree.c.reddit_id.in_(lookup))
+        )
+    }
+
+    # Place parents before their children, walking up each chain iteratively
+    placed: dict[str, tuple[str, int, Optional[str]]] = {}
+    for reddit_id in nodes:
+        chain: list[str] = []
+        current: Optional[str] = reddit_id
+        while current is not None and current in nodes and current not in stored and current not in placed and current not in chain:
+            chain.append(current)
+            current = nodes[current][1]
+        for node in reversed(chain):
+            parent = nodes[node][1]
+            if parent is None:
+                placed[node] = (node + SEPARATOR, 0, None)
+            elif parent in placed:
+                path, depth, _ = placed[parent]
+                placed[node] = (path + node + SEPARATOR, depth + 1, None)
+            elif parent in stored:
+                path, depth = stored[parent]
+                placed[node] = (path + node + SEPARATOR, depth + 1, None)
+            else:
+                # The parent's own place is unknown, so this subtree starts at it
+                placed[node] = (parent + SEPARATOR + node + SEPARATOR, 1, parent)
+    if not placed:
+        return 0
+    session.execute(insert_ignore(session, tree), [
+        {'reddit_id': reddit_id, 'post_id': nodes[reddit_id][0], 'path': path, 'depth': depth, 'pending_parent': pending}
+        for reddit_id, (path, depth, pending) in placed.items()
+    ])
+
+    # Subtrees that were waiting for one of the new comments
+    waiting = session.execute(
+        select(tree.c.post_id, tree.c.pending_parent).where(tree.c.pending_parent.in_(list(placed))).distinct()
+    ).all()
+    for post_id, parent in waiting:
+        path, depth, _ = placed[parent]
+        prefix = parent + SEPARATOR
+        session.execute(
+            update(tree)
+            .where(tree.c.post_id == post_id, tree.c.path >= prefix, tree.c.path < prefix + SUBTREE_END, tree.c.reddit_id != parent)
+            .values(
+                path=literal(path) + func.substr(tree.c.path, len(prefix) + 1),
+                depth=tree.c.depth + depth,
+                pending_parent=None,
+            )
+        )
+    if waiting:
+        logger.debug(f"Grafted {len(waiting)} waiting subtrees into the comment tree.")
+    return len(placed)
+
+
+def subtree(session: SQLAlchemySession, comment_id: str, max_depth: Optional[int] = None) -> list[tuple[CommentModel, int]]:
+    """
+    A comment and its replies, in depth-first order, in one indexed query.
+
+    Args:
+        max_depth: Only replies at most this many levels below the comment.
+
+    Returns:
+        list[tuple[CommentModel, int]]: Each comment with its depth below
+        ``comment_id``, which comes first at depth 0. Empty if the comment
+        is not indexed.
+    """
+    root = aliased(CommentTreeModel)
+    node = aliased(CommentTreeModel)
+    query = (
+        select(CommentModel, node.depth - root.depth)
+        .join(node, node.reddit_id == CommentModel.reddit_id)
+        .join(root, and_(
+            root.reddit_id == comment_id,
+            node.post_id == root.post_id,
+            node.path >= root.path,
+            node.path < root.path.concat(SUBTREE_END),
+        ))
+        .order_by(node.path)
+    )
+    if max_depth is not None:
+        query = query.where(node.depth <= root.depth + max_depth)
+    return [(comment, depth) for comment, depth in session.execute(query)]
+
+
+def ancestors(session: SQLAlchemySession, comment_id: str) -> list[CommentModel]:
+    """
+    The stored comments above ``comment_id``, from the top-level comment down
+    to its parent, looked up by the ids in its path.
+    """
+    path: Optional[str] = session.scalar(select(CommentTreeModel.path).where(CommentTreeModel.reddit_id == comment_id))
+    if path is None:
+        return []
+    ids = path.split(SEPARATOR)[:-2]
+    if not ids:
+        return []
+    return list(session.scalars(
+        select(CommentModel)
+        .join(CommentTreeModel, CommentTreeModel.reddit_id == CommentModel.reddit_id)
+        .where(CommentTreeModel.reddit_id.in_(ids))
+        .order_by(CommentTreeModel.depth)
+    ))
+
+
+def thread(session: SQLAlchemySession, post_id: str) -> list[tuple[CommentModel, int]]:
+    """Every indexed comment of a post in depth-first order, with its depth."""
+    return [(comment, depth) for comment, depth in session.execute(
+        select(CommentModel, CommentTreeModel.depth)
+        .join(CommentTreeModel, CommentTreeModel.reddit_id == CommentModel.reddit_id)
+        .where(CommentTreeModel.post_id == post_id)
+        .order_by(CommentTreeModel.path)
+    )]
+
+
+def rebuild_comment_tree(session: SQLAlchemySession, batch_size: int = 5000) -> int:
+    """Recompute ``comment_tree`` from the stored comments. Nothing is committed here."""
+    session.execute(delete(CommentTreeModel))
+    added: int = 0
+    last_id: int = 0
+    while True:
+        rows = session.execute(
+            select(CommentModel.id, CommentModel.reddit_id, CommentModel.post_id, CommentModel.parent_id)
+            .where(CommentModel.id > last_id)
+            .order_by(CommentModel.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        added += index_comments(session, [(row.reddit_id, row.post_id, row.parent_id) for row in rows])
+    logger.info(f"Indexed {added} comments into comment_tree.")
+    return added
+
+
+def main() -> None:
+    from dotenv import load_dotenv
+    from .main import database_url_from_env
+    parser = argparse.ArgumentParser(description="Maintain the comment_tree thread index.")
+    parser.add_argument('command', choices=('rebuild', 'show'))
+    parser.add_argument('comment', nargs='?', help="Comment reddit_id, for show.")
+    parser.add_argument('--url', help="Database URL; defaults to DATABASE_URL.")
+    args = parser.parse_args()
+    load_dotenv()
+    engine = create_engine(args.url or database_url_from_env())
+    Base.metadata.create_all(engine, tables=[CommentTreeModel.__table__])
+    Session = sessionmaker(bind=engine)
+    with Session() as session:
+        if args.command == 'rebuild':
+            rebuild_comment_tree(session)
+            session.commit()
+        else:
+            if not args.comment:
+                parser.error("show needs a comment id")
+            for comment in ancestors(session, args.comment):
+                print(f"^ {comment.reddit_id} u/{comment.author_id}")
+            for comment, depth in subtree(session, args.comment):
+                print(f"{'  ' * depth}{comment.reddit_id} u/{comment.author_id}: {(comment.body or '')[:60]!r}")
+    engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
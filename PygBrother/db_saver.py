@@ -1,101 +1,226 @@
-from typing import Callable
+import time
+from typing import Callable, Optional
 from praw.models.mod_action import ModAction
 from praw.models.reddit.comment import Comment
 from praw.models.reddit.redditor import Redditor
 from praw.models.reddit.submission import Submission
 from sqlalchemy.orm import Session as SQLAlchemySession
-from .models import PostModel, CommentModel, UserModel, ModActionModel
-from sqlalchemy.exc import SQLAlchemyError
+from .events import CommentEvent, ModActionEvent, PostEvent, UserRef, unpack_modaction
+from .models import Base, PostModel, CommentModel, UserModel, ModActionModel, from_item
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from .seen_index import SeenIndex
+from .user_stats import activities_from_models, record_activity
+from .comment_tree import index_comments
+from .search import index_documents
+from .batch_saver import fill_stub_posts
+from .user_enricher import UserEnricher, author_fullname, mod_fullname
+from .metrics import COMMIT_LAG, DB_COMMIT_SECONDS, ERRORS, SAVE_SECONDS, timed
 
 from .log import get_logger
 logger = get_logger()
 
 class DatabaseSaver:
-    def __init__(self, session_factory: Callable[[], SQLAlchemySession]) -> None:
+    def __init__(
+        self,
+        session_factory: Callable[[], SQLAlchemySession],
+        seen_index: Optional[SeenIndex] = None,
+        enricher: Optional[UserEnricher] = None,
+        user_stats: bool = False,
+        comment_tree: bool = False,
+        search_index: bool = False,
+        on_commit: Optional[Callable[[str, list[str]], None]] = None,
+    ) -> None:
         self.session_factory: Callable[[], SQLAlchemySession] = session_factory
+        self.seen_index: Optional[SeenIndex] = seen_index
+        self.enricher: Optional[UserEnricher] = enricher
+        # Keep the user_stats tables up to date with every save
+        self.user_stats: bool = user_stats
+        # And the comment_tree index with every saved comment
+        self.comment_tree: bool = comment_tree
+        # And the full-text search index with every saved post and comment
+        self.search_index: bool = search_index
+        # Told the stream and fullname (ModAction id for the mod log) of every
+        # item once it is stored, e.g. CheckpointStore.confirm
+        self.on_commit: Optional[Callable[[str, list[str]], None]] = on_commit
 
-
-    def save_post(self, post: Submission) -> None:
+    def _open_session(self) -> SQLAlchemySession:
         session: SQLAlchemySession = self.session_factory()
+        if self.seen_index is not None:
+            self.seen_index.track(session)
+        return session
+
+    def _exists(self, session: SQLAlchemySession, model: type[Base], reddit_id: str) -> bool:
+        # Ask the seen-ID index first, the database only when it cannot tell
+        if self.seen_index is not None:
+            known = self.seen_index.known(model.__tablename__, reddit_id)
+            if known is not None:
+                return known
+        found: bool = session.query(model.id).filter_by(reddit_id=reddit_id).first() is not None
+        if found and self.seen_index is not None:
+            self.seen_index.add(model.__tablename__, (reddit_id,))
+        return found
+
+    def _new_user(self, redditor: Redditor | UserRef, fullname: Optional[str], new_users: list[tuple[str, Optional[str]]]) -> Optional[UserModel]:
+        # With an enricher the profile is fetched later, off the save path
+        if self.enricher is None:
+            return from_item(UserModel, redditor)
+        new_users.append((redditor.name, fullname))
+        return UserModel.from_name(redditor.name, fullname)
+
+    def _commit(self, session: SQLAlchemySession, stream: str, created_utc: float) -> None:
+        # Only new items are ever added to the session, so nothing is counted twice.
+        # Taken up front since the first query below flushes them
+        new: list[Base] = list(session.new)
+        if self.user_stats:
+            record_activity(session, activities_from_models(new))
+        if self.comment_tree:
+            index_comments(session, [
+                (instance.reddit_id, instance.post_id, instance.parent_id)
+                for instance in new if isinstance(instance, CommentModel)
+            ])
+        if self.search_index:
+            for model in (PostModel, CommentModel):
+                index_documents(session, model.__tablename__, [instance.reddit_id for instance in new if isinstance(instance, model)])
+        with DB_COMMIT_SECONDS.time("db_saver"):
+            session.commit()
+        COMMIT_LAG.observe(time.time() - created_utc, stream)
+
+    def _stored(self, stream: str, cursor: str) -> None:
+        if self.on_commit is not None:
+            self.on_commit(stream, [cursor])
+
+    def _enqueue_enrichment(self, new_users: list[tuple[str, Optional[str]]]) -> None:
+        if self.enricher is not None:
+            for name, fullname in new_users:
+                self.enricher.enqueue(name, fullname)
+
+    @timed(SAVE_SECONDS, "posts")
+    def save_post(self, post: Submission | PostEvent, retry: bool = True) -> None:
+        session: SQLAlchemySession = self._open_session()
         trans_session: SQLAlchemySession = self.session_factory()
+        new_users: list[tuple[str, Optional[str]]] = []
         try:
-            ex_post = trans_session.query(PostModel).filter_by(reddit_id=post.id).first()
-            if ex_post:
-                logger.debug(f"Post {ex_post.reddit_id} already exists in the database.")
+            if self._exists(trans_session, PostModel, post.id):
+                if fill_stub_posts(session, {post.id: post}, user_stats=self.user_stats, search_index=self.search_index):
+                    self._commit(session, "posts", post.created_utc)
+                else:
+                    logger.debug(f"Post {post.id} already exists in the database.")
+                self._stored("posts", post.fullname)
                 return
             # Save user if not present
             if post.author:
-                user = trans_session.query(UserModel).filter_by(reddit_id=post.author.name).first()
-                if not user:
-                    session.add(UserModel.from_praw(post.author))
-            session.add(PostModel.from_praw(post))
-            session.commit()
+                if not self._exists(trans_session, UserModel, post.author.name):
+                    session.add(self._new_user(post.author, author_fullname(post), new_users))
+            session.add(from_item(PostModel, post))
+            self._commit(session, "posts", post.created_utc)
+            self._stored("posts", post.fullname)
+            self._enqueue_enrichment(new_users)
+        except IntegrityError as e:
+            session.rollback()
+            ERRORS.inc("db_saver", type(e).__name__)
+            # A concurrent writer inserted one of the rows first; the retry will see it
+            if not retry:
+                logger.error(f"Error saving post: {e}")
         except SQLAlchemyError as e:
             session.rollback()
+            ERRORS.inc("db_saver", type(e).__name__)
             logger.error(f"Error saving post: {e}")
+            retry = False
+        else:
+            retry = False
         finally:
             trans_session.close()
             session.close()
+        if retry:
+            self.save_post(post, retry=False)
 
-    def save_comment(self, comment: Comment) -> None:
-        session: SQLAlchemySession = self.session_factory()
+    @timed(SAVE_SECONDS, "comments")
+    def save_comment(self, comment: Comment | CommentEvent, retry: bool = True) -> None:
+        session: SQLAlchemySession = self._open_session()
         trans_session: SQLAlchemySession = self.session_factory()
+        new_users: list[tuple[str, Optional[str]]] = []
         try:
-            ex_comment = trans_session.query(CommentModel).filter_by(reddit_id=comment.id).first()
-            if ex_comment:
-                logger.debug(f"Comment {ex_comment.reddit_id} already exists in the database.")
+            if self._exists(trans_session, CommentModel, comment.id):
+                logger.debug(f"Comment {comment.id} already exists in the database.")
+                self._stored("comments", comment.fullname)
                 return
             # Save user if not present (lookup by reddit_id)
             if comment.author:
-                user = trans_session.query(UserModel).filter_by(reddit_id=comment.author.name).first()
-                if not user:
-                    session.add(UserModel.from_praw(comment.author))
+                if not self._exists(trans_session, UserModel, comment.author.name):
+                    session.add(self._new_user(comment.author, author_fullname(comment), new_users))
             # Save post if not present (lookup by reddit_id)
             if comment.submission:
-                post = trans_session.query(PostModel).filter_by(reddit_id=comment.submission.id).first()
+                post_exists = self._exists(trans_session, PostModel, comment.submission.id)
                 poster = comment.submission.author
-                if not post:
+                if not post_exists:
                     if poster is not None:
-                        user = trans_session.query(UserModel).filter_by(reddit_id=poster.name).first()
-                        if not user and (poster.name != comment.author.name):
-                            session.add(UserModel.from_praw(poster))
-                    session.add(PostModel.from_praw(comment.submission))
-            session.add(CommentModel.from_praw(comment))
-            session.commit()
+                        if not self._exists(trans_session, UserModel, poster.name) and (comment.author is None or poster.name != comment.author.name):
+                            session.add(self._new_user(poster, author_fullname(comment.submission), new_users))
+                    session.add(from_item(PostModel, comment.submission))
+            session.add(from_item(CommentModel, comment))
+            self._commit(session, "comments", comment.created_utc)
+            self._stored("comments", comment.fullname)
+            self._enqueue_enrichment(new_users)
+        except IntegrityError as e:
+            session.rollback()
+            ERRORS.inc("db_saver", type(e).__name__)
+            # A concurrent writer inserted one of the rows first; the retry will see it
+            if not retry:
+                logger.error(f"Error saving comment: {e}")
         except SQLAlchemyError as e:
             session.rollback()
+            ERRORS.inc("db_saver", type(e).__name__)
             logger.error(f"Error saving comment: {e}")
+            retry = False
+        else:
+            retry = False
         finally:
             trans_session.close()
             session.close()
+        if retry:
+            self.save_comment(comment, retry=False)
 
     # dic = {
     #       "modaction": modaction,
     #       "target": redditor_target
     # }
-    def save_modaction(self, dic: dict[str, ModAction|Redditor]) -> None:
-        session: SQLAlchemySession = self.session_factory()
+    # or a ModActionEvent
+    @timed(SAVE_SECONDS, "modactions")
+    def save_modaction(self, dic: dict[str, ModAction|Redditor] | ModActionEvent, retry: bool = True) -> None:
+        session: SQLAlchemySession = self._open_session()
         trans_session: SQLAlchemySession = self.session_factory()
-        modaction = dic['modaction']
-        target = dic['target']
+        modaction, target = unpack_modaction(dic)
+        new_users: list[tuple[str, Optional[str]]] = []
         try:
-            ex_modaction = trans_session.query(ModActionModel).filter_by(reddit_id=modaction.id).first()
-            if ex_modaction:
-                logger.debug(f"ModAction {ex_modaction.reddit_id} already exists in the database.")
+            if self._exists(trans_session, ModActionModel, modaction.id):
+                logger.debug(f"ModAction {modaction.id} already exists in the database.")
+                self._stored("modactions", modaction.id)
                 return
             if modaction.target_author:
-                user = trans_session.query(UserModel).filter_by(reddit_id=target.name).first()
-                if not user: #and target.name != "[deleted]":
-                    session.add(UserModel.from_praw(target))
+                if not self._exists(trans_session, UserModel, target.name): #and target.name != "[deleted]":
+                    session.add(self._new_user(target, None, new_users))
             if modaction.mod:
-                user = trans_session.query(UserModel).filter_by(reddit_id=modaction.mod.name).first()
-                if not user:
-                    session.add(UserModel.from_praw(modaction.mod))
-            session.add(ModActionModel.from_praw(modaction))
-            session.commit()
+                if not self._exists(trans_session, UserModel, modaction.mod.name):
+                    session.add(self._new_user(modaction.mod, mod_fullname(modaction), new_users))
+            session.add(from_item(ModActionModel, modaction))
+            self._commit(session, "modactions", modaction.created_utc)
+            self._stored("modactions", modaction.id)
+            self._enqueue_enrichment(new_users)
+        except IntegrityError as e:
+            session.rollback()
+            ERRORS.inc("db_saver", type(e).__name__)
+            # A concurrent writer inserted one of the rows first; the retry will see it
+            if not retry:
+                logger.error(f"Error saving mod action: {e}")
         except SQLAlchemyError as e:
             session.rollback()
+            ERRORS.inc("db_saver", type(e).__name__)
             logger.error(f"Error saving mod action: {e}")
+            retry = False
+        else:
+            retry = False
         finally:
             trans_session.close()
             session.close()
+        if retry:
+            self.save_modaction(dic, retry=False)
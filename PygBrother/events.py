@@ -0,0 +1,153 @@
+from dataclasses import dataclass
+from typing import Any, Optional
+from praw.models.mod_action import ModAction
+from praw.models.reddit.comment import Comment
+from praw.models.reddit.redditor import Redditor
+from praw.models.reddit.submission import Submission
+
+
+def _loaded(item: Any, name: str, default: Any = None) -> Any:
+    # Read what the listing already put on a praw object, never triggering a fetch
+    return vars(item).get(name, default)
+
+
+@dataclass(frozen=True, slots=True)
+class UserRef:
+    """An author or moderator as far as a listing tells: the name and, if given, the ``t2_`` fullname."""
+    name: str
+    fullname: Optional[str] = None
+
+
+def _user_ref(redditor: Optional[Redditor], fullname: Any) -> Optional[UserRef]:
+    if redditor is None:
+        return None
+    return UserRef(redditor.name, fullname if isinstance(fullname, str) else None)
+
+
+@dataclass(frozen=True, slots=True)
+class PostEvent:
+    """
+    A submission with the fields :class:`PostModel` needs.
+
+    Posts known only from one of their comments carry what the comment listing
+    tells about them; their ``created_utc`` and ``selftext`` are then ``None``.
+    They are stored as stubs and filled in when the post itself is saved.
+    """
+    id: str
+    fullname: str
+    title: Optional[str]
+    selftext: Optional[str]
+    created_utc: Optional[float]
+    url: Optional[str]
+    score: int
+    num_comments: int
+    subreddit: str
+    author: Optional[UserRef]
+
+    @classmethod
+    def from_praw(cls, submission: Submission) -> 'PostEvent':
+        return cls(
+            id=submission.id,
+            fullname=f"t3_{submission.id}",
+            title=submission.title,
+            selftext=submission.selftext,
+            created_utc=submission.created_utc,
+            url=submission.url,
+            score=submission.score,
+            num_comments=submission.num_comments,
+            subreddit=str(submission.subreddit),
+            author=_user_ref(submission.author, _loaded(submission, 'author_fullname')),
+        )
+
+    @classmethod
+    def from_comment(cls, comment: Comment) -> 'PostEvent':
+        """The submission a comment belongs to, from the ``link_*`` fields of the comment listing."""
+        link_id: str = _loaded(comment, 'link_id')
+        link_author = _loaded(comment, 'link_author')
+        return cls(
+            id=link_id.removeprefix('t3_'),
+            fullname=link_id,
+            title=_loaded(comment, 'link_title'),
+            selftext=None,
+            created_utc=None,
+            url=_loaded(comment, 'link_url'),
+            score=0,
+            num_comments=_loaded(comment, 'num_comments', 0),
+            subreddit=str(comment.subreddit),
+            author=UserRef(link_author) if link_author and link_author != '[deleted]' else None,
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class CommentEvent:
+    """A comment with the fields :class:`CommentModel` needs, and its submission."""
+    id: str
+    fullname: str
+    body: str
+    created_utc: float
+    score: int
+    parent_id: str
+    link_id: str
+    subreddit: str
+    author: Optional[UserRef]
+    submission: PostEvent
+
+    @classmethod
+    def from_praw(cls, comment: Comment) -> 'CommentEvent':
+        return cls(
+            id=comment.id,
+            fullname=f"t1_{comment.id}",
+            body=comment.body,
+            created_utc=comment.created_utc,
+            score=comment.score,
+            parent_id=comment.parent_id,
+            link_id=comment.link_id,
+            subreddit=str(comment.subreddit),
+            author=_user_ref(comment.author, _loaded(comment, 'author_fullname')),
+            submission=PostEvent.from_comment(comment),
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class ModActionEvent:
+    """A mod log entry with the fields :class:`ModActionModel` needs."""
+    id: str
+    action: str
+    mod: Optional[UserRef]
+    target_author: Optional[str]
+    target_fullname: Optional[str]
+    description: Optional[str]
+    details: Optional[str]
+    created_utc: float
+    subreddit: str
+
+    @property
+    def target(self) -> Optional[UserRef]:
+        return UserRef(self.target_author) if self.target_author else None
+
+    @classmethod
+    def from_praw(cls, modaction: ModAction) -> 'ModActionEvent':
+        mod_id36 = _loaded(modaction, 'mod_id36')
+        # praw keeps the moderator's name in _mod and builds a Redditor on every access
+        mod = _loaded(modaction, '_mod')
+        return cls(
+            id=modaction.id,
+            action=modaction.action,
+            mod=UserRef(str(mod), f"t2_{mod_id36}" if isinstance(mod_id36, str) else None) if mod else None,
+            target_author=_loaded(modaction, 'target_author') or None,
+            target_fullname=_loaded(modaction, 'target_fullname'),
+            description=_loaded(modaction, 'description'),
+            details=_loaded(modaction, 'details'),
+            created_utc=modaction.created_utc,
+            subreddit=str(modaction.subreddit),
+        )
+
+
+EVENT_TYPES: tuple[type, ...] = (UserRef, PostEvent, CommentEvent, ModActionEvent)
+
+
+def unpack_modaction(item: ModActionEvent | dict[str, Any]) -> tuple[Any, Any]:
+    """The mod action and its target, from either a :class:`ModActionEvent` or a ``{"modaction", "target"}`` dict."""
+    if isinstance(item, ModActionEvent):
+        return item, item.target
+    return item['modaction'], item['target']
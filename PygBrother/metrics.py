@@ -0,0 +1,263 @@
+# Metrics for PygBrother, exposed in the Prometheus text format
+# Disabled by default: until enable() or start_http_server() is called every
+# instrument returns right away, so the instrumented hot paths cost one flag check.
+#
+# set -x METRICS_PORT 9464
+# curl localhost:9464/metrics
+
+import functools
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Any, Callable, ContextManager, Optional, ParamSpec, TypeVar
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .log import get_logger
+logger = get_logger()
+
+P = ParamSpec('P')
+R = TypeVar('R')
+
+LATENCY_BUCKETS: tuple[float, ...] = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LAG_BUCKETS: tuple[float, ...] = (1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+
+
+class Registry:
+    def __init__(self) -> None:
+        self.enabled: bool = False
+        self.metrics: list['_Metric'] = []
+
+    def render(self) -> str:
+        return "".join(metric.render() for metric in self.metrics)
+
+
+_registry: Registry = Registry()
+
+def get_registry() -> Registry:
+    return _registry
+
+def enable() -> None:
+    _registry.enabled = True
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric(ABC):
+    kind: str = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name: str = name
+        self.help: str = help
+        self.labelnames: tuple[str, ...] = labelnames
+        self._lock: Lock = Lock()
+        _registry.metrics.append(self)
+
+    def render(self) -> str:
+        return f"# HELP {self.name} {self.help}\n# TYPE {self.name} {self.kind}\n" + "".join(self._samples())
+
+    @abstractmethod
+    def _samples(self) -> list[str]:
+        ...
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> None:
+        super().__init__(name, help, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        if not _registry.enabled:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {value:g}\n" for labels, value in values]
+
+
+class Gauge(_Metric):
+    """
+    Gauge set directly with :meth:`set`, or read at scrape time from a function
+    registered with :meth:`set_function`. A function returning ``None`` is skipped.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> None:
+        super().__init__(name, help, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+        self._functions: dict[tuple[str, ...], Callable[[], Optional[float]]] = {}
+
+    def set(self, value: float, *labels: str) -> None:
+        if not _registry.enabled:
+            return
+        with self._lock:
+            self._values[labels] = value
+
+    def set_function(self, function: Callable[[], Optional[float]], *labels: str) -> None:
+        with self._lock:
+            self._functions[labels] = function
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            values = dict(self._values)
+            functions = list(self._functions.items())
+        for labels, function in functions:
+            try:
+                value = function()
+            except Exception as e:
+                logger.debug(f"Could not read gauge {self.name}: {e}")
+                continue
+            if value is not None:
+                values[labels] = float(value)
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {value:g}\n" for labels, value in values.items()]
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'started')
+
+    def __init__(self, histogram: 'Histogram', labels: tuple[str, ...]) -> None:
+        self.histogram: Histogram = histogram
+        self.labels: tuple[str, ...] = labels
+        self.started: float = 0.0
+
+    def __enter__(self) -> None:
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+
+_NULL_TIMER: ContextManager[None] = nullcontext()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, help, labelnames)
+        self.buckets: tuple[float, ...] = buckets
+        # Per label set: one count per bucket plus +Inf, then the sum
+        self._counts: dict[tuple[str, ...], list[int]] = {}
+        self._sums: dict[tuple[str, ...], float] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        if not _registry.enabled:
+            return
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(labels)
+            if counts is None:
+                counts = self._counts[labels] = [0] * (len(self.buckets) + 1)
+                self._sums[labels] = 0.0
+            counts[index] += 1
+            self._sums[labels] += value
+
+    def time(self, *labels: str) -> ContextManager[None]:
+        """Context manager observing the time spent in its block."""
+        if not _registry.enabled:
+            return _NULL_TIMER
+        return _Timer(self, labels)
+
+    def count(self, *labels: str) -> int:
+        return sum(self._counts.get(labels, ()))
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            snapshot = [(labels, list(counts), self._sums[labels]) for labels, counts in self._counts.items()]
+        lines: list[str] = []
+        for labels, counts, total in snapshot:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float('inf') else f"{bound:g}"
+                bucket_labels = _format_labels(self.labelnames, labels, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}\n")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total:g}\n")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}\n")
+        return lines
+
+
+def timed(histogram: Histogram, *labels: str) -> Callable[[Callable[P, R]], Callable[P, R]]:
+    """Decorator observing each call's duration in ``histogram``."""
+    def decorator(function: Callable[P, R]) -> Callable[P, R]:
+        @functools.wraps(function)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            if not _registry.enabled:
+                return function(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started, *labels)
+        return wrapper
+    return decorator
+
+
+ITEMS = Counter("pygbrother_items_total", "Items handed to subscribers.", ("stream",))
+API_REQUESTS = Counter("pygbrother_api_requests_total", "Reddit API requests, by consumer.", ("consumer",))
+API_REMAINING = Gauge("pygbrother_api_remaining", "Requests left in Reddit's current rate limit window.")
+API_USED = Gauge("pygbrother_api_used", "Requests used in Reddit's current rate limit window.")
+HANDOFF_LAG = Histogram("pygbrother_handoff_lag_seconds", "Time from created_utc to hand-off to subscribers.", ("stream",), LAG_BUCKETS)
+COMMIT_LAG = Histogram("pygbrother_commit_lag_seconds", "Time from created_utc to database commit.", ("stream",), LAG_BUCKETS)
+DISPATCH_SECONDS = Histogram("pygbrother_dispatch_seconds", "Time spent in subscribers per item.", ("publisher",))
+QUEUE_DEPTH = Gauge("pygbrother_queue_depth", "Items waiting in a publisher's queues.", ("publisher",))
+DROPPED = Counter("pygbrother_dropped_total", "Items discarded by a full publisher queue.", ("publisher",))
+SAVE_SECONDS = Histogram("pygbrother_save_seconds", "Time to save one item, or flush one batch.", ("stream",))
+DB_QUERY_SECONDS = Histogram("pygbrother_db_query_seconds", "Time per SQL statement.")
+DB_COMMIT_SECONDS = Histogram("pygbrother_db_commit_seconds", "Time per commit.", ("saver",))
+ERRORS = Counter("pygbrother_errors_total", "Errors, by component and exception type.", ("component", "type"))
+RULE_MATCHES = Counter("pygbrother_rule_matches_total", "Moderation rule matches, by rule and action.", ("rule", "action"))
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Time every statement ``engine`` executes into ``pygbrother_db_query_seconds``."""
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool) -> None:
+        if _registry.enabled:
+            conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool) -> None:
+        started = conn.info.get('query_started')
+        if started:
+            DB_QUERY_SECONDS.observe(time.perf_counter() - started.pop())
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        body = _registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+
+def start_http_server(port: int, addr: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Enable metrics and serve them on ``http://addr:port/metrics`` from a daemon thread."""
+    enable()
+    server = ThreadingHTTPServer((addr, port), _MetricsHandler)
+    Thread(target=server.serve_forever, name="MetricsServer", daemon=True).start()
+    logger.info(f"Serving metrics on http://{addr}:{server.server_port}/metrics")
+    return server
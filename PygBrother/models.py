@@ -1,13 +1,14 @@
 from __future__ import annotations
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Text, Date, DateTime, ForeignKey, Index, UniqueConstraint
 from sqlalchemy.orm import declarative_base, relationship
 from datetime import datetime, timezone
-from typing import Optional, Type, TypeVar, ClassVar
+from typing import Any, Optional, Type, TypeVar, ClassVar
 from praw.models.mod_action import ModAction
 from praw.models.reddit.comment import Comment
 from praw.models.reddit.redditor import Redditor
 from praw.models.reddit.submission import Submission
 import prawcore
+from .events import EVENT_TYPES, CommentEvent, ModActionEvent, PostEvent, UserRef
 from .log import get_logger
 
 logger = get_logger()
@@ -26,10 +27,30 @@ class UserModel(Base):
     comment_karma = Column(Integer, default=0)
     is_mod = Column(Integer, default=0)
     icon_img = Column(String)
+    fullname = Column(String, index=True)
+    enriched_utc = Column(DateTime, index=True)
     modactions = relationship('ModActionModel', back_populates='target_author')
     posts = relationship('PostModel', back_populates='author')
     comments = relationship('CommentModel', back_populates='author')
 
+    @classmethod
+    def from_name(cls: Type[T], name: str, fullname: Optional[str] = None) -> T:
+        """Build a user from its name alone, without touching the Reddit API."""
+        return cls(
+            reddit_id=name,
+            name=name,
+            fullname=fullname,
+            link_karma=0,
+            comment_karma=0,
+            is_mod=0,
+            icon_img=None
+        )
+
+    @classmethod
+    def from_event(cls: Type[T], user: UserRef) -> T:
+        """Build a user from a :class:`UserRef`; its profile is left to the enricher."""
+        return cls.from_name(user.name, user.fullname)
+
     @classmethod
     def from_praw(cls: Type[T], praw_user: Redditor) -> Optional[T]:
         if praw_user.name == '[deleted]':
@@ -56,20 +77,29 @@ class UserModel(Base):
             _comment_karma=-1
         _is_mod=int(getattr(praw_user, 'is_mod', False))
         _icon_img=getattr(praw_user, 'icon_img', None)
+        # Only read the id if the profile fetch above already loaded it
+        _id=vars(praw_user).get('id')
 
         return cls(
             reddit_id=_reddit_id,
             name=_name,
+            fullname=f"t2_{_id}" if isinstance(_id, str) else None,
             link_karma=_link_karma,
             comment_karma=_comment_karma,
             is_mod=_is_mod,
-            icon_img=_icon_img
+            icon_img=_icon_img,
+            enriched_utc=datetime.now(timezone.utc)
         )
 
 P = TypeVar('P', bound='PostModel')
 
 class PostModel(Base):
     __tablename__: ClassVar[str] = 'posts'
+    __table_args__ = (
+        Index('ix_posts_subreddit_created', 'subreddit', 'created_utc'),
+        Index('ix_posts_author_created', 'author_id', 'created_utc'),
+        Index('ix_posts_created', 'created_utc'),
+    )
     id = Column(Integer, primary_key=True)
     reddit_id = Column(String, unique=True, nullable=False)
     title = Column(String)
@@ -82,6 +112,9 @@ class PostModel(Base):
     num_comments = Column(Integer, default=0)
     comments = relationship('CommentModel', back_populates='post')
     subreddit = Column(String)
+    # 1 while the post is only known from a comment's link_* fields, with no
+    # body or creation time; filled in when the post itself is saved
+    stub = Column(Integer, default=0)
     @classmethod
     def from_praw(cls: Type[P], praw_submission: Submission) -> P:
         return cls(
@@ -96,11 +129,33 @@ class PostModel(Base):
             author_id=praw_submission.author.name if praw_submission.author else None,
         )
 
+    @classmethod
+    def from_event(cls: Type[P], event: PostEvent) -> P:
+        return cls(
+            reddit_id=event.id,
+            title=event.title,
+            body=event.selftext,
+            created_utc=datetime.fromtimestamp(event.created_utc, tz=timezone.utc) if event.created_utc is not None else None,
+            url=event.url,
+            score=event.score,
+            num_comments=event.num_comments,
+            subreddit=event.subreddit,
+            author_id=event.author.name if event.author else None,
+            stub=int(event.created_utc is None),
+        )
+
 
 C = TypeVar('C', bound='CommentModel')
 
 class CommentModel(Base):
     __tablename__: ClassVar[str] = 'comments'
+    __table_args__ = (
+        Index('ix_comments_subreddit_created', 'subreddit', 'created_utc'),
+        Index('ix_comments_author_created', 'author_id', 'created_utc'),
+        Index('ix_comments_post', 'post_id'),
+        Index('ix_comments_parent', 'parent_id'),
+        Index('ix_comments_created', 'created_utc'),
+    )
     id = Column(Integer, primary_key=True)
     reddit_id = Column(String, unique=True, nullable=False)
     body = Column(Text)
@@ -126,10 +181,29 @@ class CommentModel(Base):
             post_id = getattr(getattr(praw_comment, "submission", None), "id", None),
         )
 
+    @classmethod
+    def from_event(cls: Type[C], event: CommentEvent) -> C:
+        return cls(
+            reddit_id=event.id,
+            body=event.body,
+            created_utc=datetime.fromtimestamp(event.created_utc, tz=timezone.utc),
+            score=event.score,
+            parent_id=event.parent_id,
+            subreddit=event.subreddit,
+            author_id=event.author.name if event.author else None,
+            post_id=event.submission.id,
+        )
+
 M = TypeVar('M', bound='ModActionModel')
 
 class ModActionModel(Base):
     __tablename__: ClassVar[str] = 'modactions'
+    __table_args__ = (
+        Index('ix_modactions_subreddit_created', 'subreddit', 'created_utc'),
+        Index('ix_modactions_target_created', 'target_author_id', 'created_utc'),
+        Index('ix_modactions_action_created', 'action', 'created_utc'),
+        Index('ix_modactions_created', 'created_utc'),
+    )
     id = Column(Integer, primary_key=True)
     reddit_id = Column(String, unique=True, nullable=False)
     action = Column(String)
@@ -157,3 +231,110 @@ class ModActionModel(Base):
             created_utc = datetime.fromtimestamp(praw_modaction.created_utc, tz=timezone.utc),
             subreddit = str(praw_modaction.subreddit)
         )
+
+    @classmethod
+    def from_event(cls: Type[M], event: ModActionEvent) -> M:
+        return cls(
+            reddit_id=event.id,
+            action=event.action,
+            mod=event.mod.name if event.mod else None,
+            mod_id=event.mod.fullname.removeprefix('t2_') if event.mod and event.mod.fullname else None,
+            target_author_id=event.target_author,
+            target_fullname=event.target_fullname,
+            description=event.description,
+            details=event.details,
+            created_utc=datetime.fromtimestamp(event.created_utc, tz=timezone.utc),
+            subreddit=event.subreddit,
+        )
+
+def from_item(model: Any, item: Any) -> Any:
+    """Build ``model`` with ``from_event`` for an event from :mod:`.events`, ``from_praw`` otherwise."""
+    return model.from_event(item) if isinstance(item, EVENT_TYPES) else model.from_praw(item)
+
+class UserStatsModel(Base):
+    """All-time activity of one user, kept up to date by the savers (see :mod:`.user_stats`)."""
+    __tablename__: ClassVar[str] = 'user_stats'
+    id = Column(Integer, primary_key=True)
+    user_id = Column(String, ForeignKey('users.reddit_id'), unique=True, nullable=False)
+    posts = Column(Integer, default=0)
+    comments = Column(Integer, default=0)
+    # Mod actions targeting the user: removals, bans and all of them
+    removals = Column(Integer, default=0)
+    bans = Column(Integer, default=0)
+    mod_actions = Column(Integer, default=0)
+    # Of the user's own posts and comments
+    first_seen_utc = Column(DateTime)
+    last_seen_utc = Column(DateTime)
+    updated_utc = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+class UserDailyStatsModel(Base):
+    """Per-day counts for the rolling windows; ``kind`` is posts, comments or a mod action such as removecomment."""
+    __tablename__: ClassVar[str] = 'user_stats_daily'
+    __table_args__ = (
+        UniqueConstraint('user_id', 'day', 'kind', name='uq_user_stats_daily'),
+        Index('ix_user_stats_daily_day', 'day'),
+    )
+    id = Column(Integer, primary_key=True)
+    user_id = Column(String, ForeignKey('users.reddit_id'), nullable=False)
+    day = Column(Date, nullable=False)
+    kind = Column(String, nullable=False)
+    count = Column(Integer, default=0)
+
+class CommentTreeModel(Base):
+    """Materialised path of a comment within its post, maintained by the savers (see :mod:`.comment_tree`)."""
+    __tablename__: ClassVar[str] = 'comment_tree'
+    __table_args__ = (
+        Index('ix_comment_tree_post_path', 'post_id', 'path'),
+        Index('ix_comment_tree_pending', 'pending_parent'),
+    )
+    id = Column(Integer, primary_key=True)
+    reddit_id = Column(String, unique=True, nullable=False)
+    post_id = Column(String, nullable=False)
+    # reddit_ids from the top-level comment down to this one, each followed by '/'.
+    # Byte order on PostgreSQL so that a subtree is one contiguous index range
+    path = Column(String().with_variant(String(collation='C'), 'postgresql'), nullable=False)
+    depth = Column(Integer, nullable=False, default=0)
+    # Set on the top of a subtree whose parent comment is not stored yet
+    pending_parent = Column(String)
+
+class BackfillCursorModel(Base):
+    __tablename__: ClassVar[str] = 'backfill_cursors'
+    __table_args__ = (UniqueConstraint('subreddit', 'stream'),)
+    id = Column(Integer, primary_key=True)
+    subreddit = Column(String, nullable=False)
+    stream = Column(String, nullable=False)
+    cursor = Column(String)
+    oldest_utc = Column(DateTime)
+    items = Column(Integer, default=0)
+    done = Column(Integer, default=0)
+    updated_utc = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+class StreamCheckpointModel(Base):
+    __tablename__: ClassVar[str] = 'stream_checkpoints'
+    __table_args__ = (UniqueConstraint('subreddit', 'stream'),)
+    id = Column(Integer, primary_key=True)
+    subreddit = Column(String, nullable=False)
+    stream = Column(String, nullable=False)
+    fullname = Column(String, nullable=False)
+    created_utc = Column(DateTime, nullable=False)
+    updated_utc = Column(DateTime, default=lambda: datetime.now(timezone.utc))
+
+class SchemaMetaModel(Base):
+    """Version of the models the schema was last created from (see :func:`.schema.ensure_schema`)."""
+    __tablename__: ClassVar[str] = 'schema_meta'
+    id = Column(Integer, primary_key=True)
+    version = Column(String, nullable=False)
+    updated_utc = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
+
+class ModerationRuleModel(Base):
+    __tablename__: ClassVar[str] = 'moderation_rules'
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    kind = Column(String, nullable=False, default='keyword')
+    pattern = Column(Text, nullable=False)
+    action = Column(String, nullable=False, default='report')
+    # Comma-separated: posts, comments or both
+    streams = Column(String, nullable=False, default='posts,comments')
+    case_sensitive = Column(Integer, default=0)
+    enabled = Column(Integer, default=1)
+    updated_utc = Column(DateTime, default=lambda: datetime.now(timezone.utc), onupdate=lambda: datetime.now(timezone.utc))
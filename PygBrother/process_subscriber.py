@@ -0,0 +1,198 @@
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import Condition, Event, Lock, Thread
+from typing import Any, Callable, Generic, Optional, TypeVar
+from .metrics import ERRORS, QUEUE_DEPTH
+
+from .log import get_logger
+logger = get_logger()
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+def _run_batch(function: Callable[[Any], Any], items: list[Any]) -> list[tuple[bool, Any]]:
+    # Runs in a worker process; a failing item must not lose the rest of the batch
+    results: list[tuple[bool, Any]] = []
+    for item in items:
+        try:
+            results.append((True, function(item)))
+        except Exception as e:
+            results.append((False, f"{type(e).__name__}: {e}"))
+    return results
+
+
+class ProcessSubscriber(Generic[T, R]):
+    """
+    Subscriber that runs ``function`` on a pool of worker processes, for checks
+    too CPU-heavy to run on the polling or publisher threads.
+
+    Subscribe the instance like any callback. Items are pickled, so publish
+    events from :mod:`.events` (``RedditFetcher(events=True)``) rather than praw
+    objects, and make ``function`` a module-level function. Items are sent in
+    batches of up to ``batch_size``, or after ``max_delay`` seconds for a
+    partial batch. ``initializer`` runs once in every worker, for example to
+    compile a rule set.
+
+    Every result other than ``None`` is passed to ``on_result(item, result)``
+    in this process, on a result thread, so acting on it (removing a comment,
+    say) can use the fetcher's Reddit client. Results arrive in completion
+    order, not publication order.
+
+    If a worker process dies, the pool is restarted and the batches it lost are
+    sent again, up to ``max_retries`` times. At most ``max_pending`` batches are
+    in flight; past that ``__call__`` blocks, slowing the publisher down.
+    :meth:`close` sends what is buffered and waits for every result.
+    """
+
+    def __init__(
+        self,
+        function: Callable[[T], Optional[R]],
+        on_result: Optional[Callable[[T, R], None]] = None,
+        workers: Optional[int] = None,
+        batch_size: int = 64,
+        max_delay: float = 0.5,
+        max_pending: Optional[int] = None,
+        max_retries: int = 1,
+        initializer: Optional[Callable[..., None]] = None,
+        initargs: tuple[Any, ...] = (),
+        start_method: str = "spawn",
+        name: Optional[str] = None,
+    ) -> None:
+        self.function: Callable[[T], Optional[R]] = function
+        self.on_result: Optional[Callable[[T, R], None]] = on_result
+        self.workers: int = workers or os.cpu_count() or 1
+        self.batch_size: int = batch_size
+        self.max_delay: float = max_delay
+        self.max_pending: int = max_pending or self.workers * 4
+        self.max_retries: int = max_retries
+        self.initializer: Optional[Callable[..., None]] = initializer
+        self.initargs: tuple[Any, ...] = initargs
+        self.name: str = name or getattr(function, '__qualname__', 'process_subscriber')
+        self.__qualname__: str = self.name
+        self.restarts: int = 0
+        self._context: Any = multiprocessing.get_context(start_method)
+        self._executor: ProcessPoolExecutor = self._new_executor()
+        self._buffer: list[T] = []
+        self._pending: int = 0
+        self._lock: Lock = Lock()
+        self._cond: Condition = Condition(self._lock)
+        self._closed: bool = False
+        self._stop_event: Event = Event()
+        self._flusher: Thread = Thread(target=self._flush_periodically, name=f"{self.name}-flush", daemon=True)
+        self._flusher.start()
+        QUEUE_DEPTH.set_function(self.depth, self.name)
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=self._context,
+            initializer=self.initializer,
+            initargs=self.initargs,
+        )
+
+    def __call__(self, item: T) -> None:
+        with self._lock:
+            if self._closed:
+                logger.warning(f"{self.name} is closed, dropping item.")
+                return
+            self._buffer.append(item)
+            if len(self._buffer) < self.batch_size:
+                return
+            batch, self._buffer = self._buffer, []
+        self._submit(batch, attempt=0)
+
+    def depth(self) -> int:
+        """Items buffered or in flight."""
+        with self._lock:
+            return len(self._buffer) + self._pending * self.batch_size
+
+    def flush(self) -> None:
+        """Send the buffered items now instead of waiting for a full batch."""
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if batch:
+            self._submit(batch, attempt=0)
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Stop accepting items, send what is buffered and wait for every result."""
+        self._stop_event.set()
+        self._flusher.join()
+        # In one step, so an item arriving meanwhile is either in this batch or refused
+        with self._lock:
+            self._closed = True
+            batch, self._buffer = self._buffer, []
+        if batch:
+            self._submit(batch, attempt=0)
+        with self._lock:
+            if not self._cond.wait_for(lambda: self._pending == 0, timeout):
+                logger.warning(f"{self.name} closed with {self._pending} batches still running.")
+            executor = self._executor
+        executor.shutdown(wait=timeout is None, cancel_futures=True)
+
+    def _submit(self, batch: list[T], attempt: int) -> None:
+        # A retried batch keeps the slot it already holds
+        with self._lock:
+            if attempt == 0:
+                self._cond.wait_for(lambda: self._pending < self.max_pending)
+                self._pending += 1
+            executor = self._executor
+        try:
+            future = executor.submit(_run_batch, self.function, batch)
+        except RuntimeError as e:
+            # The pool broke or was replaced before we got to it; take the same path as a failed batch
+            future = Future()
+            future.set_exception(BrokenProcessPool(str(e)))
+        future.add_done_callback(lambda done: self._done(done, executor, batch, attempt))
+
+    def _done(self, future: Future, executor: ProcessPoolExecutor, batch: list[T], attempt: int) -> None:
+        try:
+            results = future.result()
+        except BrokenProcessPool:
+            ERRORS.inc(self.name, "BrokenProcessPool")
+            self._restart(executor)
+            if attempt < self.max_retries:
+                self._submit(batch, attempt + 1)
+                return
+            logger.error(f"{self.name} dropped a batch of {len(batch)} items after a worker died {attempt + 1} times.")
+            self._release()
+            return
+        except Exception as e:
+            ERRORS.inc(self.name, type(e).__name__)
+            logger.error(f"{self.name} failed on a batch of {len(batch)} items: {e}")
+            self._release()
+            return
+        try:
+            for item, (ok, result) in zip(batch, results):
+                if not ok:
+                    ERRORS.inc(self.name, result.split(":", 1)[0])
+                    logger.error(f"{self.name} failed on an item: {result}")
+                elif result is not None and self.on_result is not None:
+                    try:
+                        self.on_result(item, result)
+                    except Exception as e:
+                        ERRORS.inc(self.name, type(e).__name__)
+                        logger.exception(f"Result handler of {self.name} failed")
+        finally:
+            self._release()
+
+    def _release(self) -> None:
+        with self._lock:
+            self._pending -= 1
+            self._cond.notify_all()
+
+    def _restart(self, broken: ProcessPoolExecutor) -> None:
+        with self._lock:
+            # Every batch of a broken pool fails; only the first one replaces it
+            if self._executor is not broken:
+                return
+            self._executor = self._new_executor()
+            self.restarts += 1
+        logger.warning(f"A worker of {self.name} died, restarted the process pool ({self.restarts} restarts).")
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _flush_periodically(self) -> None:
+        while not self._stop_event.wait(self.max_delay):
+            self.flush()
@@ -1,4 +1,8 @@
-from typing import Callable, Dict, Optional, TypeVar, Generic
+from collections import OrderedDict, deque
+from itertools import count
+from typing import Any, Callable, Dict, Hashable, Iterable, Iterator, Literal, NamedTuple, Optional, TypeVar, Generic
+import re
+import time
 import praw
 from praw import Reddit
 from praw.models.mod_action import ModAction
@@ -7,57 +11,332 @@ from praw.models.reddit.redditor import Redditor
 from praw.models.reddit.submission import Submission
 from praw.models.reddit.subreddit import Subreddit
 import prawcore
-from threading import Event
+from sqlalchemy.orm import InstrumentedAttribute, Session as SQLAlchemySession
+from threading import Condition, Event, Lock, Thread
 from .log import get_logger
+from .scheduler import AdaptiveScheduler, RateLimiter
+from .checkpoints import CheckpointStore
+from .events import CommentEvent, ModActionEvent, PostEvent
+from .models import PostModel, CommentModel, UserModel
+from .startup import CachedIdentity, IdentityCache
+from .metrics import API_REMAINING, API_USED, DISPATCH_SECONDS, DROPPED, ERRORS, HANDOFF_LAG, ITEMS, QUEUE_DEPTH
 
 logger = get_logger()
 
 T = TypeVar('T')
 
 class Publisher(Generic[T]):
-    def __init__(self) -> None:
+    def __init__(self, name: str = "publisher") -> None:
+        self.name: str = name
         self.subscribers: list[Callable[[T], None]] = []
 
-    def subscribe(self, callback: Callable[[T], None]) -> None:
+    def subscribe(self, callback: Callable[[T], None], subreddit: Optional[str] = None) -> None:
+        """
+        Call ``callback`` for every published item, or only for items from ``subreddit``
+        when a fetcher serves several subreddits.
+        """
+        if subreddit is not None:
+            callback = _SubredditFilter(callback, subreddit)
         self.subscribers.append(callback)
 
     def notify(self, item: T) -> None:
-        for callback in self.subscribers:
-            callback(item)
+        with DISPATCH_SECONDS.time(self.name):
+            for callback in self.subscribers:
+                callback(item)
+
+    def depth(self) -> int:
+        return 0
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Nothing to drain: subscribers already ran inside ``notify``."""
+
+
+def subreddit_of(item: Any) -> str:
+    """Lower-cased name of the subreddit a published item belongs to."""
+    if isinstance(item, dict):
+        item = item['modaction']
+    return str(item.subreddit).lower()
+
+class _SubredditFilter(Generic[T]):
+    def __init__(self, callback: Callable[[T], None], subreddit: str) -> None:
+        self.callback: Callable[[T], None] = callback
+        self.subreddit: str = subreddit.lower()
+        self.__qualname__: str = getattr(callback, '__qualname__', repr(callback))
+
+    def __call__(self, item: T) -> None:
+        if subreddit_of(item) == self.subreddit:
+            self.callback(item)
+
+
+OnFull = Literal['block', 'drop_oldest', 'spill']
+
+class _Shard(Generic[T]):
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize: int = maxsize
+        self.items: deque[T] = deque()
+        self.cond: Condition = Condition()
+        self.closed: bool = False
+
+class QueuedPublisher(Publisher[T]):
+    """
+    Publisher that hands items to a pool of worker threads instead of running
+    subscribers on the caller's thread.
+
+    Each worker owns a bounded queue. When ``key`` is given, items with the same
+    key always land on the same worker, so every subscriber sees them in
+    publication order; without it items are spread round-robin. When a queue is
+    full, ``on_full`` decides what ``notify`` does:
+
+    - ``block``: wait for room, slowing the caller down
+    - ``drop_oldest``: discard the oldest queued item
+    - ``spill``: keep queueing past ``maxsize`` in memory, with a warning
+
+    :meth:`close` stops accepting items and waits for the queues to drain.
+    """
+
+    def __init__(
+        self,
+        name: str = "publisher",
+        workers: int = 4,
+        maxsize: int = 1000,
+        on_full: OnFull = 'block',
+        key: Optional[Callable[[T], Hashable]] = None,
+    ) -> None:
+        super().__init__(name)
+        if on_full not in ('block', 'drop_oldest', 'spill'):
+            raise ValueError(f"Unknown on_full policy: {on_full}")
+        self.on_full: OnFull = on_full
+        self.key: Optional[Callable[[T], Hashable]] = key
+        self.dropped: int = 0
+        # next() on a count is atomic, so concurrent notify calls still take turns
+        self._next: Iterator[int] = count()
+        self._shards: list[_Shard[T]] = [_Shard(max(1, maxsize // workers)) for _ in range(workers)]
+        self._threads: list[Thread] = [
+            Thread(target=self._work, args=(shard,), name=f"{name}-{i}", daemon=True)
+            for i, shard in enumerate(self._shards)
+        ]
+        for thread in self._threads:
+            thread.start()
+        QUEUE_DEPTH.set_function(self.depth, name)
+
+    def notify(self, item: T) -> None:
+        if self.key is not None:
+            shard = self._shards[hash(self.key(item)) % len(self._shards)]
+        else:
+            shard = self._shards[next(self._next) % len(self._shards)]
+        with shard.cond:
+            if self.on_full == 'block':
+                while len(shard.items) >= shard.maxsize and not shard.closed:
+                    shard.cond.wait()
+            # Also when close() was called while we waited for room
+            if shard.closed:
+                logger.warning(f"{self.name} is closed, dropping item.")
+                return
+            if self.on_full != 'block' and len(shard.items) >= shard.maxsize:
+                if self.on_full == 'drop_oldest':
+                    shard.items.popleft()
+                    self.dropped += 1
+                    DROPPED.inc(self.name)
+                    if self.dropped % 100 == 1:
+                        logger.warning(f"{self.name} queue full, dropped {self.dropped} items so far.")
+                elif len(shard.items) % shard.maxsize == 0:
+                    logger.warning(f"{self.name} queue spilled to {len(shard.items)} items.")
+            shard.items.append(item)
+            shard.cond.notify_all()
+
+    def depth(self) -> int:
+        return sum(len(shard.items) for shard in self._shards)
+
+    def close(self, timeout: Optional[float] = None) -> None:
+        """Stop accepting items and wait until every queued item was delivered."""
+        for shard in self._shards:
+            with shard.cond:
+                shard.closed = True
+                shard.cond.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        logger.info(f"{self.name} drained, {self.depth()} items left undelivered.")
+
+    def _work(self, shard: _Shard[T]) -> None:
+        while True:
+            with shard.cond:
+                while not shard.items and not shard.closed:
+                    shard.cond.wait()
+                if not shard.items:
+                    return
+                item = shard.items.popleft()
+                shard.cond.notify_all()
+            with DISPATCH_SECONDS.time(self.name):
+                for callback in self.subscribers:
+                    try:
+                        callback(item)
+                    except Exception as e:
+                        ERRORS.inc(self.name, type(e).__name__)
+                        logger.exception(f"Subscriber {getattr(callback, '__qualname__', callback)} of {self.name} failed")
+
+
+def submission_key(item: Any) -> Hashable:
+    """Ordering key that keeps the items of one submission on one worker of a stream's publisher."""
+    if isinstance(item, (PostEvent, CommentEvent)):
+        return item.link_id.removeprefix('t3_') if isinstance(item, CommentEvent) else item.id
+    link_id = vars(item).get('link_id')
+    if isinstance(link_id, str):
+        return link_id.removeprefix('t3_')
+    return item.id
+
+def split_subreddits(value: str) -> list[str]:
+    """Split a ``"a,b c+d"`` style list of subreddit names."""
+    return [name for name in re.split(r"[,+\s]+", value) if name]
+
+STREAMS: tuple[str, ...] = ("posts", "comments", "modactions")
+# More than the 100 newest items a reopened stream starts with
+HANDED_OUT_SIZE: int = 1000
+
+def stream_cursor(stream: str, item: Any) -> str:
+    """The ID listings page by: the ModAction id for the mod log, the fullname otherwise."""
+    return item.id if stream == "modactions" else item.fullname
+
+class Hydrated(NamedTuple):
+    """
+    Result of a bulk lookup by ID.
+
+    ``items`` holds the objects fetched from Reddit and ``stored`` the rows
+    already in the database, each in input order. ``missing`` lists the
+    fullnames found in neither: deleted, removed by Reddit, or never existing.
+    """
+    items: list[Any]
+    stored: list[Any]
+    missing: list[str]
+
+INFO_BATCH_SIZE: int = 100
 
 class RedditFetcher:
     # def __init__(self) -> None:
     #     self.subscribers: list[Callable[[T], None]] = []
-    def __init__(self, subreddit: str, praw_config: Dict[str, str]) -> None:
+    def __init__(
+        self,
+        subreddit: str | list[str],
+        praw_config: Dict[str, str],
+        publisher_factory: Optional[Callable[[str], Publisher[Any]]] = None,
+        requests_per_minute: float = 100.0,
+        adaptive: bool = False,
+        checkpoints: Optional[CheckpointStore] = None,
+        reddit_kwargs: Optional[dict[str, Any]] = None,
+        events: bool = False,
+        identity_cache: Optional[IdentityCache] = None,
+    ) -> None:
         self.client_id: str = praw_config['client_id']
         self.user_agent: str = praw_config['user_agent']
         self.client_secret: str = praw_config['client_secret']
         self.refresh_token: str = praw_config['refresh_token'] if 'refresh_token' in praw_config else ''
+        # Extra praw.Reddit arguments, such as a requestor_class for offline replay
+        self.reddit_kwargs: dict[str, Any] = reddit_kwargs or {}
         self.connect()
-        self.subreddit: Subreddit = self.reddit.subreddit(subreddit)
-        
-        try:
-            _ = self.reddit.user.me()
-        except prawcore.exceptions.OAuthException as e:
-           logger.error(f"Failed to authenticate Reddit user: {str(e)}")
-           raise e
 
-        logger.info(f"Logged in to Reddit as u/{self.reddit.user.me().name}")
+        names: list[str] = split_subreddits(subreddit) if isinstance(subreddit, str) else list(subreddit)
+        # A fresh cached identity that covers every requested sub saves user.me() and the mod checks
+        identity_key: str = IdentityCache.key(praw_config)
+        cached: Optional[CachedIdentity] = identity_cache.get(identity_key) if identity_cache is not None else None
+        if cached is not None and not all(name.lower() in cached.moderated for name in names):
+            cached = None
+        self.username: str
+        if cached is not None:
+            self.username = cached.username
+            logger.info(f"Logged in to Reddit as u/{self.username} (cached)")
+        else:
+            try:
+                self.username = self.reddit.user.me().name
+            except prawcore.exceptions.OAuthException as e:
+                logger.error(f"Failed to authenticate Reddit user: {str(e)}")
+                raise e
+            logger.info(f"Logged in to Reddit as u/{self.username}")
+
+        if cached is not None:
+            self.subreddit_names: list[str] = names
+        elif len(names) == 1:
+            self._verify_subreddit(names[0])
+            self.subreddit_names: list[str] = names
+        else:
+            # One listing call covers every sub we moderate; only the rest are checked one by one
+            moderated = {sub.display_name.lower() for sub in self.reddit.user.moderator_subreddits(limit=None)}
+            self.subreddit_names = [name for name in names if name.lower() in moderated or self._is_usable(name)]
+            if not self.subreddit_names:
+                raise PermissionError(f"u/{self.username} cannot moderate any of r/{'+'.join(names)}")
+        if identity_cache is not None and cached is None:
+            identity_cache.put(identity_key, CachedIdentity(
+                self.username, sorted(name.lower() for name in self.subreddit_names), time.time(),
+            ))
+        self.subreddit: Subreddit = self.reddit.subreddit("+".join(self.subreddit_names))
 
+        self.stop_event: Event = Event()
+        make_publisher: Callable[[str], Publisher[Any]] = publisher_factory or (lambda name: Publisher(name))
+        # Publish PostEvent, CommentEvent and ModActionEvent records instead of praw objects
+        self.events: bool = events
+        self.post_publisher: Publisher[Submission | PostEvent] = make_publisher("posts")
+        self.comment_publisher: Publisher[Comment | CommentEvent] = make_publisher("comments")
+        self.modaction_publisher: Publisher[dict[str, ModAction | Redditor] | ModActionEvent] = make_publisher("modactions")
+        self.subscribers: list[Callable[[T], None]] = []
+        API_REMAINING.set_function(lambda: self.reddit.auth.limits.get('remaining'))
+        API_USED.set_function(lambda: self.reddit.auth.limits.get('used'))
+        self.rate_limiter: RateLimiter
+        if adaptive:
+            self.rate_limiter = AdaptiveScheduler(requests_per_minute, limits=lambda: self.reddit.auth.limits)
+        else:
+            self.rate_limiter = RateLimiter(requests_per_minute)
+        self.min_backoff: float = 1.0
+        self.max_backoff: float = 16.0
+        # Seconds between an item's created_utc and its hand-off to subscribers, per stream
+        self.stream_lag: dict[str, float] = {}
+        self._stream_enabled: dict[str, Event] = {name: Event() for name in ("posts", "comments", "modactions")}
+        for enabled in self._stream_enabled.values():
+            enabled.set()
+        self._recheck_lock: Lock = Lock()
+        self.checkpoints: Optional[CheckpointStore] = checkpoints
+        # Per stream: created_utc of the stored checkpoint, and the cursors of the last
+        # items handed out, so a stream opened after a catch-up or reopened after an
+        # error continues where it was without skipping or repeating anything
+        self._resume_after: dict[str, float] = {}
+        self._handed_out: dict[str, OrderedDict[str, None]] = {name: OrderedDict() for name in STREAMS}
+        # When each stream was first opened with skip_existing
+        self._opened_utc: dict[str, float] = {}
+        # Bumped by recheck_subreddits, so every polling thread reopens its stream
+        self._subreddit_generation: int = 0
+
+
+    def _verify_subreddit(self, name: str) -> None:
+        subreddit: Subreddit = self.reddit.subreddit(name)
         try:
-            if not self.subreddit.user_is_moderator:
-                raise PermissionError(f"u/{self.reddit.user.me().name} is not a mod in r/{self.subreddit.display_name}")
+            if not subreddit.user_is_moderator:
+                raise PermissionError(f"u/{self.username} is not a mod in r/{subreddit.display_name}")
         except prawcore.exceptions.Forbidden:
-            raise PermissionError(f"r/{subreddit} is private or quarantined.")
+            raise PermissionError(f"r/{name} is private or quarantined.")
         except prawcore.exceptions.NotFound:
-            raise ValueError(f"r/{subreddit} is banned.")
+            raise ValueError(f"r/{name} is banned.")
 
-        self.stop_event: Event = Event()
-        self.post_publisher: Publisher[Submission] = Publisher()
-        self.comment_publisher: Publisher[Comment] = Publisher()
-        self.modaction_publisher: Publisher[dict[str, ModAction | Redditor]] = Publisher()
-        self.subscribers: list[Callable[[T], None]] = []
+    def _is_usable(self, name: str) -> bool:
+        try:
+            self._verify_subreddit(name)
+            return True
+        except (PermissionError, ValueError) as e:
+            logger.error(f"Skipping r/{name}: {e}")
+            return False
 
+    def recheck_subreddits(self) -> bool:
+        """
+        Drop subreddits that became unusable (banned, private, mod removed) and rebuild
+        the combined subreddit from the rest.
+
+        Returns:
+            bool: ``True`` if at least one subreddit is left to fetch from.
+        """
+        self.subreddit_names = [name for name in self.subreddit_names if self._is_usable(name)]
+        if not self.subreddit_names:
+            logger.error("No subreddit left to fetch from.")
+            return False
+        self.subreddit = self.reddit.subreddit("+".join(self.subreddit_names))
+        self._subreddit_generation += 1
+        logger.info(f"Now fetching from r/{self.subreddit.display_name}")
+        return True
 
     def connect(self) -> None:
         """
@@ -71,7 +350,8 @@ class RedditFetcher:
                 client_id=self.client_id,
                 client_secret=self.client_secret,
                 refresh_token=self.refresh_token,
-                user_agent=self.user_agent
+                user_agent=self.user_agent,
+                **self.reddit_kwargs
             )
             logger.info("Successfully connected to Reddit API")
         except Exception as e:
@@ -80,53 +360,275 @@ class RedditFetcher:
     
 
 
-    def run(self) -> None:
-        sub_stream = self.subreddit.stream.submissions(skip_existing=True,pause_after=-1)
-        com_stream = self.subreddit.stream.comments(skip_existing=True,pause_after=-1)
-        mod_stream = self.subreddit.mod.stream.log(skip_existing=True,pause_after=-1)
-        logger.info(f"Starting to fetch content from r/{self.subreddit.display_name} using account {self.reddit.user.me()}")
-    
-        while 1:
-            logger.debug(f"Starting new loop to fetch content from r/{self.subreddit.display_name} using account {self.reddit.user.me()}")
-            for submission in sub_stream:
-                if submission is None:
-                    break
-                self._process_post(submission)
-            #logger.info(f"Starting to fetch comments from r/{self.subreddit.display_name} using account {self.reddit.user.me()}")
-            for comment in com_stream:
-                if comment is None:
+    def _open_stream(self, name: str) -> Iterator[Any]:
+        # After a catch-up or an error the stream must not skip what arrived in the meantime
+        handed_out = self._handed_out[name]
+        continue_after: Optional[str] = next(reversed(handed_out)) if handed_out else None
+        if continue_after is None and name not in self._resume_after and name in self._opened_utc:
+            # Reopened before anything was handed out: keep what arrived since the first open
+            self._resume_after[name] = self._opened_utc[name]
+        skip_existing: bool = name not in self._resume_after and continue_after is None
+        if skip_existing:
+            self._opened_utc[name] = time.time()
+        options: dict[str, Any] = {'skip_existing': skip_existing, 'pause_after': -1, 'continue_after_id': continue_after}
+        if name == "posts":
+            stream = self.subreddit.stream.submissions(**options)
+        elif name == "comments":
+            stream = self.subreddit.stream.comments(**options)
+        else:
+            stream = self.subreddit.mod.stream.log(**options)
+        if skip_existing:
+            return stream
+        return self._skip_handed_out(name, stream)
+
+    def _skip_handed_out(self, name: str, stream: Iterator[Any]) -> Iterator[Any]:
+        # A fresh praw stream starts with the newest 100 items once its before= cursor
+        # comes back empty, most of which were handed out already
+        resume_after = self._resume_after.get(name, 0.0)
+        handed_out = self._handed_out[name]
+        for item in stream:
+            if item is not None and (item.created_utc < resume_after or stream_cursor(name, item) in handed_out):
+                continue
+            yield item
+
+    def listing(self, stream: str, limit: int = 100, params: Optional[dict[str, str]] = None) -> list[Any]:
+        """Fetch one page of a stream's listing, newest first."""
+        if stream == "posts":
+            return list(self.subreddit.new(limit=limit, params=params or {}))
+        if stream == "comments":
+            return list(self.subreddit.comments(limit=limit, params=params or {}))
+        return list(self.subreddit.mod.log(limit=limit, params=params or {}))
+
+    def catch_up(self) -> None:
+        """
+        Hand out everything that arrived since the stored checkpoints, oldest first,
+        by paging forward with ``before=`` listings. Streams without a checkpoint
+        are left alone and start live with ``skip_existing`` as before.
+        """
+        if self.checkpoints is None:
+            return
+        processors = self._stream_processors()
+        for name in STREAMS:
+            anchor = self.checkpoints.oldest(name, self.subreddit_names)
+            if anchor is None:
+                continue
+            self._resume_after[name] = anchor.created_utc
+            before: str = anchor.fullname
+            caught_up = 0
+            while not self.stop_event.is_set() and self.rate_limiter.acquire(name, self.stop_event):
+                page = self.listing(name, params={'before': before})
+                if not page and caught_up == 0:
+                    # The checkpointed item may have been deleted, making before= come back empty
+                    page = self._scan_since(name, anchor.created_utc)
+                    caught_up += self._replay(name, page, processors[name])
                     break
-                self._process_comment(comment)
-            #logger.info(f"Starting to fetch mod actions from r/{self.subreddit.display_name} using account {self.reddit.user.me()}")
-            for modaction in mod_stream:
-                if modaction is None:
+                caught_up += self._replay(name, page, processors[name])
+                if len(page) < 100:
                     break
-                self._process_modaction(modaction)
-    # def stop(self) -> None:
-    #     self.stop_event.set()
-        
+                before = stream_cursor(name, page[0])
+            logger.info(f"Caught up {caught_up} {name} since {anchor.fullname}")
+
+    def _scan_since(self, name: str, created_utc: float, max_pages: int = 10) -> list[Any]:
+        items: list[Any] = []
+        after: Optional[str] = None
+        for _ in range(max_pages):
+            if not self.rate_limiter.acquire(name, self.stop_event):
+                break
+            page = self.listing(name, params={'after': after} if after else {})
+            for item in page:
+                if item.created_utc < created_utc:
+                    return items
+                items.append(item)
+            if len(page) < 100:
+                break
+            after = stream_cursor(name, page[-1])
+        return items
+
+    def _replay(self, name: str, page: list[Any], process: Callable[[Any], None]) -> int:
+        for item in reversed(page):
+            process(item)
+        return len(page)
+
+    def _stream_processors(self) -> dict[str, Callable[[Any], None]]:
+        return {
+            "posts": self._process_post,
+            "comments": self._process_comment,
+            "modactions": self._process_modaction,
+        }
+
+    def _open_streams(self) -> dict[str, tuple[Iterator[Any], Callable[[Any], None]]]:
+        return {name: (self._open_stream(name), process) for name, process in self._stream_processors().items()}
+
+    def _drain(self, stream: Iterator[Any], process: Callable[[Any], None]) -> int:
+        # With pause_after=-1 each pass issues exactly one request, then yields None
+        found = 0
+        for item in stream:
+            if item is None:
+                break
+            process(item)
+            found += 1
+        return found
+
+    def run(self, concurrent: bool = False) -> None:
+        """
+        Stream new posts, comments and mod actions to the publishers until :meth:`stop`.
+
+        Args:
+            concurrent (bool): Poll each stream on its own thread instead of one after
+                the other, sharing ``rate_limiter`` and backing off per stream.
+        """
+        self.catch_up()
+        streams = self._open_streams()
+        logger.info(f"Starting to fetch content from r/{self.subreddit.display_name} using account {self.username}")
+
+        if concurrent:
+            threads = [
+                Thread(target=self._poll_stream, args=(name, stream, process), name=f"poll-{name}", daemon=True)
+                for name, (stream, process) in streams.items()
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        else:
+            backoff: float = self.min_backoff
+            while not self.stop_event.is_set():
+                logger.debug(f"Starting new loop to fetch content from r/{self.subreddit.display_name} using account {self.username}")
+                found = 0
+                try:
+                    for name, (stream, process) in streams.items():
+                        if self._stream_enabled[name].is_set() and self.rate_limiter.acquire(name, self.stop_event):
+                            try:
+                                stream_found = self._drain(stream, process)
+                            except (prawcore.exceptions.Forbidden, prawcore.exceptions.NotFound):
+                                raise
+                            except prawcore.exceptions.PrawcoreException as e:
+                                # Rate limited or a server error: the generator is finished, start a fresh one
+                                ERRORS.inc("fetcher", type(e).__name__)
+                                logger.error(f"Error polling {name} stream, backing off: {e}")
+                                streams[name] = (self._open_stream(name), process)
+                                stream_found = 0
+                            self.rate_limiter.record(name, stream_found)
+                            found += stream_found
+                except (prawcore.exceptions.Forbidden, prawcore.exceptions.NotFound) as e:
+                    ERRORS.inc("fetcher", type(e).__name__)
+                    # One of the subreddits went away; keep serving the others
+                    logger.error(f"Lost access while fetching from r/{self.subreddit.display_name}: {e}")
+                    if not self.recheck_subreddits():
+                        break
+                    streams = self._open_streams()
+                # Back off instead of spinning when every stream came back empty
+                if found:
+                    backoff = self.min_backoff
+                else:
+                    self.stop_event.wait(backoff)
+                    backoff = min(backoff * 2, self.max_backoff)
+        logger.info(f"Stopped fetching from r/{self.subreddit.display_name}, draining publishers")
+        for publisher in (self.post_publisher, self.comment_publisher, self.modaction_publisher):
+            publisher.close()
+        if self.checkpoints is not None:
+            self.checkpoints.flush()
+
+    def _poll_stream(self, name: str, stream: Iterator[Any], process: Callable[[Any], None]) -> None:
+        backoff: float = self.min_backoff
+        generation: int = self._subreddit_generation
+        while not self.stop_event.is_set():
+            if not self._stream_enabled[name].wait(1.0):
+                continue
+            if generation != self._subreddit_generation:
+                # Another stream dropped a subreddit; stop polling the old combination
+                generation = self._subreddit_generation
+                stream = self._open_stream(name)
+            if not self.rate_limiter.acquire(name, self.stop_event):
+                break
+            try:
+                found = self._drain(stream, process)
+            except prawcore.exceptions.PrawcoreException as e:
+                ERRORS.inc("fetcher", type(e).__name__)
+                # The failed generator is finished, start a fresh one
+                logger.error(f"Error polling {name} stream, backing off {backoff}s: {e}")
+                if isinstance(e, (prawcore.exceptions.Forbidden, prawcore.exceptions.NotFound)):
+                    with self._recheck_lock:
+                        # Unless another stream already rechecked since this one opened
+                        if generation == self._subreddit_generation and not self.recheck_subreddits():
+                            self.stop()
+                            break
+                generation = self._subreddit_generation
+                stream = self._open_stream(name)
+                found = 0
+            self.rate_limiter.record(name, found)
+            if found:
+                backoff = self.min_backoff
+            else:
+                self.stop_event.wait(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+        logger.debug(f"Stopped polling {name} stream.")
+
+    def pause_stream(self, name: str) -> None:
+        """Stop polling one stream (``posts``, ``comments`` or ``modactions``) until resumed."""
+        self._stream_enabled[name].clear()
+
+    def resume_stream(self, name: str) -> None:
+        self._stream_enabled[name].set()
+
+    def _checkpoint(self, stream: str, item: Any) -> None:
+        cursor = stream_cursor(stream, item)
+        handed_out = self._handed_out[stream]
+        handed_out[cursor] = None
+        if len(handed_out) > HANDED_OUT_SIZE:
+            handed_out.popitem(last=False)
+        if self.checkpoints is not None and not self.checkpoints.wait_for_commit:
+            self.checkpoints.update(stream, subreddit_of(item), cursor, item.created_utc)
+
+    def _expect_commit(self, stream: str, item: Any) -> None:
+        # Before notify, since a synchronous saver confirms within it
+        if self.checkpoints is not None:
+            self.checkpoints.expect(stream, subreddit_of(item), stream_cursor(stream, item), item.created_utc)
+
+    def _record_lag(self, stream: str, created_utc: float) -> None:
+        lag = time.time() - created_utc
+        self.stream_lag[stream] = lag
+        ITEMS.inc(stream)
+        HANDOFF_LAG.observe(lag, stream)
+
+    def stop(self) -> None:
+        """Ask ``run`` to return after its current loop; publishers are drained on the way out."""
+        self.stop_event.set()
+
     def _process_post(self, submission: Submission) -> None:
         logger.debug(f"Processing post: {submission.title} by {submission.author.name if submission.author else 'Unknown'}")
         #post: PostModel = PostModel.from_praw(submission)
+        self._record_lag("posts", submission.created_utc)
+        self._expect_commit("posts", submission)
 
-        self.post_publisher.notify(submission)
+        self.post_publisher.notify(PostEvent.from_praw(submission) if self.events else submission)
+        self._checkpoint("posts", submission)
 
     def _process_comment(self, comment: Comment) -> None:
         logger.debug(f"Processing comment: {comment.body[:40]}... by {comment.author.name if comment.author else 'Unknown'}")
         #comment_obj: CommentModel = CommentModel.from_praw(comment)
-        
-        self.comment_publisher.notify(comment)
+        self._record_lag("comments", comment.created_utc)
+        self._expect_commit("comments", comment)
+
+        self.comment_publisher.notify(CommentEvent.from_praw(comment) if self.events else comment)
+        self._checkpoint("comments", comment)
 
     def _process_modaction(self, modaction: ModAction) -> None:
         logger.debug(f"Processing mod action: {modaction.action} by {modaction.mod.name if modaction.mod else 'Unknown'} on {modaction.target_fullname}")
 
         #modaction_obj: ModActionModel = ModActionModel.from_praw(modaction)  # type: ignore
+        self._record_lag("modactions", modaction.created_utc)
+        self._expect_commit("modactions", modaction)
+        self.modaction_publisher.notify(ModActionEvent.from_praw(modaction) if self.events else self.modaction_event(modaction))
+        self._checkpoint("modactions", modaction)
+
+    def modaction_event(self, modaction: ModAction) -> dict[str, ModAction | Redditor | None]:
+        """Pair a mod action with a lazy Redditor for its target, as savers expect it."""
         redditor_target: Redditor | None = self.reddit.redditor(modaction.target_author) if modaction.target_author else None
-        dic = {
+        return {
             "modaction": modaction,
             "target": redditor_target
         }
-        self.modaction_publisher.notify(dic)
 
     def fetch_post_by_id(self, post_id: str) -> Optional[Submission]:
         """
@@ -193,6 +695,118 @@ class RedditFetcher:
             logger.warning(f"Mod action with ID {modaction_id} not found.")
             return None
         
+    def fetch_posts_by_ids(
+        self,
+        post_ids: Iterable[str],
+        session_factory: Optional[Callable[[], SQLAlchemySession]] = None,
+    ) -> Hydrated:
+        """
+        Fetch many posts at once, 100 per request through ``/api/info``.
+
+        Args:
+            post_ids (Iterable[str]): Post IDs, with or without the ``t3_`` prefix.
+            session_factory (Optional[Callable[[], SQLAlchemySession]]): When given,
+                posts already in the database are returned from there and not requested.
+
+        Returns:
+            Hydrated: Fully loaded submissions, stored rows and missing fullnames.
+        """
+        return self._hydrate("t3_", post_ids, self._info, PostModel.reddit_id, session_factory)
+
+    def fetch_comments_by_ids(
+        self,
+        comment_ids: Iterable[str],
+        session_factory: Optional[Callable[[], SQLAlchemySession]] = None,
+    ) -> Hydrated:
+        """
+        Fetch many comments at once, 100 per request through ``/api/info``.
+
+        Args:
+            comment_ids (Iterable[str]): Comment IDs, with or without the ``t1_`` prefix.
+            session_factory (Optional[Callable[[], SQLAlchemySession]]): When given,
+                comments already in the database are returned from there and not requested.
+
+        Returns:
+            Hydrated: Fully loaded comments, stored rows and missing fullnames.
+        """
+        return self._hydrate("t1_", comment_ids, self._info, CommentModel.reddit_id, session_factory)
+
+    def fetch_users_by_ids(
+        self,
+        user_ids: Iterable[str],
+        session_factory: Optional[Callable[[], SQLAlchemySession]] = None,
+    ) -> Hydrated:
+        """
+        Fetch many users at once, 100 per request through ``/api/user_data_by_account_ids``.
+
+        Reddit has no bulk lookup by name, so this takes account IDs, as found in
+        ``author_fullname`` or :attr:`UserModel.fullname`.
+
+        Args:
+            user_ids (Iterable[str]): Account IDs, with or without the ``t2_`` prefix.
+            session_factory (Optional[Callable[[], SQLAlchemySession]]): When given,
+                users already in the database are returned from there and not requested.
+
+        Returns:
+            Hydrated: Partial redditors with name and karma, stored rows and missing fullnames.
+        """
+        return self._hydrate("t2_", user_ids, self.reddit.redditors.partial_redditors, UserModel.fullname, session_factory)
+
+    def _info(self, fullnames: list[str]) -> Iterable[Any]:
+        return self.reddit.info(fullnames=fullnames)
+
+    def _hydrate(
+        self,
+        prefix: str,
+        ids: Iterable[str],
+        lookup: Callable[[list[str]], Iterable[Any]],
+        column: InstrumentedAttribute[Any],
+        session_factory: Optional[Callable[[], SQLAlchemySession]],
+    ) -> Hydrated:
+        fullnames: list[str] = [i if i.startswith(prefix) else f"{prefix}{i}" for i in ids]
+        wanted: list[str] = list(dict.fromkeys(fullnames))
+        stored: dict[str, Any] = {}
+        if session_factory is not None:
+            stored = self._load_stored(session_factory, column, prefix, wanted)
+            wanted = [fullname for fullname in wanted if fullname not in stored]
+        found: dict[str, Any] = {}
+        for start in range(0, len(wanted), INFO_BATCH_SIZE):
+            if not self.rate_limiter.acquire("hydration", self.stop_event):
+                break
+            for item in lookup(wanted[start:start + INFO_BATCH_SIZE]):
+                found[item.fullname] = item
+        missing = [fullname for fullname in dict.fromkeys(fullnames) if fullname not in found and fullname not in stored]
+        if missing:
+            logger.warning(f"{len(missing)} of {len(fullnames)} {prefix} IDs not found.")
+        return Hydrated(
+            items=[found[fullname] for fullname in fullnames if fullname in found],
+            stored=[stored[fullname] for fullname in fullnames if fullname in stored],
+            missing=missing,
+        )
+
+    @staticmethod
+    def _load_stored(
+        session_factory: Callable[[], SQLAlchemySession],
+        column: InstrumentedAttribute[Any],
+        prefix: str,
+        fullnames: list[str],
+    ) -> dict[str, Any]:
+        # Posts and comments are stored by bare ID, users by fullname
+        prefixed: bool = column is UserModel.fullname
+        keys: list[str] = fullnames if prefixed else [fullname[len(prefix):] for fullname in fullnames]
+        session: SQLAlchemySession = session_factory()
+        try:
+            rows: list[Any] = []
+            for start in range(0, len(keys), 500):
+                rows.extend(session.query(column.class_).filter(column.in_(keys[start:start + 500])).all())
+            session.expunge_all()
+        finally:
+            session.close()
+        return {
+            (getattr(row, column.key) if prefixed else f"{prefix}{getattr(row, column.key)}"): row
+            for row in rows
+        }
+
     def fetch_latest_posts(self, limit: int = 10) -> list[Submission]:
         """
         Fetch the latest posts from the subreddit.
@@ -0,0 +1,436 @@
+# Record and replay the Reddit API for offline load testing
+# RecordingRequestor saves the listings, mod log and profiles a live fetcher
+# sees; ReplayRequestor serves them back through praw at any speed, with more
+# traffic, injected errors and latency, without network or credentials.
+#
+# set -x REDDIT_RECORD recording.json   # record while running against Reddit
+# set -x REDDIT_REPLAY recording.json   # replay instead of calling Reddit
+# set -x REDDIT_REPLAY_SPEED 60         # one recorded minute per second
+# set -x REDDIT_REPLAY_RATE 10          # ten times as many items
+# set -x REDDIT_REPLAY_ERROR_RATE 0.01  # one request in a hundred gets a 429
+
+import atexit
+import json
+import random
+import re
+import time
+from bisect import bisect_right
+from pathlib import Path
+from threading import Lock
+from typing import Any, Iterable, Optional
+from urllib.parse import urlsplit
+import prawcore
+import requests
+
+from .log import get_logger
+logger = get_logger()
+
+# Listing routes and the kind of their children
+LISTINGS: dict[str, str] = {"new": "t3", "comments": "t1", "log": "modaction"}
+
+_ROUTES: list[tuple[str, re.Pattern[str]]] = [
+    ("token", re.compile(r"^api/v1/access_token$")),
+    ("me", re.compile(r"^api/v1/me$")),
+    ("moderated", re.compile(r"^subreddits/mine/moderator$")),
+    ("log", re.compile(r"^r/(?P<sub>[^/]+)/about/log$")),
+    ("about", re.compile(r"^r/(?P<sub>[^/]+)/about$")),
+    ("new", re.compile(r"^r/(?P<sub>[^/]+)/new$")),
+    ("comments", re.compile(r"^r/(?P<sub>[^/]+)/comments$")),
+    ("submission", re.compile(r"^comments/(?P<id>[^/]+)(/.*)?$")),
+    ("user", re.compile(r"^user/(?P<name>[^/]+)/about$")),
+    ("info", re.compile(r"^api/info$")),
+]
+
+
+def route(url: str) -> tuple[str, dict[str, str]]:
+    """Name of the API route a URL hits, and its path parameters."""
+    path = urlsplit(url).path.strip("/").removesuffix(".json")
+    for name, pattern in _ROUTES:
+        match = pattern.match(path)
+        if match:
+            return name, match.groupdict()
+    return "unknown", {}
+
+
+def item_key(kind: str, data: dict[str, Any]) -> str:
+    """What ``before=`` and ``after=`` refer to: the id for mod actions, the fullname otherwise."""
+    return data["id"] if kind == "modaction" else data.get("name") or f"{kind}_{data['id']}"
+
+
+class Recording:
+    """Listing children, subreddits and profiles captured from Reddit, stored as JSON."""
+
+    def __init__(self) -> None:
+        self.me: dict[str, Any] = {}
+        self.subreddits: dict[str, dict[str, Any]] = {}
+        self.listings: dict[str, list[dict[str, Any]]] = {name: [] for name in LISTINGS}
+        self.users: dict[str, dict[str, Any]] = {}
+        self._seen: dict[str, set[str]] = {name: set() for name in LISTINGS}
+
+    @classmethod
+    def load(cls, path: str | Path) -> 'Recording':
+        recording = cls()
+        payload = json.loads(Path(path).read_text())
+        recording.me = payload.get("me", {})
+        recording.subreddits = payload.get("subreddits", {})
+        recording.users = payload.get("users", {})
+        for name in LISTINGS:
+            recording.add_listing(name, payload.get("listings", {}).get(name, []))
+        return recording
+
+    def save(self, path: str | Path) -> None:
+        payload = {
+            "version": 1,
+            "me": self.me,
+            "subreddits": self.subreddits,
+            "listings": {name: sorted(items, key=lambda data: data["created_utc"]) for name, items in self.listings.items()},
+            "users": self.users,
+        }
+        Path(path).write_text(json.dumps(payload))
+
+    def add_listing(self, name: str, children: Iterable[dict[str, Any]]) -> int:
+        added = 0
+        for data in children:
+            key = item_key(LISTINGS[name], data)
+            if key not in self._seen[name]:
+                self._seen[name].add(key)
+                self.listings[name].append(data)
+                added += 1
+        return added
+
+
+class RecordingRequestor(prawcore.Requestor):
+    """
+    Requestor that talks to Reddit as usual and keeps what listings, the mod
+    log, subreddit and profile pages returned. Tokens and request headers are
+    never stored. The recording is written to ``path`` every
+    ``save_interval`` seconds and at exit, and extended if the file exists.
+
+    Pass it to praw as ``requestor_class`` with ``requestor_kwargs={"path": ...}``.
+    """
+
+    def __init__(self, *args: Any, path: str | Path, save_interval: float = 60.0, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.path: Path = Path(path)
+        self.save_interval: float = save_interval
+        self.recording: Recording = Recording.load(self.path) if self.path.exists() else Recording()
+        self._lock: Lock = Lock()
+        self._last_save: float = time.monotonic()
+        atexit.register(self.save)
+
+    def request(self, *args: Any, timeout: Optional[float] = None, **kwargs: Any) -> requests.Response:
+        response = super().request(*args, timeout=timeout, **kwargs)
+        if response.status_code == 200:
+            method, url = args[0], args[1]
+            try:
+                self._capture(method, url, response.json())
+            except ValueError:
+                pass
+        if time.monotonic() - self._last_save >= self.save_interval:
+            self.save()
+        return response
+
+    def _capture(self, method: str, url: str, payload: Any) -> None:
+        name, params = route(url)
+        with self._lock:
+            if name in LISTINGS:
+                self.recording.add_listing(name, [child["data"] for child in payload["data"]["children"]])
+            elif name == "about":
+                self.recording.subreddits[params["sub"].lower()] = payload["data"]
+            elif name == "me":
+                self.recording.me = {"name": payload["name"], "id": payload.get("id")}
+            elif name == "user":
+                self.recording.users[payload["data"]["name"]] = payload["data"]
+
+    def save(self) -> None:
+        with self._lock:
+            self.recording.save(self.path)
+            self._last_save = time.monotonic()
+        logger.debug(f"Saved recording to {self.path}")
+
+
+class _Timeline:
+    """One listing, oldest first, as it looks on the replay clock."""
+
+    def __init__(self, kind: str, items: list[dict[str, Any]]) -> None:
+        self.kind: str = kind
+        self.items: list[dict[str, Any]] = items
+        self.created: list[float] = [data["created_utc"] for data in items]
+        self.index: dict[str, int] = {item_key(kind, data): i for i, data in enumerate(items)}
+
+
+class ReplayRequestor(prawcore.Requestor):
+    """
+    Requestor that answers praw from a :class:`Recording` instead of Reddit.
+
+    Recorded items appear on the replay clock, which runs ``speed`` times
+    faster than real time, with timestamps shifted so they look new. The first
+    ``backlog`` recorded seconds are already there at startup.
+    ``rate_multiplier`` adds copies of every item, spread over the gap to the
+    next one, for that many times the recorded traffic. ``error_rate`` answers
+    that share of requests with ``error_status`` (429 by default), and every
+    request waits ``latency`` seconds on average. With a ``quota``, the rate
+    limit headers count down from it every ``window`` seconds and requests
+    past it get a 429, like Reddit does.
+
+    Pass it to praw as ``requestor_class`` with ``requestor_kwargs``, or use
+    :func:`replay_kwargs`. Authentication always succeeds.
+    """
+
+    def __init__(
+        self,
+        *args: Any,
+        recording: Recording | str | Path,
+        speed: float = 1.0,
+        rate_multiplier: int = 1,
+        backlog: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 429,
+        latency: float = 0.0,
+        quota: Optional[int] = None,
+        window: int = 600,
+        seed: int = 0,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.recording: Recording = recording if isinstance(recording, Recording) else Recording.load(recording)
+        self.speed: float = speed
+        self.error_rate: float = error_rate
+        self.error_status: int = error_status
+        self.latency: float = latency
+        self.quota: Optional[int] = quota
+        self.window: int = window
+        self.requests: int = 0
+        self.errors: int = 0
+        self._rng: random.Random = random.Random(seed)
+        self._lock: Lock = Lock()
+        self._timelines: dict[str, _Timeline] = {
+            name: _Timeline(kind, self._multiply(kind, self.recording.listings[name], rate_multiplier))
+            for name, kind in LISTINGS.items()
+        }
+        self._views: dict[tuple[str, frozenset[str]], _Timeline] = {}
+        first = min((timeline.created[0] for timeline in self._timelines.values() if timeline.created), default=time.time())
+        self._origin: float = first + backlog
+        self._started: float = time.monotonic()
+        self._wall_start: float = time.time()
+        self._window_start: float = self._started
+        self._window_used: int = 0
+
+    @staticmethod
+    def _multiply(kind: str, items: list[dict[str, Any]], factor: int) -> list[dict[str, Any]]:
+        items = sorted(items, key=lambda data: data["created_utc"])
+        if factor <= 1:
+            return items
+        multiplied: list[dict[str, Any]] = []
+        for i, data in enumerate(items):
+            multiplied.append(data)
+            gap = (items[i + 1]["created_utc"] - data["created_utc"]) if i + 1 < len(items) else 1.0
+            for copy in range(1, factor):
+                clone = dict(data)
+                clone["id"] = f"{data['id']}r{copy}"
+                if kind != "modaction":
+                    clone["name"] = f"{kind}_{clone['id']}"
+                clone["created_utc"] = data["created_utc"] + gap * copy / factor
+                multiplied.append(clone)
+        return multiplied
+
+    def replay_time(self) -> float:
+        """The moment of the recording the replay has reached."""
+        return self._origin + (time.monotonic() - self._started) * self.speed
+
+    def exhausted(self) -> bool:
+        """Whether every recorded item has been made available."""
+        now = self.replay_time()
+        return all(not timeline.created or timeline.created[-1] <= now for timeline in self._timelines.values())
+
+    def _shift(self, data: dict[str, Any]) -> dict[str, Any]:
+        shifted = dict(data)
+        shifted["created_utc"] = self._wall_start + (data["created_utc"] - self._origin) / self.speed
+        shifted["created"] = shifted["created_utc"]
+        return shifted
+
+    def request(self, *args: Any, timeout: Optional[float] = None, **kwargs: Any) -> requests.Response:
+        method, url = args[0], args[1]
+        name, path_params = route(url)
+        params: dict[str, Any] = dict(kwargs.get("params") or {})
+        with self._lock:
+            self.requests += 1
+            delay = self._rng.expovariate(1.0 / self.latency) if self.latency > 0 else 0.0
+            inject = name not in ("token", "me") and self._rng.random() < self.error_rate
+            over_quota = self._spend() if name != "token" else False
+        if delay:
+            time.sleep(delay)
+        if inject or over_quota:
+            with self._lock:
+                self.errors += 1
+            status = 429 if over_quota else self.error_status
+            return self._response(url, status, {"message": requests.status_codes._codes[status][0], "error": status})
+        if name == "token":
+            return self._response(url, 200, {"access_token": "replay", "expires_in": 86400, "scope": "*", "token_type": "bearer"})
+        if name == "me":
+            return self._response(url, 200, self.recording.me or {"name": "replay_bot", "id": "0"})
+        if name in LISTINGS:
+            return self._response(url, 200, self._listing(name, path_params["sub"], params))
+        if name == "about":
+            return self._about(url, path_params["sub"])
+        if name == "moderated":
+            children = [{"kind": "t5", "data": data} for data in self.recording.subreddits.values() if data.get("user_is_moderator")]
+            return self._response(url, 200, self._listing_payload(children))
+        if name == "submission":
+            return self._submission(url, path_params["id"])
+        if name == "user":
+            return self._user(url, path_params["name"])
+        if name == "info":
+            return self._response(url, 200, self._info(str(params.get("id", "")).split(",")))
+        return self._not_found(url)
+
+    def _spend(self) -> bool:
+        if self.quota is None:
+            return False
+        now = time.monotonic()
+        if now - self._window_start >= self.window:
+            self._window_start = now
+            self._window_used = 0
+        self._window_used += 1
+        return self._window_used > self.quota
+
+    def _rate_headers(self) -> dict[str, str]:
+        reset = max(0, int(self.window - (time.monotonic() - self._window_start)))
+        if self.quota is None:
+            remaining = 100_000.0
+        else:
+            remaining = float(max(0, self.quota - self._window_used))
+        return {
+            "x-ratelimit-remaining": f"{remaining:.1f}",
+            "x-ratelimit-used": str(self._window_used),
+            "x-ratelimit-reset": str(reset),
+        }
+
+    def _response(self, url: str, status: int, payload: Any) -> requests.Response:
+        response = requests.Response()
+        response.status_code = status
+        response.url = url
+        response.encoding = "utf-8"
+        response._content = json.dumps(payload).encode()
+        response.headers.update({"content-type": "application/json; charset=UTF-8", **self._rate_headers()})
+        return response
+
+    def _not_found(self, url: str) -> requests.Response:
+        return self._response(url, 404, {"message": "Not Found", "error": 404})
+
+    @staticmethod
+    def _listing_payload(children: list[dict[str, Any]], after: Optional[str] = None) -> dict[str, Any]:
+        return {"kind": "Listing", "data": {"children": children, "after": after, "before": None, "dist": len(children)}}
+
+    def _view(self, name: str, subreddit: str) -> _Timeline:
+        subs = frozenset(sub.lower() for sub in subreddit.split("+"))
+        key = (name, subs)
+        view = self._views.get(key)
+        if view is None:
+            timeline = self._timelines[name]
+            known = {sub.lower() for sub in self.recording.subreddits}
+            # Items are served to whichever subreddit asks when the recording has a single one
+            if subs & known or not known:
+                items = [data for data in timeline.items if not known or str(data.get("subreddit", "")).lower() in subs]
+            else:
+                items = []
+            view = self._views[key] = _Timeline(timeline.kind, items)
+        return view
+
+    def _listing(self, name: str, subreddit: str, params: dict[str, Any]) -> dict[str, Any]:
+        view = self._view(name, subreddit)
+        limit = min(int(params.get("limit", 25)), 100)
+        available = bisect_right(view.created, self.replay_time())
+        before, after = params.get("before"), params.get("after")
+        if before:
+            position = view.index.get(before)
+            if position is None or position >= available:
+                page: list[dict[str, Any]] = []
+            else:
+                page = view.items[position + 1:min(available, position + 1 + limit)][::-1]
+        elif after:
+            position = view.index.get(after)
+            page = [] if position is None else view.items[max(0, min(position, available) - limit):min(position, available)][::-1]
+        else:
+            page = view.items[max(0, available - limit):available][::-1]
+        children = [{"kind": view.kind, "data": self._shift(data)} for data in page]
+        next_after = item_key(view.kind, page[-1]) if len(page) == limit else None
+        return self._listing_payload(children, next_after)
+
+    def _about(self, url: str, subreddit: str) -> requests.Response:
+        data = self.recording.subreddits.get(subreddit.lower())
+        if data is None:
+            if self.recording.subreddits:
+                return self._not_found(url)
+            data = {"display_name": subreddit, "name": "t5_replay", "id": "replay", "user_is_moderator": True, "subreddit_type": "public"}
+        return self._response(url, 200, {"kind": "t5", "data": data})
+
+    def _find(self, fullname: str) -> Optional[dict[str, Any]]:
+        for name in ("new", "comments"):
+            timeline = self._timelines[name]
+            position = timeline.index.get(fullname)
+            if position is not None:
+                return timeline.items[position]
+        return None
+
+    def _submission(self, url: str, submission_id: str) -> requests.Response:
+        data = self._find(f"t3_{submission_id}")
+        if data is None:
+            # Posts older than the recording are rebuilt from what their comments say about them
+            comment = next((c for c in self._timelines["comments"].items if c.get("link_id") == f"t3_{submission_id}"), None)
+            if comment is None:
+                return self._not_found(url)
+            data = {
+                "id": submission_id,
+                "name": f"t3_{submission_id}",
+                "title": comment.get("link_title", ""),
+                "author": comment.get("link_author", "[deleted]"),
+                "selftext": "",
+                "url": comment.get("link_url") or comment.get("link_permalink", ""),
+                "permalink": comment.get("link_permalink", ""),
+                "score": 0,
+                "num_comments": comment.get("num_comments", 0),
+                "subreddit": comment.get("subreddit", ""),
+                "created_utc": comment["created_utc"] - 3600,
+            }
+        return self._response(url, 200, [
+            self._listing_payload([{"kind": "t3", "data": self._shift(data)}]),
+            self._listing_payload([]),
+        ])
+
+    def _user(self, url: str, name: str) -> requests.Response:
+        if name == "[deleted]":
+            return self._not_found(url)
+        data = self.recording.users.get(name) or {
+            "name": name,
+            "id": f"{abs(hash(name)) % 36**6:x}",
+            "link_karma": 1,
+            "comment_karma": 1,
+            "is_mod": False,
+            "icon_img": "",
+            "created_utc": self._origin,
+        }
+        return self._response(url, 200, {"kind": "t2", "data": data})
+
+    def _info(self, fullnames: list[str]) -> dict[str, Any]:
+        children = []
+        for fullname in fullnames:
+            data = self._find(fullname)
+            if data is not None:
+                children.append({"kind": fullname.split("_", 1)[0], "data": self._shift(data)})
+        return self._listing_payload(children)
+
+
+def requestor_of(reddit: Any) -> prawcore.Requestor:
+    """The requestor behind a ``praw.Reddit`` instance, to read replay counters or save a recording."""
+    return reddit._core._authorizer._authenticator._requestor
+
+
+def replay_kwargs(recording: Recording | str | Path, **options: Any) -> dict[str, Any]:
+    """``praw.Reddit`` (or ``RedditFetcher(reddit_kwargs=...)``) arguments for a replay."""
+    return {"requestor_class": ReplayRequestor, "requestor_kwargs": {"recording": recording, **options}}
+
+
+def record_kwargs(path: str | Path, **options: Any) -> dict[str, Any]:
+    """``praw.Reddit`` (or ``RedditFetcher(reddit_kwargs=...)``) arguments for recording."""
+    return {"requestor_class": RecordingRequestor, "requestor_kwargs": {"path": path, **options}}
@@ -0,0 +1,366 @@
+# Moderation rules for PygBrother
+# Keyword, regex and domain rules from a TOML/JSON file or the moderation_rules
+# table, compiled into one combined regex per stream and reloaded when they change.
+#
+# [[rule]]
+# name = "crypto-spam"
+# kind = "keyword"          # keyword, regex or domain
+# patterns = ["free bitcoin", "crypto giveaway"]
+# action = "remove"         # free text, handed to on_match
+# streams = ["posts", "comments"]
+#
+# set -x MODERATION_RULES rules.toml   # or "table" to read moderation_rules
+
+import json
+import os
+import re
+import time
+import tomllib
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock
+from typing import Any, Callable, Iterable, NamedTuple, Optional, Protocol
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session as SQLAlchemySession
+from .models import ModerationRuleModel
+from .metrics import ERRORS, RULE_MATCHES
+
+from .log import get_logger
+logger = get_logger()
+
+KINDS: tuple[str, ...] = ("keyword", "regex", "domain")
+RULE_STREAMS: tuple[str, ...] = ("posts", "comments")
+
+
+@dataclass(frozen=True)
+class Rule:
+    name: str
+    kind: str
+    patterns: tuple[str, ...]
+    action: str = "report"
+    streams: tuple[str, ...] = RULE_STREAMS
+    case_sensitive: bool = False
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> 'Rule':
+        patterns = data.get("patterns", data.get("pattern"))
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        streams = data.get("streams", RULE_STREAMS)
+        if isinstance(streams, str):
+            streams = [stream.strip() for stream in streams.split(",")]
+        rule = cls(
+            name=data["name"],
+            kind=data.get("kind", "keyword"),
+            patterns=tuple(patterns or ()),
+            action=data.get("action", "report"),
+            streams=tuple(streams),
+            case_sensitive=bool(data.get("case_sensitive", False)),
+        )
+        if rule.kind not in KINDS:
+            raise ValueError(f"Rule {rule.name}: unknown kind {rule.kind}")
+        if not rule.patterns:
+            raise ValueError(f"Rule {rule.name} has no patterns")
+        return rule
+
+
+class RuleMatch(NamedTuple):
+    rule: Rule
+    text: str
+
+
+# Host names, to look up domain rules by
+_HOST: re.Pattern[str] = re.compile(r"(?<![\w.-])(?:[\w-]+\.)+[\w-]+")
+# Numbered backreferences and conditionals, which name groups by position
+_GROUP_REFERENCE: re.Pattern[str] = re.compile(r"(?<!\\)(?:\\\\)*\\[1-9]|\(\?\(")
+_DEFAULT_FLAGS: int = re.compile("").flags
+
+
+def _combines(alternative: str) -> bool:
+    try:
+        re.compile(f"(?=(?:x)|(?:{alternative}))", re.IGNORECASE)
+        return True
+    except re.error:
+        return False
+
+
+def _keyword(phrase: str) -> str:
+    return " ".join(phrase.lower().split())
+
+
+def trie_regex(phrases: Iterable[str]) -> str:
+    """
+    One regex matching any of ``phrases``, with shared prefixes factored out
+    (``free(?:\\s+(?:bitcoin|money))?``), so the engine branches on each
+    character once instead of trying every phrase in turn. The longest phrase
+    wins; a space matches any run of whitespace.
+    """
+    trie: dict[str, Any] = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: dict[str, Any]) -> str:
+        branches = [(r"\s+" if char == " " else re.escape(char)) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+class CompiledRules:
+    """
+    A rule set compiled so a text is scanned once per kind of rule, however
+    many rules there are.
+
+    - Keywords are folded into one trie-shaped regex over the lower-cased text,
+      run as a lookahead so overlapping keywords are all seen. Shorter keywords
+      that start where a longer one matched are looked up from the match.
+    - Domains are found by one scan for host names, whose parent domains are
+      looked up in a dict.
+    - Regexes are combined into one alternation, also in a lookahead, which
+      finds every position where some pattern matches. Only there are the
+      patterns tried one by one, to tell which rules they belong to.
+      Patterns with named groups, group references or global inline flags
+      such as ``(?i)`` are searched on their own, since combining them would
+      renumber or clash their groups, or fail to compile.
+
+    Case-sensitive keywords are handled as regexes.
+    """
+
+    def __init__(self, rules: Iterable[Rule]) -> None:
+        self.rules: list[Rule] = list(rules)
+        self._keywords: dict[str, list[int]] = {}
+        self._domains: dict[str, list[int]] = {}
+        regexes: list[str] = []
+        # For each regex alternative, the rule it belongs to
+        self._owner: list[int] = []
+        self._standalone: list[tuple[re.Pattern[str], int]] = []
+        for index, rule in enumerate(self.rules):
+            for pattern in rule.patterns:
+                if rule.kind == "keyword" and not rule.case_sensitive:
+                    self._keywords.setdefault(_keyword(pattern), []).append(index)
+                elif rule.kind == "domain":
+                    self._domains.setdefault(pattern.lower().removeprefix("www."), []).append(index)
+                else:
+                    if rule.kind == "keyword":
+                        pattern = r"(?<!\w)" + r"\s+".join(re.escape(word) for word in pattern.split()) + r"(?!\w)"
+                    alternative = f"(?-i:{pattern})" if rule.case_sensitive else pattern
+                    try:
+                        # Global flags like (?i) or (?x) only work at the start of a whole expression
+                        inline_flags = re.compile(pattern).flags != _DEFAULT_FLAGS
+                        if inline_flags:
+                            compiled = re.compile(pattern, 0 if rule.case_sensitive else re.IGNORECASE)
+                        else:
+                            compiled = re.compile(alternative, re.IGNORECASE)
+                    except re.error as e:
+                        raise ValueError(f"Rule {rule.name}: invalid pattern {pattern!r}: {e}") from e
+                    if compiled.match(""):
+                        raise ValueError(f"Rule {rule.name}: pattern {pattern!r} matches the empty string")
+                    if inline_flags or compiled.groupindex or _GROUP_REFERENCE.search(pattern):
+                        self._standalone.append((compiled, index))
+                        continue
+                    regexes.append(alternative)
+                    self._owner.append(index)
+        self._keyword_regex: Optional[re.Pattern[str]] = None
+        if self._keywords:
+            self._keyword_regex = re.compile(r"(?<!\w)(?=(" + trie_regex(self._keywords) + r")(?!\w))")
+        self._patterns: list[re.Pattern[str]] = [re.compile(alternative, re.IGNORECASE) for alternative in regexes]
+        self._combined: Optional[re.Pattern[str]] = None
+        if regexes:
+            # Capturing groups to tell the alternatives apart would double the scan time
+            try:
+                self._combined = re.compile("(?=" + "|".join(f"(?:{alternative})" for alternative in regexes) + ")", re.IGNORECASE)
+            except re.error as e:
+                owner = next(
+                    (owner for alternative, owner in zip(regexes, self._owner) if not _combines(alternative)),
+                    None,
+                )
+                culprit = f"rule {self.rules[owner].name}" if owner is not None else "the regex rules"
+                raise ValueError(f"Could not combine {culprit} with the others: {e}") from e
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def match(self, text: str) -> list[RuleMatch]:
+        """Every rule with a pattern found in ``text``, once each, in rule order."""
+        found: dict[int, str] = {}
+        if text:
+            if self._keyword_regex is not None:
+                self._match_keywords(text.lower(), found)
+            if self._domains and "." in text:
+                self._match_domains(text.lower(), found)
+            if self._combined is not None:
+                self._match_regexes(text, found)
+            for pattern, owner in self._standalone:
+                if owner not in found:
+                    match = pattern.search(text)
+                    if match:
+                        found[owner] = match.group()
+        return [RuleMatch(self.rules[index], found[index]) for index in sorted(found)]
+
+    def _match_keywords(self, text: str, found: dict[int, str]) -> None:
+        for hit in self._keyword_regex.finditer(text):  # type: ignore[union-attr]
+            words = hit.group(1).split()
+            for length in range(len(words), 0, -1):
+                for index in self._keywords.get(" ".join(words[:length]), ()):
+                    found.setdefault(index, " ".join(words[:length]))
+
+    def _match_domains(self, text: str, found: dict[int, str]) -> None:
+        for host in _HOST.findall(text):
+            labels = host.split(".")
+            for start in range(len(labels) - 1):
+                for index in self._domains.get(".".join(labels[start:]), ()):
+                    found.setdefault(index, host)
+
+    def _match_regexes(self, text: str, found: dict[int, str]) -> None:
+        for hit in self._combined.finditer(text):  # type: ignore[union-attr]
+            position = hit.start()
+            for pattern, owner in zip(self._patterns, self._owner):
+                if owner not in found:
+                    match = pattern.match(text, position)
+                    if match:
+                        found[owner] = match.group()
+
+
+class RuleSource(Protocol):
+    def version(self) -> Any:
+        """A value that changes whenever the rules do."""
+        ...
+
+    def load(self) -> list[Rule]:
+        ...
+
+
+class FileRuleSource:
+    """Rules from a TOML file with ``[[rule]]`` tables, or a JSON list of rule objects."""
+
+    def __init__(self, path: str | Path) -> None:
+        self.path: Path = Path(path)
+
+    def version(self) -> Any:
+        stat = os.stat(self.path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def load(self) -> list[Rule]:
+        text = self.path.read_text()
+        if self.path.suffix == ".json":
+            data = json.loads(text)
+            entries = data.get("rule", data.get("rules", [])) if isinstance(data, dict) else data
+        else:
+            entries = tomllib.loads(text).get("rule", [])
+        return [Rule.from_dict(entry) for entry in entries]
+
+
+class TableRuleSource:
+    """Enabled rows of the ``moderation_rules`` table; rows sharing a name form one rule."""
+
+    def __init__(self, session_factory: Callable[[], SQLAlchemySession]) -> None:
+        self.session_factory: Callable[[], SQLAlchemySession] = session_factory
+
+    def version(self) -> Any:
+        with self.session_factory() as session:
+            return tuple(session.execute(
+                select(func.count(ModerationRuleModel.id), func.max(ModerationRuleModel.updated_utc))
+            ).one())
+
+    def load(self) -> list[Rule]:
+        with self.session_factory() as session:
+            rows = session.scalars(
+                select(ModerationRuleModel).where(ModerationRuleModel.enabled == 1).order_by(ModerationRuleModel.id)
+            ).all()
+            grouped: dict[tuple[str, str, str, str, bool], list[str]] = {}
+            for row in rows:
+                key = (row.name, row.kind, row.action, row.streams, bool(row.case_sensitive))
+                grouped.setdefault(key, []).append(row.pattern)
+        return [
+            Rule.from_dict({"name": name, "kind": kind, "action": action, "streams": streams, "case_sensitive": case_sensitive, "patterns": patterns})
+            for (name, kind, action, streams, case_sensitive), patterns in grouped.items()
+        ]
+
+
+def post_text(post: Any) -> str:
+    return "\n".join(part for part in (post.title, post.selftext, post.url) if part)
+
+def comment_text(comment: Any) -> str:
+    return comment.body or ""
+
+def log_match(item: Any, matches: list[RuleMatch]) -> None:
+    names = ", ".join(f"{match.rule.name} ({match.rule.action})" for match in matches)
+    logger.info(f"Rules matched {item.id}: {names}")
+
+
+class RuleEngine:
+    """
+    Checks posts and comments against a rule set and hands every item with
+    matches to ``on_match(item, matches)``.
+
+    Subscribe :meth:`check_post` and :meth:`check_comment` to the fetcher's
+    publishers. Both work on praw objects and on events. Every
+    ``reload_interval`` seconds the source is asked whether its rules changed
+    and, if so, they are compiled again and swapped in; a rule set that fails
+    to load or compile is logged and the previous one stays in use.
+    """
+
+    def __init__(
+        self,
+        source: RuleSource,
+        on_match: Callable[[Any, list[RuleMatch]], None] = log_match,
+        reload_interval: float = 5.0,
+    ) -> None:
+        self.source: RuleSource = source
+        self.on_match: Callable[[Any, list[RuleMatch]], None] = on_match
+        self.reload_interval: float = reload_interval
+        self.compiled: dict[str, CompiledRules] = {stream: CompiledRules(()) for stream in RULE_STREAMS}
+        self._version: Any = None
+        self._last_check: float = 0.0
+        self._reload_lock: Lock = Lock()
+        self.reload()
+
+    def reload(self, force: bool = False) -> bool:
+        """Recompile the rules if the source changed. Returns ``True`` if new rules were swapped in."""
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        try:
+            self._last_check = time.monotonic()
+            version = self.source.version()
+            if version == self._version and not force:
+                return False
+            rules = self.source.load()
+            compiled = {stream: CompiledRules(rule for rule in rules if stream in rule.streams) for stream in RULE_STREAMS}
+        except Exception as e:
+            ERRORS.inc("rules", type(e).__name__)
+            logger.error(f"Could not load moderation rules, keeping the current ones: {e}")
+            return False
+        finally:
+            self._reload_lock.release()
+        self.compiled = compiled
+        self._version = version
+        logger.info(f"Loaded {len(rules)} moderation rules.")
+        return True
+
+    def _maybe_reload(self) -> None:
+        if time.monotonic() - self._last_check >= self.reload_interval:
+            self.reload()
+
+    def evaluate(self, stream: str, text: str) -> list[RuleMatch]:
+        return self.compiled[stream].match(text)
+
+    def check_post(self, post: Any) -> None:
+        self._check("posts", post, post_text(post))
+
+    def check_comment(self, comment: Any) -> None:
+        self._check("comments", comment, comment_text(comment))
+
+    def _check(self, stream: str, item: Any, text: str) -> None:
+        self._maybe_reload()
+        matches = self.evaluate(stream, text)
+        if not matches:
+            return
+        for match in matches:
+            RULE_MATCHES.inc(match.rule.name, match.rule.action)
+        self.on_match(item, matches)
@@ -0,0 +1,222 @@
+import asyncio
+import time
+from threading import Condition, Event
+from typing import Any, Callable, Optional
+
+from .metrics import API_REQUESTS
+from .log import get_logger
+logger = get_logger()
+
+
+class RateLimiter:
+    """
+    Token bucket shared by every consumer of one Reddit client.
+
+    Each call to :meth:`acquire` spends one request from a budget that refills
+    at ``requests_per_minute``, with bursts of up to ``burst`` requests.
+    Low-priority consumers such as backfill can be capped at a fraction of that
+    budget with :meth:`register`, so they never crowd out the live streams.
+    """
+
+    def __init__(self, requests_per_minute: float = 100.0, burst: Optional[int] = None) -> None:
+        self.requests_per_minute: float = requests_per_minute
+        self.burst: float = float(burst if burst is not None else max(1, int(requests_per_minute // 10)))
+        self._tokens: float = self.burst
+        self._updated: float = time.monotonic()
+        self._cond: Condition = Condition()
+        self._shares: dict[str, float] = {}
+        self._share_slots: dict[str, float] = {}
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.requests_per_minute / 60.0)
+        self._updated = now
+
+    def register(self, consumer: str, share: float) -> None:
+        """Cap ``consumer`` at ``share`` (a fraction, 0 to 1) of ``requests_per_minute``."""
+        with self._cond:
+            self._shares[consumer] = share
+
+    def unregister(self, consumer: str) -> None:
+        """Lift the cap on a consumer that is done."""
+        with self._cond:
+            self._shares.pop(consumer, None)
+            self._share_slots.pop(consumer, None)
+
+    def acquire(self, consumer: str, stop_event: Optional[Event] = None) -> bool:
+        """
+        Block until ``consumer`` may issue one request.
+
+        Returns:
+            bool: ``False`` if ``stop_event`` was set while waiting, ``True`` otherwise.
+        """
+        with self._cond:
+            while True:
+                if stop_event is not None and stop_event.is_set():
+                    return False
+                now = time.monotonic()
+                slot = self._share_slots.get(consumer, now)
+                self._refill()
+                if slot <= now and self._tokens >= 1:
+                    self._tokens -= 1
+                    share = self._shares.get(consumer)
+                    if share is not None:
+                        self._share_slots[consumer] = now + 60.0 / (self.requests_per_minute * share)
+                    API_REQUESTS.inc(consumer)
+                    return True
+                wait = max(slot - now, (1 - self._tokens) * 60.0 / self.requests_per_minute)
+                # Wake up at least once a second to notice stop_event
+                self._cond.wait(min(wait, 1.0))
+
+    def record(self, consumer: str, items: int) -> None:
+        """Report how many new items a consumer's last request returned; unused here."""
+
+
+class AsyncRateLimiter:
+    """
+    :class:`RateLimiter` for the asyncio runtime: the same token bucket, but
+    :meth:`acquire` suspends the calling task instead of blocking a thread.
+    Tasks waiting for a token are served in arrival order.
+    """
+
+    def __init__(self, requests_per_minute: float = 100.0, burst: Optional[int] = None) -> None:
+        self.requests_per_minute: float = requests_per_minute
+        self.burst: float = float(burst if burst is not None else max(1, int(requests_per_minute // 10)))
+        self._tokens: float = self.burst
+        self._updated: float = time.monotonic()
+        self._lock: asyncio.Lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.requests_per_minute / 60.0)
+        self._updated = now
+
+    async def acquire(self, consumer: str) -> None:
+        """Wait until ``consumer`` may issue one request."""
+        async with self._lock:
+            self._refill()
+            while self._tokens < 1:
+                await asyncio.sleep((1 - self._tokens) * 60.0 / self.requests_per_minute)
+                self._refill()
+            self._tokens -= 1
+            API_REQUESTS.inc(consumer)
+
+
+class AdaptiveScheduler(RateLimiter):
+    """
+    Rate limiter that shares Reddit's live request budget between consumers.
+
+    The overall pace is the lower of ``requests_per_minute`` and what the last
+    rate limit headers (read through ``limits``, usually
+    ``reddit.auth.limits``) say is left in the current window, minus a
+    ``reserve`` kept for other bots on the same OAuth app. It slows down before
+    the budget runs out and speeds back up when other clients go quiet.
+
+    That pace is split between consumers in proportion to their weight. For
+    streams, the weight is the observed arrival rate (items per second, as an
+    exponential moving average fed by :meth:`record`), floored at ``min_weight``
+    so quiet streams are still polled. Background consumers such as user
+    enrichment or backfill get a fixed weight through :meth:`register`.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = 100.0,
+        limits: Optional[Callable[[], dict[str, Any]]] = None,
+        reserve: float = 0.1,
+        window: float = 600.0,
+        min_weight: float = 0.05,
+        smoothing: float = 0.2,
+    ) -> None:
+        super().__init__(requests_per_minute, burst=1)
+        self.limits: Optional[Callable[[], dict[str, Any]]] = limits
+        self.reserve: float = reserve
+        self.window: float = window
+        self.min_weight: float = min_weight
+        self.smoothing: float = smoothing
+        self._fixed_weights: dict[str, float] = {}
+        self._arrival_rates: dict[str, float] = {}
+        self._last_record: dict[str, float] = {}
+        self._next_slot: dict[str, float] = {}
+
+    def register(self, consumer: str, weight: float) -> None:
+        """Give a non-stream consumer a fixed share weight (items per second equivalent)."""
+        with self._cond:
+            self._fixed_weights[consumer] = weight
+
+    def unregister(self, consumer: str) -> None:
+        """Stop reserving a share for a consumer that is done."""
+        with self._cond:
+            self._fixed_weights.pop(consumer, None)
+            self._arrival_rates.pop(consumer, None)
+            self._last_record.pop(consumer, None)
+            self._next_slot.pop(consumer, None)
+
+    def record(self, consumer: str, items: int) -> None:
+        now = time.monotonic()
+        with self._cond:
+            last = self._last_record.get(consumer)
+            self._last_record[consumer] = now
+            if last is None or now <= last:
+                return
+            rate = items / (now - last)
+            previous = self._arrival_rates.get(consumer, rate)
+            self._arrival_rates[consumer] = self.smoothing * rate + (1 - self.smoothing) * previous
+
+    def overall_rate(self) -> float:
+        """Requests per minute the scheduler currently allows across all consumers."""
+        rate = self.requests_per_minute
+        if self.limits is None:
+            return rate
+        limits = self.limits()
+        remaining = limits.get('remaining')
+        if remaining is None:
+            return rate
+        now = time.time()
+        reset_timestamp = limits.get('reset_timestamp')
+        if reset_timestamp is not None:
+            seconds_left = max(1.0, float(reset_timestamp) - now)
+        else:
+            # Without a reset time, assume a whole window is left: errs on the slow side
+            seconds_left = self.window
+        spendable = max(0.0, float(remaining) - self.reserve * (float(remaining) + float(limits.get('used') or 0)))
+        return max(0.0, min(rate, spendable / seconds_left * 60.0))
+
+    def share(self, consumer: str) -> float:
+        """Fraction of the overall rate currently given to ``consumer``."""
+        weights = self._weights()
+        weights.setdefault(consumer, self.min_weight)
+        return weights[consumer] / sum(weights.values())
+
+    def _weights(self) -> dict[str, float]:
+        weights = {name: max(self.min_weight, rate) for name, rate in self._arrival_rates.items()}
+        for name in self._last_record:
+            weights.setdefault(name, self.min_weight)
+        weights.update(self._fixed_weights)
+        return weights
+
+    def acquire(self, consumer: str, stop_event: Optional[Event] = None) -> bool:
+        """Block until ``consumer``'s next slot under its current share of the budget."""
+        while True:
+            if stop_event is not None and stop_event.is_set():
+                return False
+            with self._cond:
+                if consumer not in self._last_record and consumer not in self._fixed_weights:
+                    self._last_record[consumer] = time.monotonic()
+                overall = self.overall_rate()
+                now = time.monotonic()
+                if overall > 0:
+                    interval = 60.0 / (overall * self.share(consumer))
+                    slot = max(now, self._next_slot.get(consumer, now))
+                    if slot <= now:
+                        self._next_slot[consumer] = now + interval
+                        API_REQUESTS.inc(consumer)
+                        return True
+                    wait = slot - now
+                else:
+                    logger.warning("Reddit request budget exhausted, pausing until it refills.")
+                    wait = 5.0
+            if stop_event is not None:
+                stop_event.wait(min(wait, 1.0))
+            else:
+                time.sleep(min(wait, 1.0))
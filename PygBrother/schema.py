@@ -0,0 +1,256 @@
+# Schema maintenance for PygBrother
+# Base.metadata.create_all only creates missing tables, so columns and indexes
+# added to the models later are created here for existing databases. On PostgreSQL, comments
+# and mod actions can also be range partitioned by month on created_utc.
+# schema_meta records a hash of the models, so a restart with an unchanged
+# schema can skip both.
+
+import hashlib
+from datetime import date
+from sqlalchemy import MetaData, PrimaryKeyConstraint, Table, UniqueConstraint, inspect, select, text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import SQLAlchemyError
+from .models import Base, SchemaMetaModel
+
+from .log import get_logger
+logger = get_logger()
+
+PARTITIONED_TABLES: tuple[str, ...] = ("comments", "modactions")
+# Part of schema_version(); bump it when ensure_schema learns a new kind of
+# upgrade, so databases already recorded as current are checked again
+SCHEMA_CHECKS: int = 2
+
+
+def missing_columns(bind: Engine | Connection, metadata: MetaData = Base.metadata) -> dict[str, list[str]]:
+    """Columns declared on the models that existing tables lack, by table name."""
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    missing: dict[str, list[str]] = {}
+    for table in metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        absent = [column.name for column in table.columns if column.name not in existing]
+        if absent:
+            missing[table.name] = absent
+    return missing
+
+
+def ensure_columns(bind: Engine | Connection, metadata: MetaData = Base.metadata) -> int:
+    """
+    Add the nullable columns declared on the models that existing tables lack,
+    with ``ALTER TABLE ... ADD COLUMN``. Run it before :func:`ensure_indexes`,
+    which may index them. Also takes a connection, for ``AsyncConnection.run_sync``.
+
+    A missing ``NOT NULL`` column would need a value for every existing row,
+    so it is logged and left to a manual migration.
+
+    Returns:
+        int: How many columns were added.
+    """
+    preparer = bind.dialect.identifier_preparer
+    added = 0
+    for table_name, names in missing_columns(bind, metadata).items():
+        table = metadata.tables[table_name]
+        for name in names:
+            column = table.c[name]
+            if not column.nullable:
+                logger.error(f"Column {table_name}.{name} is missing and NOT NULL, add it by hand")
+                continue
+            statement = text(
+                f"ALTER TABLE {preparer.format_table(table)} "
+                f"ADD COLUMN {preparer.format_column(column)} {column.type.compile(dialect=bind.dialect)}"
+            )
+            logger.info(f"Adding column {name} to {table_name}")
+            if isinstance(bind, Connection):
+                bind.execute(statement)
+            else:
+                with bind.begin() as connection:
+                    connection.execute(statement)
+            added += 1
+    return added
+
+
+def ensure_indexes(engine: Engine | Connection, metadata: MetaData = Base.metadata) -> int:
+    """
+    Create the indexes declared on the models that the database is missing.
+    Also takes a connection, for ``AsyncConnection.run_sync``.
+
+    Indexes on columns the table lacks are skipped with a warning; run
+    :func:`ensure_columns` first to add them.
+
+    Returns:
+        int: How many indexes were created.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    created = 0
+    for table in metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {index['name'] for index in inspector.get_indexes(table.name)}
+        columns = {column['name'] for column in inspector.get_columns(table.name)}
+        for index in table.indexes:
+            if index.name in existing:
+                continue
+            absent = [column.name for column in index.columns if column.name not in columns]
+            if absent:
+                logger.warning(f"Skipping index {index.name}, {table.name} has no column {', '.join(absent)}")
+                continue
+            logger.info(f"Creating index {index.name} on {table.name}, this can take a while on large tables")
+            index.create(engine)
+            created += 1
+    return created
+
+
+def schema_version(metadata: MetaData = Base.metadata) -> str:
+    """Hash of the tables, columns and indexes declared in ``metadata``."""
+    digest = hashlib.sha256(f"checks {SCHEMA_CHECKS}\n".encode())
+    for table in metadata.sorted_tables:
+        digest.update(f"table {table.name}\n".encode())
+        for column in table.columns:
+            digest.update(f"column {column.name} {column.type!r} {column.nullable} {column.primary_key} {column.unique}\n".encode())
+        for index in sorted(table.indexes, key=lambda index: index.name or ''):
+            digest.update(f"index {index.name} {[column.name for column in index.columns]} {index.unique}\n".encode())
+    return digest.hexdigest()[:16]
+
+
+def stored_schema_version(engine: Engine) -> str | None:
+    """The version recorded by :func:`ensure_schema`, or ``None`` on a database it never ran on."""
+    try:
+        with engine.connect() as connection:
+            return connection.scalar(select(SchemaMetaModel.version).order_by(SchemaMetaModel.id.desc()).limit(1))
+    except SQLAlchemyError:
+        # No schema_meta table yet
+        return None
+
+
+def ensure_schema(engine: Engine, skip_if_current: bool = False) -> bool:
+    """
+    Create missing tables, columns and indexes, then record
+    :func:`schema_version` once every model column exists. A database that
+    still lacks some, e.g. a ``NOT NULL`` column :func:`ensure_columns`
+    cannot add, is checked again on the next start.
+
+    Args:
+        skip_if_current: Do nothing when the recorded version matches the
+            models, saving the catalog queries of ``create_all`` and
+            :func:`ensure_indexes` on every start.
+
+    Returns:
+        bool: ``False`` if the schema was already current and nothing ran.
+    """
+    version = schema_version()
+    if skip_if_current and stored_schema_version(engine) == version:
+        logger.debug(f"Schema version {version} is current, skipping create_all")
+        return False
+    Base.metadata.create_all(engine)
+    ensure_columns(engine)
+    ensure_indexes(engine)
+    missing = missing_columns(engine)
+    if missing:
+        logger.error(f"Schema is not at version {version}, missing columns: {missing}")
+        return True
+    with engine.begin() as connection:
+        connection.execute(SchemaMetaModel.__table__.delete())
+        connection.execute(SchemaMetaModel.__table__.insert().values(version=version))
+    logger.info(f"Schema is at version {version}")
+    return True
+
+
+def partitioned_table(name: str, metadata: MetaData) -> Table:
+    """
+    Copy of a model table set up for ``PARTITION BY RANGE (created_utc)``.
+
+    PostgreSQL requires every primary key and unique constraint of a partitioned
+    table to include the partition key, so the primary key becomes
+    ``(id, created_utc)`` and ``reddit_id`` is unique together with
+    ``created_utc``. An item never changes its creation time, so duplicates are
+    still rejected.
+    """
+    for table in Base.metadata.sorted_tables:
+        if table.name not in metadata.tables:
+            table.to_metadata(metadata)
+    table = metadata.tables[name]
+    for constraint in list(table.constraints):
+        if isinstance(constraint, UniqueConstraint) and [column.name for column in constraint.columns] == ['reddit_id']:
+            table.constraints.remove(constraint)
+    table.c.reddit_id.unique = False
+    table.c.created_utc.nullable = False
+    table.c.created_utc.primary_key = True
+    table.c.id.autoincrement = True
+    table.append_constraint(PrimaryKeyConstraint('id', 'created_utc', name=f'{name}_pkey'))
+    table.append_constraint(UniqueConstraint('reddit_id', 'created_utc', name=f'uq_{name}_reddit_id'))
+    table.dialect_options['postgresql']['partition_by'] = 'RANGE (created_utc)'
+    return table
+
+
+def create_partitioned_tables(engine: Engine, months_ahead: int = 3, months_back: int = 0) -> list[str]:
+    """
+    Create ``comments`` and ``modactions`` as monthly partitioned tables on
+    PostgreSQL, when they do not exist yet. Run it before
+    ``Base.metadata.create_all``, which then leaves them alone.
+
+    Existing tables are not converted: that needs a copy of the data into a
+    new partitioned table and is left to a manual migration.
+
+    Returns:
+        list[str]: The tables that are partitioned after this call.
+    """
+    if engine.dialect.name != 'postgresql':
+        logger.warning(f"Partitioning needs PostgreSQL, not {engine.dialect.name}; using plain tables.")
+        return []
+    existing = set(inspect(engine).get_table_names())
+    metadata = MetaData()
+    for name in PARTITIONED_TABLES:
+        if name in existing:
+            continue
+        table = partitioned_table(name, metadata)
+        # Referenced tables must exist first
+        metadata.create_all(engine, tables=[t for t in metadata.sorted_tables if t.name not in PARTITIONED_TABLES])
+        table.create(engine)
+        logger.info(f"Created {name} partitioned by month on created_utc")
+    return ensure_partitions(engine, months_ahead=months_ahead, months_back=months_back)
+
+
+def _month_start(year: int, month: int) -> date:
+    return date(year + (month - 1) // 12, (month - 1) % 12 + 1, 1)
+
+
+def ensure_partitions(engine: Engine, months_ahead: int = 3, months_back: int = 0) -> list[str]:
+    """
+    Make sure every partitioned table has one partition per month from
+    ``months_back`` months ago to ``months_ahead`` months from now, plus a
+    default partition for anything outside that range.
+
+    Call it at startup; with a few months ahead there is always room until the
+    next restart.
+
+    Returns:
+        list[str]: The partitioned tables found.
+    """
+    if engine.dialect.name != 'postgresql':
+        return []
+    today = date.today()
+    with engine.begin() as connection:
+        partitioned: list[str] = list(connection.execute(text(
+            "SELECT c.relname FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = ANY(:names)"
+        ), {'names': list(PARTITIONED_TABLES)}).scalars())
+    for name in partitioned:
+        for offset in range(-months_back, months_ahead + 1):
+            start = _month_start(today.year, today.month + offset)
+            end = _month_start(start.year, start.month + 1)
+            partition = f"{name}_{start:%Y_%m}"
+            try:
+                with engine.begin() as connection:
+                    connection.execute(text(
+                        f"CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {name} "
+                        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+                    ))
+            except SQLAlchemyError as e:
+                # Rows for that month already sit in the default partition
+                logger.error(f"Could not create partition {partition}: {e}")
+        with engine.begin() as connection:
+            connection.execute(text(f"CREATE TABLE IF NOT EXISTS {name}_default PARTITION OF {name} DEFAULT"))
+    return partitioned
@@ -0,0 +1,325 @@
+# Full-text search for PygBrother
+# Opt-in index over post titles and bodies and comment bodies, maintained by
+# the savers in the same transaction as the items they index. PostgreSQL keeps
+# a tsvector per item in search_documents, with a GIN index. SQLite keeps a
+# contentless FTS5 table, search_fts, whose rowid points back at the post or
+# comment row, so the text is not stored twice. search() returns ranked pages
+# of hits, filtered by subreddit, author and time range.
+#
+# set -x SEARCH_INDEX 1   # in main.py, to index items as they are saved
+# python -m PygBrother.search reindex   # for rows stored before that
+# python -m PygBrother.search query '"rate limit" -praw' --subreddit python
+
+import argparse
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Iterable, Optional
+from sqlalchemy import (
+    Column, Index, Integer, MetaData, String, Table, and_, bindparam, cast, column, func, literal, literal_column,
+    inspect, select, table, text, union_all,
+)
+from sqlalchemy.dialects.postgresql import REGCONFIG, TSVECTOR
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session as SQLAlchemySession
+from .models import CommentModel, PostModel
+
+from .log import get_logger
+logger = get_logger()
+
+# PostgreSQL text search configuration; SQLite uses the porter stemmer
+TEXT_SEARCH_CONFIG: str = 'english'
+KINDS: dict[str, type[PostModel] | type[CommentModel]] = {'posts': PostModel, 'comments': CommentModel}
+# search_fts rowids are the source row id shifted left once, plus this bit
+KIND_BITS: dict[str, int] = {'posts': 0, 'comments': 1}
+# Relative weight of titles over bodies
+TITLE_WEIGHT: float = 2.0
+
+search_metadata = MetaData()
+search_documents = Table(
+    'search_documents', search_metadata,
+    Column('kind', String, primary_key=True),
+    Column('source_id', Integer, primary_key=True),
+    Column('document', TSVECTOR, nullable=False),
+    Index('ix_search_documents_document', 'document', postgresql_using='gin'),
+)
+search_fts = table('search_fts', column('rowid'), column('title'), column('body'))
+
+SQLITE_DDL: str = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5("
+    "title, body, content='', tokenize='porter unicode61')"
+)
+
+
+@dataclass
+class SearchHit:
+    # posts or comments
+    kind: str
+    item: PostModel | CommentModel
+    # Higher is better; only comparable within one search
+    rank: float
+
+
+def _dialect(bind: Engine | Connection | SQLAlchemySession) -> str:
+    if isinstance(bind, SQLAlchemySession):
+        bind = bind.get_bind()
+    return bind.dialect.name
+
+
+def ensure_search_index(bind: Engine | Connection) -> bool:
+    """
+    Create the search index tables if missing. Also takes a connection, for
+    ``AsyncConnection.run_sync``.
+
+    Returns:
+        bool: ``False`` if the database has no full-text search we support.
+    """
+    dialect = _dialect(bind)
+    if dialect == 'postgresql':
+        search_metadata.create_all(bind)
+        return True
+    if dialect == 'sqlite':
+        if isinstance(bind, Engine):
+            with bind.begin() as connection:
+                connection.execute(text(SQLITE_DDL))
+        else:
+            bind.execute(text(SQLITE_DDL))
+        return True
+    logger.warning(f"Full-text search is not available on {dialect}, items are not indexed.")
+    return False
+
+
+def _index(session: SQLAlchemySession, kind: str, condition: str, params: dict[str, Any], expanding: tuple[str, ...] = ()) -> int:
+    dialect = _dialect(session)
+    source = KINDS[kind].__tablename__
+    title = "coalesce(s.title, '')" if kind == 'posts' else "''"
+    if dialect == 'postgresql':
+        document = "to_tsvector(CAST(:config AS regconfig), coalesce(s.body, ''))"
+        if kind == 'posts':
+            document = f"setweight(to_tsvector(CAST(:config AS regconfig), {title}), 'A') || setweight({document}, 'B')"
+        statement = text(
+            f"INSERT INTO search_documents (kind, source_id, document) "
+            f"SELECT :kind, s.id, {document} FROM {source} s WHERE {condition} "
+            f"ON CONFLICT DO NOTHING"
+        )
+        params = {**params, 'kind': kind, 'config': TEXT_SEARCH_CONFIG}
+    elif dialect == 'sqlite':
+        # Contentless FTS5 tables accept duplicate rowids, so skip indexed rows here
+        statement = text(
+            f"INSERT INTO search_fts (rowid, title, body) "
+            f"SELECT (s.id << 1) | :bit, {title}, coalesce(s.body, '') FROM {source} s WHERE {condition} "
+            f"AND NOT EXISTS (SELECT 1 FROM search_fts f WHERE f.rowid = (s.id << 1) | :bit)"
+        )
+        params = {**params, 'bit': KIND_BITS[kind]}
+    else:
+        return 0
+    if expanding:
+        statement = statement.bindparams(*(bindparam(name, expanding=True) for name in expanding))
+    return session.execute(statement, params).rowcount
+
+
+def index_documents(session: SQLAlchemySession, kind: str, reddit_ids: Iterable[str]) -> int:
+    """
+    Add stored posts or comments to the search index; ``kind`` is a key of
+    :data:`KINDS`. Rows already indexed are skipped and nothing is committed.
+
+    Returns:
+        int: The number of rows indexed.
+    """
+    ids = list(reddit_ids)
+    if not ids:
+        return 0
+    return _index(session, kind, "s.reddit_id IN :ids", {'ids': ids}, expanding=('ids',))
+
+
+def drop_documents(session: SQLAlchemySession, kind: str, rows: list[dict[str, Any]]) -> int:
+    """
+    Remove rows about to be deleted from the search index, if there is one.
+    ``rows`` are the full rows of ``kind``, since a contentless FTS5 table
+    needs the indexed text to delete it. Nothing is committed here.
+    """
+    if kind not in KINDS or not rows:
+        return 0
+    dialect = _dialect(session)
+    if dialect == 'postgresql' and inspect(session.connection()).has_table('search_documents'):
+        return session.execute(search_documents.delete().where(
+            search_documents.c.kind == kind, search_documents.c.source_id.in_([row['id'] for row in rows]),
+        )).rowcount
+    if dialect == 'sqlite' and inspect(session.connection()).has_table('search_fts'):
+        rowids = {(row['id'] << 1) | KIND_BITS[kind]: row for row in rows}
+        indexed = session.scalars(select(search_fts.c.rowid).where(search_fts.c.rowid.in_(list(rowids)))).all()
+        if indexed:
+            session.execute(
+                text("INSERT INTO search_fts (search_fts, rowid, title, body) VALUES ('delete', :rowid, :title, :body)"),
+                [{'rowid': rowid, 'title': rowids[rowid].get('title') or '', 'body': rowids[rowid].get('body') or ''} for rowid in indexed],
+            )
+        return len(indexed)
+    return 0
+
+
+def reindex(session: SQLAlchemySession, batch_size: int = 10000) -> int:
+    """Rebuild the search index from every stored post and comment. Nothing is committed here."""
+    dialect = _dialect(session)
+    if dialect == 'postgresql':
+        session.execute(search_documents.delete())
+    elif dialect == 'sqlite':
+        session.execute(text("INSERT INTO search_fts (search_fts) VALUES ('delete-all')"))
+    else:
+        raise ValueError(f"Full-text search is not available on {dialect}")
+    indexed: int = 0
+    for kind, model in KINDS.items():
+        last_id: int = session.scalar(select(func.max(model.id))) or 0
+        for start in range(0, last_id, batch_size):
+            indexed += _index(session, kind, "s.id > :start AND s.id <= :stop", {'start': start, 'stop': start + batch_size})
+        logger.info(f"Indexed {kind} up to id {last_id}.")
+    return indexed
+
+
+def fts5_query(query: str) -> str:
+    """
+    Turn a web-style query into FTS5 syntax: words and "quoted phrases" must
+    all match, ``-word`` must not, and ``or`` between two terms matches either.
+    Every term is quoted, so user input cannot be a syntax error.
+    """
+    parts: list[str] = []
+    excluded: list[str] = []
+    for match in re.finditer(r'(-?)(?:"([^"]*)"|(\S+))', query):
+        negated, phrase, word = match.groups()
+        term = phrase if phrase is not None else word
+        if not term.strip('"'):
+            continue
+        if not negated and phrase is None and term.lower() == 'or':
+            if parts and parts[-1] != 'OR':
+                parts.append('OR')
+            continue
+        quoted = '"' + term.replace('"', '""') + '"'
+        (excluded if negated else parts).append(quoted)
+    while parts and parts[-1] == 'OR':
+        parts.pop()
+    if not parts:
+        return ''
+    return " ".join(parts) + "".join(f" NOT {term}" for term in excluded)
+
+
+def search(
+    session: SQLAlchemySession,
+    query: str,
+    kinds: Iterable[str] = tuple(KINDS),
+    subreddit: Optional[str] = None,
+    author: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = 20,
+    offset: int = 0,
+) -> list[SearchHit]:
+    """
+    Search indexed posts and comments, best matches first.
+
+    ``query`` takes words, "quoted phrases", ``-excluded`` words and ``or``,
+    like a web search. Ties are broken by newest first, so pages are stable.
+
+    Args:
+        kinds: posts, comments or both.
+        since: Only items created at or after this time.
+        until: Only items created before this time.
+        limit: Hits per page.
+        offset: Hits to skip, for later pages.
+    """
+    dialect = _dialect(session)
+    if dialect == 'postgresql':
+        tsquery = func.websearch_to_tsquery(cast(literal(TEXT_SEARCH_CONFIG), REGCONFIG), query)
+    elif dialect == 'sqlite':
+        match = fts5_query(query)
+        if not match:
+            return []
+    else:
+        raise ValueError(f"Full-text search is not available on {dialect}")
+
+    selects = []
+    for kind in kinds:
+        model = KINDS[kind]
+        if dialect == 'postgresql':
+            statement = (
+                select(literal(kind).label('kind'), model.id.label('id'), model.created_utc.label('created_utc'),
+                       func.ts_rank_cd(search_documents.c.document, tsquery).label('rank'))
+                .select_from(search_documents)
+                .join(model, and_(search_documents.c.kind == kind, search_documents.c.source_id == model.id))
+                .where(search_documents.c.document.bool_op('@@')(tsquery))
+            )
+        else:
+            # bm25 is lower for better matches
+            statement = (
+                select(literal(kind).label('kind'), model.id.label('id'), model.created_utc.label('created_utc'),
+                       (-func.bm25(literal_column('search_fts'), TITLE_WEIGHT, 1.0)).label('rank'))
+                .select_from(search_fts)
+                .join(model, model.id == search_fts.c.rowid.op('>>')(1))
+                .where(literal_column('search_fts').op('MATCH')(match), search_fts.c.rowid.op('&')(1) == KIND_BITS[kind])
+            )
+        if subreddit is not None:
+            statement = statement.where(model.subreddit == subreddit)
+        if author is not None:
+            statement = statement.where(model.author_id == author)
+        if since is not None:
+            statement = statement.where(model.created_utc >= since)
+        if until is not None:
+            statement = statement.where(model.created_utc < until)
+        selects.append(statement)
+    if not selects:
+        return []
+    ranked = union_all(*selects).subquery()
+    rows = session.execute(
+        select(ranked.c.kind, ranked.c.id, ranked.c.rank)
+        .order_by(ranked.c.rank.desc(), ranked.c.created_utc.desc(), ranked.c.id)
+        .limit(limit).offset(offset)
+    ).all()
+
+    items: dict[tuple[str, int], Any] = {}
+    for kind in {row.kind for row in rows}:
+        model = KINDS[kind]
+        ids = [row.id for row in rows if row.kind == kind]
+        items.update(((kind, item.id), item) for item in session.scalars(select(model).where(model.id.in_(ids))))
+    return [SearchHit(row.kind, items[(row.kind, row.id)], row.rank) for row in rows if (row.kind, row.id) in items]
+
+
+def main() -> None:
+    from dotenv import load_dotenv
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from .main import database_url_from_env
+    parser = argparse.ArgumentParser(description="Maintain and query the full-text search index.")
+    parser.add_argument('command', choices=('reindex', 'query'))
+    parser.add_argument('query', nargs='?', help="Search terms, for query.")
+    parser.add_argument('--kind', choices=tuple(KINDS), help="Only posts or only comments.")
+    parser.add_argument('--subreddit')
+    parser.add_argument('--author')
+    parser.add_argument('--since', type=datetime.fromisoformat)
+    parser.add_argument('--until', type=datetime.fromisoformat)
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--offset', type=int, default=0)
+    parser.add_argument('--url', help="Database URL; defaults to DATABASE_URL.")
+    args = parser.parse_args()
+    load_dotenv()
+    engine = create_engine(args.url or database_url_from_env())
+    if not ensure_search_index(engine):
+        return
+    Session = sessionmaker(bind=engine)
+    with Session() as session:
+        if args.command == 'reindex':
+            logger.info(f"Indexed {reindex(session)} items.")
+            session.commit()
+        else:
+            if not args.query:
+                parser.error("query needs search terms")
+            hits = search(
+                session, args.query, kinds=(args.kind,) if args.kind else tuple(KINDS), subreddit=args.subreddit,
+                author=args.author, since=args.since, until=args.until, limit=args.limit, offset=args.offset,
+            )
+            for hit in hits:
+                snippet = hit.item.title if hit.kind == 'posts' else hit.item.body
+                print(f"{hit.rank:8.3f} {hit.kind[:-1]} {hit.item.reddit_id} r/{hit.item.subreddit} u/{hit.item.author_id} "
+                      f"{hit.item.created_utc:%Y-%m-%d}: {(snippet or '')[:80]!r}")
+    engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+import hashlib
+import math
+from collections import OrderedDict
+from threading import Lock
+from typing import Iterable, Optional
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session as SQLAlchemySession
+from .models import Base
+
+from .log import get_logger
+logger = get_logger()
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings.
+
+    A miss is definitive, a hit only means "maybe": callers still have to ask
+    the database when ``key in bloom`` is ``True``.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.01) -> None:
+        self.capacity: int = max(1, capacity)
+        self.error_rate: float = error_rate
+        self.num_bits: int = max(8, int(-self.capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes: int = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self._bits: bytearray = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, key: str) -> Iterable[int]:
+        # Double hashing: derive k positions from two 64-bit halves of one digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, key: str) -> None:
+        for pos in self._positions(key):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class SeenIndex:
+    """
+    In-process index of ``reddit_id`` values known to be stored, per table.
+
+    Recently written or looked up IDs are kept in a bounded LRU so repeated
+    existence checks cost no database round trip. An optional Bloom filter,
+    warmed from the database with :meth:`warm`, answers "definitely not stored"
+    for brand new IDs. Only committed rows are recorded: sessions passed to
+    :meth:`track` report their inserts on commit and forget them on rollback.
+    """
+
+    def __init__(self, max_size: int = 100_000, bloom_capacity: int = 0, bloom_error_rate: float = 0.01) -> None:
+        self.max_size: int = max_size
+        self.bloom_capacity: int = bloom_capacity
+        self.bloom_error_rate: float = bloom_error_rate
+        self._recent: dict[str, OrderedDict[str, None]] = {}
+        self._blooms: dict[str, BloomFilter] = {}
+        self._lock: Lock = Lock()
+
+    def known(self, table: str, reddit_id: str) -> Optional[bool]:
+        """
+        Look ``reddit_id`` up without touching the database.
+
+        Returns:
+            Optional[bool]: ``True`` if it is stored, ``False`` if it is certainly not,
+            ``None`` if only the database can tell.
+        """
+        with self._lock:
+            recent = self._recent.get(table)
+            if recent is not None and reddit_id in recent:
+                recent.move_to_end(reddit_id)
+                return True
+            bloom = self._blooms.get(table)
+            if bloom is not None and reddit_id not in bloom:
+                return False
+            return None
+
+    def add(self, table: str, reddit_ids: Iterable[str]) -> None:
+        """Record ``reddit_ids`` as committed to ``table``."""
+        with self._lock:
+            recent = self._recent.setdefault(table, OrderedDict())
+            bloom = self._blooms.get(table)
+            for reddit_id in reddit_ids:
+                recent[reddit_id] = None
+                recent.move_to_end(reddit_id)
+                if bloom is not None:
+                    bloom.add(reddit_id)
+            while len(recent) > self.max_size:
+                recent.popitem(last=False)
+
+    def warm(self, session: SQLAlchemySession, models: Iterable[type[Base]]) -> None:
+        """
+        Load the stored ``reddit_id`` of each model into the Bloom filters, and the
+        newest ``max_size`` of them into the LRU. Does nothing if the Bloom filter
+        is disabled (``bloom_capacity == 0``).
+        """
+        if self.bloom_capacity <= 0:
+            return
+        for model in models:
+            table: str = model.__tablename__
+            bloom = BloomFilter(self.bloom_capacity, self.bloom_error_rate)
+            count = 0
+            result = session.execute(select(model.reddit_id).order_by(model.id).execution_options(yield_per=10_000))
+            for (reddit_id,) in result:
+                bloom.add(reddit_id)
+                count += 1
+            if count > self.bloom_capacity:
+                logger.warning(f"{count} rows in {table} exceed the Bloom filter capacity of {self.bloom_capacity}, false positives will rise.")
+            newest = session.scalars(select(model.reddit_id).order_by(model.id.desc()).limit(self.max_size)).all()
+            with self._lock:
+                self._blooms[table] = bloom
+            self.add(table, reversed(newest))
+            logger.info(f"Warmed seen-ID index for {table} with {count} IDs.")
+
+    def track(self, session: SQLAlchemySession) -> None:
+        """Record rows this session inserts once, and only if, it commits."""
+        if session.info.get('seen_index') is self:
+            return
+        session.info['seen_index'] = self
+        session.info['seen_pending'] = []
+        event.listen(session, 'after_flush', self._after_flush)
+        event.listen(session, 'after_commit', self._after_commit)
+        event.listen(session, 'after_rollback', self._after_rollback)
+
+    @staticmethod
+    def _after_flush(session: SQLAlchemySession, flush_context: object) -> None:
+        pending: list[tuple[str, str]] = session.info.setdefault('seen_pending', [])
+        for obj in session.new:
+            reddit_id = getattr(obj, 'reddit_id', None)
+            if reddit_id is not None:
+                pending.append((obj.__tablename__, reddit_id))
+
+    def _after_commit(self, session: SQLAlchemySession) -> None:
+        pending: list[tuple[str, str]] = session.info.get('seen_pending', [])
+        by_table: dict[str, list[str]] = {}
+        for table, reddit_id in pending:
+            by_table.setdefault(table, []).append(reddit_id)
+        for table, reddit_ids in by_table.items():
+            self.add(table, reddit_ids)
+        pending.clear()
+
+    @staticmethod
+    def _after_rollback(session: SQLAlchemySession) -> None:
+        session.info.get('seen_pending', []).clear()
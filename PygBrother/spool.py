@@ -0,0 +1,371 @@
+# Write-ahead spool for PygBrother
+# Items are appended to a local SQLite queue first and written to the main
+# database by a background worker, so a database that is slow, restarting or
+# down for maintenance neither blocks the fetcher nor loses items. Whatever is
+# still spooled at shutdown is written on the next start.
+#
+# set -x DB_SPOOL spool.db
+
+import pickle
+import sqlite3
+import time
+from pathlib import Path
+from threading import Condition, Event, Lock, Thread
+from typing import Any, Callable, Optional
+from praw.models.mod_action import ModAction
+from praw.models.reddit.comment import Comment
+from praw.models.reddit.redditor import Redditor
+from praw.models.reddit.submission import Submission
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError, SQLAlchemyError
+from sqlalchemy.orm import Session as SQLAlchemySession
+from .batch_saver import observe_commit_lag, report_commit, write_batch
+from .bulk_loader import COPY_THRESHOLD
+from .events import CommentEvent, ModActionEvent, PostEvent
+from .seen_index import SeenIndex
+from .user_enricher import UserEnricher
+from .metrics import DB_COMMIT_SECONDS, ERRORS, QUEUE_DEPTH, SAVE_SECONDS, get_registry
+
+from .log import get_logger
+logger = get_logger()
+
+SpooledItem = PostEvent | CommentEvent | ModActionEvent
+# Serialization failure, deadlock and lock timeout: fine once the other transaction is done
+RETRY_SQLSTATES: frozenset[str] = frozenset({'40001', '40P01', '55P03'})
+
+
+class Spool:
+    """
+    Append-only queue of events in a local SQLite file.
+
+    :meth:`append` only buffers in memory. A writer thread commits the buffer
+    every ``sync_interval`` seconds, or as soon as ``group_size`` records are
+    waiting, in one transaction with ``synchronous=FULL``: one fsync per group
+    instead of one per item. A crash can lose at most the last
+    ``sync_interval`` seconds; a database outage loses nothing.
+
+    Records are read oldest first with :meth:`read` and deleted with
+    :meth:`ack` once they are stored elsewhere. Records that keep failing are
+    moved to the ``spool_dead`` table by :meth:`bury`.
+    """
+
+    def __init__(self, path: str | Path, sync_interval: float = 0.1, group_size: int = 1000) -> None:
+        self.path: Path = Path(path)
+        self.sync_interval: float = sync_interval
+        self.group_size: int = group_size
+        # Set after every commit, for readers waiting on new records
+        self.committed: Event = Event()
+        self._buffer: list[tuple[str, bytes, float]] = []
+        self._cond: Condition = Condition()
+        self._closed: bool = False
+        self._sync_lock: Lock = Lock()
+        # One connection per thread; WAL lets the reader work while the writer commits
+        self._writer_db: sqlite3.Connection = self._connect()
+        self._writer_db.executescript(
+            "CREATE TABLE IF NOT EXISTS spool ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT, stream TEXT NOT NULL, payload BLOB NOT NULL, enqueued_utc REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS spool_dead ("
+            " seq INTEGER PRIMARY KEY, stream TEXT NOT NULL, payload BLOB NOT NULL, enqueued_utc REAL NOT NULL,"
+            " error TEXT, buried_utc REAL NOT NULL);"
+        )
+        self._reader_db: sqlite3.Connection = self._connect()
+        self._reader_lock: Lock = Lock()
+        self._stored: int = self._writer_db.execute("SELECT COUNT(*) FROM spool").fetchone()[0]
+        if self._stored:
+            logger.info(f"Spool {self.path} holds {self._stored} items from an earlier run.")
+        self._writer: Thread = Thread(target=self._write_periodically, name="spool-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=30.0, check_same_thread=False, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=FULL")
+        return connection
+
+    def append(self, stream: str, item: SpooledItem) -> None:
+        payload = pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._cond:
+            if self._closed:
+                raise RuntimeError(f"Spool {self.path} is closed")
+            self._buffer.append((stream, payload, time.time()))
+            if len(self._buffer) >= self.group_size:
+                self._cond.notify_all()
+
+    def sync(self) -> None:
+        """Commit the buffered records now."""
+        with self._sync_lock:
+            with self._cond:
+                buffer, self._buffer = self._buffer, []
+            if not buffer:
+                return
+            db = self._writer_db
+            try:
+                db.execute("BEGIN IMMEDIATE")
+                db.executemany("INSERT INTO spool (stream, payload, enqueued_utc) VALUES (?, ?, ?)", buffer)
+                db.execute("COMMIT")
+            except sqlite3.Error:
+                if db.in_transaction:
+                    db.execute("ROLLBACK")
+                with self._cond:
+                    self._buffer[:0] = buffer
+                raise
+        with self._cond:
+            self._stored += len(buffer)
+        self.committed.set()
+
+    def depth(self) -> int:
+        """Records buffered or stored."""
+        with self._cond:
+            return len(self._buffer) + self._stored
+
+    def read(self, limit: int) -> list[tuple[int, str, SpooledItem]]:
+        """Up to ``limit`` of the oldest stored records, as ``(seq, stream, item)``."""
+        with self._reader_lock:
+            rows = self._reader_db.execute("SELECT seq, stream, payload FROM spool ORDER BY seq LIMIT ?", (limit,)).fetchall()
+        return [(seq, stream, pickle.loads(payload)) for seq, stream, payload in rows]
+
+    def ack(self, seqs: list[int]) -> None:
+        """Delete records that were written to the database."""
+        if not seqs:
+            return
+        with self._reader_lock:
+            db = self._reader_db
+            db.execute("BEGIN IMMEDIATE")
+            deleted = db.executemany("DELETE FROM spool WHERE seq = ?", [(seq,) for seq in seqs]).rowcount
+            db.execute("COMMIT")
+        with self._cond:
+            self._stored -= deleted
+
+    def bury(self, seq: int, error: str) -> None:
+        """Move a record that cannot be written to ``spool_dead``, for a look by hand."""
+        with self._reader_lock:
+            db = self._reader_db
+            db.execute("BEGIN IMMEDIATE")
+            db.execute(
+                "INSERT OR REPLACE INTO spool_dead (seq, stream, payload, enqueued_utc, error, buried_utc) "
+                "SELECT seq, stream, payload, enqueued_utc, ?, ? FROM spool WHERE seq = ?",
+                (error, time.time(), seq),
+            )
+            deleted = db.execute("DELETE FROM spool WHERE seq = ?", (seq,)).rowcount
+            db.execute("COMMIT")
+        with self._cond:
+            self._stored -= deleted
+
+    def close(self) -> None:
+        """Commit what is buffered and close the file; later appends raise."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._writer.join()
+        self.sync()
+        self._writer_db.close()
+        self._reader_db.close()
+
+    def _write_periodically(self) -> None:
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._closed or len(self._buffer) >= self.group_size, self.sync_interval)
+                if self._closed:
+                    return
+            try:
+                self.sync()
+            except sqlite3.Error as e:
+                ERRORS.inc("spool", type(e).__name__)
+                logger.error(f"Could not write to spool {self.path}, retrying: {e}")
+
+
+class SpooledDatabaseSaver:
+    """
+    Saver that puts every item in a :class:`Spool` and returns at once, while a
+    drain thread writes the spooled items to the database in batches.
+
+    Items are stored as events, so the spool holds plain records and not praw
+    objects. The drain uses the same idempotent inserts as
+    :class:`~.batch_saver.BatchDatabaseSaver`, so replaying a batch that was
+    written just before a crash only skips the duplicates. When the database is
+    unreachable (a dropped connection, or an error after which ``SELECT 1``
+    fails too) or the write lost a race to another transaction (a deadlock,
+    serialization failure or lock timeout), the batch stays spooled and is
+    retried with exponential backoff. Any other database error, such as a
+    missing column, splits the
+    batch, and an item failing ``max_attempts`` times on its own is buried in
+    the spool's dead table.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[[], SQLAlchemySession],
+        spool: Spool | str | Path,
+        batch_size: int = 500,
+        seen_index: Optional[SeenIndex] = None,
+        enricher: Optional[UserEnricher] = None,
+        copy_threshold: Optional[int] = COPY_THRESHOLD,
+        user_stats: bool = False,
+        comment_tree: bool = False,
+        search_index: bool = False,
+        max_attempts: int = 5,
+        min_backoff: float = 1.0,
+        max_backoff: float = 60.0,
+        on_commit: Optional[Callable[[str, list[str]], None]] = None,
+    ) -> None:
+        self.session_factory: Callable[[], SQLAlchemySession] = session_factory
+        self.spool: Spool = spool if isinstance(spool, Spool) else Spool(spool)
+        self.batch_size: int = batch_size
+        self.seen_index: Optional[SeenIndex] = seen_index
+        self.enricher: Optional[UserEnricher] = enricher
+        self.copy_threshold: Optional[int] = copy_threshold
+        self.user_stats: bool = user_stats
+        self.comment_tree: bool = comment_tree
+        self.search_index: bool = search_index
+        self.max_attempts: int = max_attempts
+        self.min_backoff: float = min_backoff
+        self.max_backoff: float = max_backoff
+        # Called with what reached the database, or the dead table
+        self.on_commit: Optional[Callable[[str, list[str]], None]] = on_commit
+        self._attempts: dict[int, int] = {}
+        # Set by _write on failure: whether retrying later should succeed, and the error
+        self._transient: bool = False
+        self._last_error: str = ""
+        self._stop_event: Event = Event()
+        self._drainer: Thread = Thread(target=self._drain, name="spool-drain", daemon=True)
+        self._drainer.start()
+        QUEUE_DEPTH.set_function(self.spool.depth, "spool")
+
+    def save_post(self, post: Submission | PostEvent) -> None:
+        self.spool.append("posts", post if isinstance(post, PostEvent) else PostEvent.from_praw(post))
+
+    def save_comment(self, comment: Comment | CommentEvent) -> None:
+        self.spool.append("comments", comment if isinstance(comment, CommentEvent) else CommentEvent.from_praw(comment))
+
+    # dic = {
+    #       "modaction": modaction,
+    #       "target": redditor_target
+    # }
+    # or a ModActionEvent
+    def save_modaction(self, dic: dict[str, ModAction | Redditor] | ModActionEvent) -> None:
+        self.spool.append("modactions", dic if isinstance(dic, ModActionEvent) else ModActionEvent.from_praw(dic["modaction"]))
+
+    def pending(self) -> int:
+        return self.spool.depth()
+
+    def close(self, timeout: float = 10.0) -> None:
+        """
+        Stop accepting items and give the drain ``timeout`` seconds to empty the
+        spool; what is left is written on the next start.
+        """
+        self.spool.sync()
+        deadline = time.monotonic() + timeout
+        while self.spool.depth() and time.monotonic() < deadline and self._drainer.is_alive():
+            time.sleep(0.05)
+        self._stop_event.set()
+        self.spool.committed.set()
+        self._drainer.join()
+        self.spool.close()
+        if self.spool.depth():
+            logger.warning(f"Closed with {self.spool.depth()} items left in spool {self.spool.path}.")
+
+    def _drain(self) -> None:
+        backoff: float = self.min_backoff
+        while not self._stop_event.is_set():
+            records = self.spool.read(self.batch_size)
+            if not records:
+                self.spool.committed.wait(1.0)
+                self.spool.committed.clear()
+                continue
+            if self._write(records):
+                continue
+            if not self._transient:
+                backoff = self.min_backoff
+                if self._write_each(records):
+                    continue
+            # Leave the batch spooled until the database is back or the lock is released
+            self._stop_event.wait(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    def _write_each(self, records: list[tuple[int, str, SpooledItem]]) -> bool:
+        """
+        Write ``records`` one by one, burying those that failed too often.
+
+        Returns:
+            bool: ``False`` if it stopped at a transient error, ``True`` otherwise.
+        """
+        for record in records:
+            if self._write([record]):
+                continue
+            if self._transient:
+                return False
+            seq = record[0]
+            self._attempts[seq] = self._attempts.get(seq, 0) + 1
+            if self._attempts[seq] >= self.max_attempts:
+                logger.error(f"Giving up on spooled {record[1]} item {record[2].id} after {self._attempts[seq]} attempts.")
+                self.spool.bury(seq, self._last_error)
+                del self._attempts[seq]
+                if self.on_commit is not None:
+                    # Kept for a look by hand, so fetching it again would not help
+                    self.on_commit(record[1], [record[2].id if record[1] == "modactions" else record[2].fullname])
+        return True
+
+    @staticmethod
+    def _is_retryable(error: SQLAlchemyError) -> bool:
+        orig = getattr(error, 'orig', None)
+        # psycopg2 calls it pgcode, asyncpg and psycopg 3 sqlstate
+        if (getattr(orig, 'pgcode', None) or getattr(orig, 'sqlstate', None)) in RETRY_SQLSTATES:
+            return True
+        # SQLite's lock timeout: another connection kept the write lock past busy_timeout
+        return getattr(orig, 'sqlite_errorname', None) in ('SQLITE_BUSY', 'SQLITE_LOCKED')
+
+    def _is_outage(self, error: SQLAlchemyError) -> bool:
+        if isinstance(error, InterfaceError) or (isinstance(error, DBAPIError) and error.connection_invalidated):
+            return True
+        if not isinstance(error, OperationalError):
+            return False
+        # Also raised for errors in the statement itself, e.g. "no such column" on SQLite
+        session: SQLAlchemySession = self.session_factory()
+        try:
+            session.execute(text("SELECT 1"))
+            return False
+        except SQLAlchemyError:
+            return True
+        finally:
+            session.close()
+
+    def _write(self, records: list[tuple[int, str, SpooledItem]]) -> bool:
+        batch: dict[str, dict[str, Any]] = {"posts": {}, "comments": {}, "modactions": {}}
+        for _, stream, item in records:
+            batch[stream][item.id] = item
+        posts, comments, modactions = batch["posts"], batch["comments"], batch["modactions"]
+        session: SQLAlchemySession = self.session_factory()
+        new_users: list[tuple[str, Optional[str]]] = []
+        started = time.perf_counter()
+        try:
+            written = write_batch(
+                session, posts, comments, modactions, new_users, self.seen_index,
+                defer_profiles=self.enricher is not None, copy_threshold=self.copy_threshold,
+                user_stats=self.user_stats, comment_tree=self.comment_tree, search_index=self.search_index,
+            )
+            with DB_COMMIT_SECONDS.time("spool"):
+                session.commit()
+        except SQLAlchemyError as e:
+            session.rollback()
+            ERRORS.inc("spool", type(e).__name__)
+            self._transient = self._is_retryable(e) or self._is_outage(e)
+            self._last_error = f"{type(e).__name__}: {e}"
+            logger.error(f"Could not write {len(records)} spooled items, keeping them: {e}")
+            return False
+        finally:
+            session.close()
+        self.spool.ack([seq for seq, _, _ in records])
+        for seq, _, _ in records:
+            self._attempts.pop(seq, None)
+        SAVE_SECONDS.observe(time.perf_counter() - started, "spool")
+        if get_registry().enabled:
+            observe_commit_lag(posts, comments, modactions)
+        if self.seen_index is not None:
+            for table, reddit_ids in written.items():
+                self.seen_index.add(table, reddit_ids)
+        if self.enricher is not None:
+            for name, fullname in new_users:
+                self.enricher.enqueue(name, fullname)
+        if self.on_commit is not None:
+            report_commit(self.on_commit, posts, comments, modactions)
+        return True
@@ -0,0 +1,111 @@
+# Fast start for PygBrother
+# A restart loop repeats the same startup work every time. With FAST_START=1,
+# main() keeps the authenticated account and its moderator status in a small
+# cache file for IDENTITY_CACHE_TTL seconds, skips create_all when schema_meta
+# says the schema is current, and turns off praw's update check against PyPI.
+# Independently of that, the schema check runs next to Reddit authentication,
+# and the time spent in each startup phase is logged.
+#
+# set -x FAST_START 1
+# set -x IDENTITY_CACHE .pygbrother_identity.json   # optional
+# set -x IDENTITY_CACHE_TTL 3600   # optional, seconds
+
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from threading import Lock, current_thread, main_thread
+from typing import Any, Iterator, Optional
+
+from .log import get_logger
+logger = get_logger()
+
+IDENTITY_CACHE: str = '.pygbrother_identity.json'
+IDENTITY_CACHE_TTL: float = 3600.0
+
+
+class StartupTimer:
+    """Seconds spent in each named startup phase, from the thread that ran it."""
+
+    def __init__(self, started: Optional[float] = None) -> None:
+        # perf_counter() of the process start, when measured earlier than this
+        self.started: float = time.perf_counter() if started is None else started
+        self.phases: list[tuple[str, float, bool]] = []
+        self._lock: Lock = Lock()
+
+    def record(self, name: str, seconds: float, background: bool = False) -> None:
+        with self._lock:
+            self.phases.append((name, seconds, background))
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started, current_thread() is not main_thread())
+
+    def summary(self) -> str:
+        total = time.perf_counter() - self.started
+        with self._lock:
+            parts = [f"{name} {seconds:.2f}s" + (" (in parallel)" if background else "") for name, seconds, background in self.phases]
+        return f"Started in {total:.2f}s: " + ", ".join(parts)
+
+
+@dataclass
+class CachedIdentity:
+    username: str
+    # Lowercase subreddit names the account was found to moderate
+    moderated: list[str] = field(default_factory=list)
+    checked_utc: float = 0.0
+
+
+class IdentityCache:
+    """
+    Account name and moderated subreddits per set of Reddit credentials,
+    kept in a JSON file for ``ttl`` seconds.
+
+    Entries are keyed by a hash of the client id and refresh token, so the
+    file never holds a secret, and it is only readable by its owner.
+    """
+
+    def __init__(self, path: str | Path = IDENTITY_CACHE, ttl: float = IDENTITY_CACHE_TTL) -> None:
+        self.path: Path = Path(path)
+        self.ttl: float = ttl
+
+    @staticmethod
+    def key(praw_config: dict[str, str]) -> str:
+        credentials = f"{praw_config.get('client_id', '')}\0{praw_config.get('refresh_token', '')}"
+        return hashlib.sha256(credentials.encode()).hexdigest()[:32]
+
+    def _load(self) -> dict[str, Any]:
+        try:
+            with self.path.open() as cache:
+                return json.load(cache)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, key: str) -> Optional[CachedIdentity]:
+        entry = self._load().get(key)
+        if not entry:
+            return None
+        identity = CachedIdentity(**entry)
+        if time.time() - identity.checked_utc > self.ttl:
+            return None
+        return identity
+
+    def put(self, key: str, identity: CachedIdentity) -> None:
+        entries = self._load()
+        entries[key] = asdict(identity)
+        temporary = self.path.with_name(self.path.name + '.tmp')
+        try:
+            descriptor = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(descriptor, 'w') as cache:
+                json.dump(entries, cache)
+            os.replace(temporary, self.path)
+        except OSError as e:
+            # Only costs the next start a few API calls
+            logger.warning(f"Could not write identity cache {self.path}: {e}")
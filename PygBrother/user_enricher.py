@@ -0,0 +1,198 @@
+import time
+from datetime import datetime, timedelta, timezone
+from queue import Empty, Queue
+from threading import Event, Thread
+from typing import Any, Callable, Optional
+from praw import Reddit
+import prawcore
+from sqlalchemy import or_, select, update
+from sqlalchemy.orm import Session as SQLAlchemySession
+from sqlalchemy.exc import SQLAlchemyError
+from .events import CommentEvent, ModActionEvent, PostEvent
+from .models import UserModel
+from .scheduler import RateLimiter
+
+from .log import get_logger
+logger = get_logger()
+
+
+def author_fullname(item: Any) -> Optional[str]:
+    """
+    Return the ``t2_`` fullname of an item's author if the listing already carried it.
+
+    Reads the instance dict directly so a lazy praw object is never fetched.
+    """
+    if isinstance(item, (PostEvent, CommentEvent)):
+        return item.author.fullname if item.author else None
+    fullname = vars(item).get('author_fullname')
+    return fullname if isinstance(fullname, str) else None
+
+
+def mod_fullname(modaction: Any) -> Optional[str]:
+    """Return the ``t2_`` fullname of the moderator behind a mod action or :class:`ModActionEvent`."""
+    if isinstance(modaction, ModActionEvent):
+        return modaction.mod.fullname if modaction.mod else None
+    mod_id36 = vars(modaction).get('mod_id36')
+    return f"t2_{mod_id36}" if isinstance(mod_id36, str) else None
+
+
+class UserEnricher:
+    """
+    Background worker that fills in karma and profile data for stored users.
+
+    Savers insert new users with :meth:`UserModel.from_name` and hand them to
+    :meth:`enqueue`. The worker resolves them in batches of up to 100 through
+    ``/api/user_data_by_account_ids`` when the ``t2_`` fullname is known, and one
+    profile at a time otherwise. Calls go through ``rate_limiter`` when one is
+    shared with the fetcher, and are otherwise spaced ``min_interval`` seconds
+    apart on top of praw's own rate limiting. Users whose data is older than
+    ``ttl`` seconds are picked up again from the database every
+    ``refresh_interval`` seconds.
+    """
+
+    def __init__(
+        self,
+        reddit: Reddit,
+        session_factory: Callable[[], SQLAlchemySession],
+        batch_size: int = 100,
+        min_interval: float = 1.0,
+        ttl: float = 7 * 24 * 3600,
+        refresh_interval: float = 600,
+        rate_limiter: Optional[RateLimiter] = None,
+    ) -> None:
+        self.reddit: Reddit = reddit
+        self.session_factory: Callable[[], SQLAlchemySession] = session_factory
+        self.batch_size: int = min(batch_size, 100)
+        self.min_interval: float = min_interval
+        self.ttl: float = ttl
+        self.refresh_interval: float = refresh_interval
+        self.rate_limiter: Optional[RateLimiter] = rate_limiter
+        self.queue: Queue[tuple[str, Optional[str]]] = Queue()
+        self.stop_event: Event = Event()
+        self._last_call: float = 0.0
+        self._worker: Optional[Thread] = None
+
+    def enqueue(self, name: str, fullname: Optional[str] = None) -> None:
+        if name == '[deleted]':
+            return
+        self.queue.put((name, fullname))
+
+    def start(self) -> None:
+        self._worker = Thread(target=self._run, name="UserEnricher", daemon=True)
+        self._worker.start()
+
+    def stop(self) -> None:
+        self.stop_event.set()
+        if self._worker is not None:
+            self._worker.join()
+
+    def _run(self) -> None:
+        next_refresh: float = time.monotonic()
+        while not self.stop_event.is_set():
+            if self.ttl > 0 and time.monotonic() >= next_refresh:
+                self._enqueue_stale()
+                next_refresh = time.monotonic() + self.refresh_interval
+            batch = self._next_batch()
+            if batch:
+                self.enrich(batch)
+
+    def _next_batch(self) -> dict[str, Optional[str]]:
+        batch: dict[str, Optional[str]] = {}
+        try:
+            name, fullname = self.queue.get(timeout=1.0)
+        except Empty:
+            return batch
+        batch[name] = fullname
+        while len(batch) < self.batch_size:
+            try:
+                name, fullname = self.queue.get_nowait()
+            except Empty:
+                break
+            batch[name] = batch.get(name) or fullname
+        return batch
+
+    def enrich(self, batch: dict[str, Optional[str]]) -> None:
+        """Resolve ``{name: fullname}`` profiles and store them."""
+        profiles: dict[str, dict[str, Any]] = {}
+        by_fullname: dict[str, str] = {fullname: name for name, fullname in batch.items() if fullname}
+        try:
+            if by_fullname:
+                self._throttle()
+                for partial in self.reddit.redditors.partial_redditors(by_fullname):
+                    name = by_fullname.get(partial.fullname, partial.name)
+                    profiles[name] = {
+                        'fullname': partial.fullname,
+                        'link_karma': partial.link_karma,
+                        'comment_karma': partial.comment_karma,
+                        'icon_img': getattr(partial, 'profile_img', None),
+                    }
+            for name in batch:
+                if name not in profiles:
+                    profiles[name] = self._fetch_profile(name)
+        except prawcore.exceptions.PrawcoreException as e:
+            logger.error(f"Error enriching {len(batch)} users, retrying later: {e}")
+            return
+        self._store(profiles)
+
+    def _fetch_profile(self, name: str) -> dict[str, Any]:
+        self._throttle()
+        redditor = self.reddit.redditor(name)
+        try:
+            redditor._fetch()
+        except prawcore.exceptions.NotFound:
+            logger.warning(f"User {name} not found, setting karma to -1")
+            return {'link_karma': -1, 'comment_karma': -1}
+        except prawcore.exceptions.Forbidden:
+            logger.warning(f"User {name} is suspended, setting karma to -1")
+            return {'link_karma': -1, 'comment_karma': -1}
+        return {
+            'fullname': redditor.fullname,
+            'link_karma': getattr(redditor, 'link_karma', 0),
+            'comment_karma': getattr(redditor, 'comment_karma', 0),
+            'is_mod': int(getattr(redditor, 'is_mod', False)),
+            'icon_img': getattr(redditor, 'icon_img', None),
+        }
+
+    def _throttle(self) -> None:
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire("enrichment", self.stop_event)
+            return
+        wait = self._last_call + self.min_interval - time.monotonic()
+        if wait > 0:
+            self.stop_event.wait(wait)
+        self._last_call = time.monotonic()
+
+    def _store(self, profiles: dict[str, dict[str, Any]]) -> None:
+        session: SQLAlchemySession = self.session_factory()
+        now = datetime.now(timezone.utc)
+        try:
+            for name, values in profiles.items():
+                session.execute(update(UserModel).where(UserModel.reddit_id == name).values(enriched_utc=now, **values))
+            session.commit()
+            logger.debug(f"Enriched {len(profiles)} users.")
+        except SQLAlchemyError as e:
+            session.rollback()
+            logger.error(f"Error storing enriched users: {e}")
+        finally:
+            session.close()
+
+    def _enqueue_stale(self) -> None:
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.ttl)
+        session: SQLAlchemySession = self.session_factory()
+        try:
+            stale = session.execute(
+                select(UserModel.name, UserModel.fullname)
+                .where(UserModel.name != '[deleted]')
+                .where(or_(UserModel.enriched_utc.is_(None), UserModel.enriched_utc < cutoff))
+                .order_by(UserModel.enriched_utc.is_(None).desc(), UserModel.enriched_utc)
+                .limit(self.batch_size * 10)
+            ).all()
+        except SQLAlchemyError as e:
+            logger.error(f"Error looking up stale users: {e}")
+            return
+        finally:
+            session.close()
+        for name, fullname in stale:
+            self.enqueue(name, fullname)
+        if stale:
+            logger.info(f"Queued {len(stale)} users for enrichment.")
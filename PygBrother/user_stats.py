@@ -0,0 +1,311 @@
+# Per-user moderation summary for PygBrother
+# user_stats keeps one row per user with all-time counts and first/last seen,
+# updated by the savers in the same transaction as the items they count, so
+# dashboards read one row instead of aggregating posts, comments and modactions.
+# user_stats_daily keeps per-day counts by kind for the rolling 7 and 30 day
+# windows; days older than the longest window can be pruned.
+#
+# set -x USER_STATS 1   # in main.py, to keep the tables up to date
+# python -m PygBrother.user_stats rebuild   # from the stored items
+# python -m PygBrother.user_stats show some_user
+# python -m PygBrother.user_stats prune
+
+import argparse
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Iterable, NamedTuple, Optional
+from sqlalchemy import create_engine, delete, func, select
+from sqlalchemy.orm import Session as SQLAlchemySession, sessionmaker
+from .models import Base, CommentModel, ModActionModel, PostModel, UserDailyStatsModel, UserStatsModel
+
+from .log import get_logger
+logger = get_logger()
+
+REMOVAL_ACTIONS: frozenset[str] = frozenset({'removelink', 'removecomment', 'spamlink', 'spamcomment'})
+BAN_ACTIONS: frozenset[str] = frozenset({'banuser'})
+WINDOWS: tuple[int, ...] = (7, 30)
+KEEP_DAYS: int = max(WINDOWS)
+COUNTERS: tuple[str, ...] = ('posts', 'comments', 'removals', 'bans', 'mod_actions')
+
+
+class Activity(NamedTuple):
+    user_id: str
+    # posts, comments or the mod action taken on the user
+    kind: str
+    created_utc: datetime
+
+
+def _activity(table: str, user_id: Optional[str], action: Optional[str], created_utc: Optional[datetime]) -> Optional[Activity]:
+    kind = action if table == ModActionModel.__tablename__ else table
+    if not user_id or not kind:
+        return None
+    # Stub posts get their created_utc from the column default, at insert time
+    return Activity(user_id, kind, created_utc or datetime.now(timezone.utc))
+
+
+def activities_from_rows(table: str, rows: Iterable[dict[str, Any]]) -> list[Activity]:
+    """Activities of rows about to be inserted into ``posts``, ``comments`` or ``modactions``."""
+    user_column = 'target_author_id' if table == ModActionModel.__tablename__ else 'author_id'
+    # Stub posts are counted once the post itself is saved
+    found = (_activity(table, row.get(user_column), row.get('action'), row.get('created_utc')) for row in rows if not row.get('stub'))
+    return [activity for activity in found if activity is not None]
+
+
+def activities_from_models(instances: Iterable[Any]) -> list[Activity]:
+    """Activities of the new post, comment and mod action models in ``instances``, such as ``session.new``."""
+    found: list[Optional[Activity]] = []
+    for instance in instances:
+        if isinstance(instance, PostModel) and instance.stub:
+            continue
+        if isinstance(instance, (PostModel, CommentModel)):
+            found.append(_activity(instance.__tablename__, instance.author_id, None, instance.created_utc))
+        elif isinstance(instance, ModActionModel):
+            found.append(_activity(instance.__tablename__, instance.target_author_id, instance.action, instance.created_utc))
+    return [activity for activity in found if activity is not None]
+
+
+def counters_of(kind: str) -> tuple[str, ...]:
+    """The ``user_stats`` counters an activity of ``kind`` adds one to."""
+    if kind in ('posts', 'comments'):
+        return (kind,)
+    return ('mod_actions',) + (('removals',) if kind in REMOVAL_ACTIONS else ()) + (('bans',) if kind in BAN_ACTIONS else ())
+
+
+def _day(value: Any) -> date:
+    # func.date() gives a string on SQLite and a date on PostgreSQL
+    if isinstance(value, datetime):
+        return value.date()
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+
+def _stats_rows(
+    totals: dict[str, Counter[str]], seen: dict[str, tuple[Optional[datetime], Optional[datetime]]]
+) -> list[dict[str, Any]]:
+    now = datetime.now(timezone.utc)
+    rows: list[dict[str, Any]] = []
+    for user_id in totals.keys() | seen.keys():
+        first, last = seen.get(user_id, (None, None))
+        counts = totals.get(user_id, Counter())
+        rows.append({'user_id': user_id, **{name: counts[name] for name in COUNTERS},
+                     'first_seen_utc': first, 'last_seen_utc': last, 'updated_utc': now})
+    return rows
+
+
+def record_activity(session: SQLAlchemySession, activities: Iterable[Activity]) -> None:
+    """
+    Add ``activities`` to ``user_stats`` and ``user_stats_daily`` in the
+    session's transaction, with one upsert per table on PostgreSQL and SQLite.
+
+    Only pass items that were actually inserted, or duplicates are counted twice.
+    """
+    totals: dict[str, Counter[str]] = {}
+    seen: dict[str, tuple[Optional[datetime], Optional[datetime]]] = {}
+    daily: Counter[tuple[str, date, str]] = Counter()
+    for activity in activities:
+        totals.setdefault(activity.user_id, Counter()).update(counters_of(activity.kind))
+        daily[(activity.user_id, activity.created_utc.date(), activity.kind)] += 1
+        if activity.kind in ('posts', 'comments'):
+            first, last = seen.get(activity.user_id, (activity.created_utc, activity.created_utc))
+            seen[activity.user_id] = (min(first, activity.created_utc), max(last, activity.created_utc))
+    if not totals:
+        return
+    stats_rows = _stats_rows(totals, seen)
+    daily_rows = [{'user_id': user_id, 'day': day, 'kind': kind, 'count': count} for (user_id, day, kind), count in daily.items()]
+    dialect: str = session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as upsert
+        least, greatest = func.least, func.greatest
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as upsert  # type: ignore[assignment]
+        # Two-argument min() and max() are scalar functions on SQLite
+        least, greatest = func.min, func.max
+    else:
+        _merge(session, stats_rows, daily_rows)
+        return
+    stats = UserStatsModel.__table__
+    insert = upsert(stats)
+    session.execute(insert.on_conflict_do_update(
+        index_elements=['user_id'],
+        set_={
+            **{name: stats.c[name] + insert.excluded[name] for name in COUNTERS},
+            # Either side may be NULL, which least()/min() would not skip everywhere
+            'first_seen_utc': least(func.coalesce(stats.c.first_seen_utc, insert.excluded.first_seen_utc),
+                                    func.coalesce(insert.excluded.first_seen_utc, stats.c.first_seen_utc)),
+            'last_seen_utc': greatest(func.coalesce(stats.c.last_seen_utc, insert.excluded.last_seen_utc),
+                                      func.coalesce(insert.excluded.last_seen_utc, stats.c.last_seen_utc)),
+            'updated_utc': insert.excluded.updated_utc,
+        },
+    ), stats_rows)
+    days = UserDailyStatsModel.__table__
+    insert = upsert(days)
+    session.execute(insert.on_conflict_do_update(
+        index_elements=['user_id', 'day', 'kind'],
+        set_={'count': days.c.count + insert.excluded.count},
+    ), daily_rows)
+
+
+def _merge(session: SQLAlchemySession, stats_rows: list[dict[str, Any]], daily_rows: list[dict[str, Any]]) -> None:
+    # Read-modify-write for databases without ON CONFLICT DO UPDATE
+    stored = {stats.user_id: stats for stats in session.scalars(
+        select(UserStatsModel).where(UserStatsModel.user_id.in_([row['user_id'] for row in stats_rows])).with_for_update()
+    )}
+    for row in stats_rows:
+        stats = stored.get(row['user_id'])
+        if stats is None:
+            session.add(UserStatsModel(**row))
+            continue
+        for name in COUNTERS:
+            setattr(stats, name, (getattr(stats, name) or 0) + row[name])
+        stats.first_seen_utc = min(filter(None, (stats.first_seen_utc, row['first_seen_utc'])), default=None)
+        stats.last_seen_utc = max(filter(None, (stats.last_seen_utc, row['last_seen_utc'])), default=None)
+        stats.updated_utc = row['updated_utc']
+    for row in daily_rows:
+        day = session.scalars(select(UserDailyStatsModel).filter_by(user_id=row['user_id'], day=row['day'], kind=row['kind'])).first()
+        if day is None:
+            session.add(UserDailyStatsModel(**row))
+        else:
+            day.count = (day.count or 0) + row['count']
+
+
+@dataclass
+class UserStats:
+    user_id: str
+    posts: int
+    comments: int
+    removals: int
+    bans: int
+    mod_actions: int
+    first_seen_utc: Optional[datetime]
+    last_seen_utc: Optional[datetime]
+    # Days (7 and 30) to counts by kind over that many days up to today
+    windows: dict[int, Counter[str]] = field(default_factory=dict)
+
+
+def get_user_stats(session: SQLAlchemySession, user_id: str, today: Optional[date] = None) -> Optional[UserStats]:
+    """
+    The summary of one user: a primary key read plus at most
+    ``KEEP_DAYS`` daily rows per kind, whatever their history.
+
+    Returns:
+        Optional[UserStats]: ``None`` if nothing was recorded for the user.
+    """
+    stats = session.scalars(select(UserStatsModel).filter_by(user_id=user_id)).first()
+    if stats is None:
+        return None
+    today = today or datetime.now(timezone.utc).date()
+    result = UserStats(
+        user_id=user_id,
+        **{name: getattr(stats, name) or 0 for name in COUNTERS},
+        first_seen_utc=stats.first_seen_utc,
+        last_seen_utc=stats.last_seen_utc,
+        windows={days: Counter() for days in WINDOWS},
+    )
+    rows = session.execute(
+        select(UserDailyStatsModel.day, UserDailyStatsModel.kind, UserDailyStatsModel.count)
+        .where(UserDailyStatsModel.user_id == user_id, UserDailyStatsModel.day > today - timedelta(days=KEEP_DAYS))
+    )
+    for day, kind, count in rows:
+        for days in WINDOWS:
+            if day > today - timedelta(days=days):
+                result.windows[days][kind] += count
+    return result
+
+
+def prune_user_stats(session: SQLAlchemySession, keep_days: int = KEEP_DAYS, today: Optional[date] = None) -> int:
+    """Delete daily rows no rolling window reaches any more. Returns how many were deleted."""
+    today = today or datetime.now(timezone.utc).date()
+    result = session.execute(delete(UserDailyStatsModel).where(UserDailyStatsModel.day <= today - timedelta(days=keep_days)))
+    return result.rowcount  # type: ignore[attr-defined]
+
+
+def rebuild_user_stats(session: SQLAlchemySession, keep_days: int = KEEP_DAYS) -> int:
+    """
+    Recompute both tables from ``posts``, ``comments`` and ``modactions``,
+    grouped in the database. Items saved while it runs may be counted twice,
+    so stop the fetcher first.
+
+    Returns:
+        int: How many users have a summary.
+    """
+    session.execute(delete(UserDailyStatsModel))
+    session.execute(delete(UserStatsModel))
+    since = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=keep_days)
+    totals: dict[str, Counter[str]] = {}
+    seen: dict[str, tuple[Optional[datetime], Optional[datetime]]] = {}
+    daily: Counter[tuple[str, date, str]] = Counter()
+    sources = (
+        (PostModel.__tablename__, PostModel.author_id, None, PostModel.created_utc),
+        (CommentModel.__tablename__, CommentModel.author_id, None, CommentModel.created_utc),
+        (ModActionModel.__tablename__, ModActionModel.target_author_id, ModActionModel.action, ModActionModel.created_utc),
+    )
+    for table, user_column, action_column, created_column in sources:
+        kind_columns = [action_column] if action_column is not None else []
+        summary = (
+            select(user_column, *kind_columns, func.count(), func.min(created_column), func.max(created_column))
+            .where(user_column.is_not(None)).group_by(user_column, *kind_columns)
+        )
+        for row in session.execute(summary):
+            user_id, kind = row[0], row[1] if action_column is not None else table
+            count, first, last = row[-3:]
+            if not kind:
+                continue
+            totals.setdefault(user_id, Counter()).update({name: count for name in counters_of(kind)})
+            if action_column is None:
+                stored_first, stored_last = seen.get(user_id, (first, last))
+                seen[user_id] = (min(stored_first, first), max(stored_last, last))
+        day_column = func.date(created_column)
+        recent = (
+            select(user_column, *kind_columns, day_column, func.count())
+            .where(user_column.is_not(None), created_column >= since).group_by(user_column, *kind_columns, day_column)
+        )
+        for row in session.execute(recent):
+            user_id, kind = row[0], row[1] if action_column is not None else table
+            if kind:
+                daily[(user_id, _day(row[-2]), kind)] += row[-1]
+    stats_rows = _stats_rows(totals, seen)
+    if stats_rows:
+        session.execute(UserStatsModel.__table__.insert(), stats_rows)
+    if daily:
+        session.execute(UserDailyStatsModel.__table__.insert(), [
+            {'user_id': user_id, 'day': day, 'kind': kind, 'count': count} for (user_id, day, kind), count in daily.items()
+        ])
+    logger.info(f"Rebuilt user stats for {len(stats_rows)} users.")
+    return len(stats_rows)
+
+
+def main() -> None:
+    from dotenv import load_dotenv
+    from .main import database_url_from_env
+    parser = argparse.ArgumentParser(description="Maintain the user_stats summary tables.")
+    parser.add_argument('command', choices=('rebuild', 'show', 'prune'))
+    parser.add_argument('user', nargs='?', help="User name, for show.")
+    parser.add_argument('--url', help="Database URL; defaults to DATABASE_URL.")
+    args = parser.parse_args()
+    load_dotenv()
+    engine = create_engine(args.url or database_url_from_env())
+    Base.metadata.create_all(engine, tables=[UserStatsModel.__table__, UserDailyStatsModel.__table__])
+    Session = sessionmaker(bind=engine)
+    with Session() as session:
+        if args.command == 'rebuild':
+            rebuild_user_stats(session)
+            session.commit()
+        elif args.command == 'prune':
+            logger.info(f"Pruned {prune_user_stats(session)} daily rows.")
+            session.commit()
+        else:
+            if not args.user:
+                parser.error("show needs a user name")
+            stats = get_user_stats(session, args.user)
+            if stats is None:
+                print(f"No stats for u/{args.user}")
+            else:
+                print(f"u/{stats.user_id}: {stats.posts} posts, {stats.comments} comments, {stats.removals} removals, "
+                      f"{stats.bans} bans, {stats.mod_actions} mod actions, seen {stats.first_seen_utc} to {stats.last_seen_utc}")
+                for days, counts in stats.windows.items():
+                    print(f"  last {days} days: " + (", ".join(f"{kind} {count}" for kind, count in sorted(counts.items())) or "nothing"))
+    engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+# Subscriber benchmark for PygBrother
+# Runs a CPU-heavy comment check (a regex rule set plus a near-duplicate
+# search) inline and on ProcessSubscriber pools of growing size, to show how
+# throughput scales with cores.
+#
+# python -m benchmarks.subscriber_benchmark
+# python -m benchmarks.subscriber_benchmark --comments 20000 --workers 1 2 4 8
+
+import argparse
+import os
+import re
+import time
+from difflib import SequenceMatcher
+from typing import Optional
+from PygBrother.events import CommentEvent
+from PygBrother.process_subscriber import ProcessSubscriber
+from .synthetic import StreamConfig, SyntheticReddit
+
+RULES: list[re.Pattern[str]] = [re.compile(rf"\b{word}\w*\b.*\b(help|please|why)\b", re.IGNORECASE) for word in (
+    "python", "list", "dict", "async", "import", "error", "code", "function", "class", "loop",
+    "install", "pip", "venv", "pandas", "numpy", "django", "flask", "test", "string", "file",
+)]
+KNOWN_SPAM: list[str] = [
+    "please help code error python install pip venv thanks question",
+    "json api request file string test flask django numpy pandas",
+    "why how async import loop function class dict list python",
+]
+
+
+def check_comment(comment: CommentEvent) -> Optional[str]:
+    hits = sum(1 for rule in RULES if rule.search(comment.body))
+    for spam in KNOWN_SPAM:
+        if SequenceMatcher(None, comment.body, spam).ratio() > 0.8:
+            return "remove"
+    return "report" if hits > 12 else None
+
+
+def run_inline(comments: list[CommentEvent]) -> float:
+    started = time.perf_counter()
+    for comment in comments:
+        check_comment(comment)
+    return time.perf_counter() - started
+
+
+def run_pool(comments: list[CommentEvent], workers: int, batch_size: int) -> float:
+    subscriber: ProcessSubscriber[CommentEvent, str] = ProcessSubscriber(check_comment, workers=workers, batch_size=batch_size)
+    # Let the workers start before timing
+    subscriber(comments[0])
+    subscriber.flush()
+    started = time.perf_counter()
+    for comment in comments:
+        subscriber(comment)
+    subscriber.close()
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark CPU-heavy subscribers inline and on process pools.")
+    parser.add_argument('--comments', type=int, default=5000)
+    parser.add_argument('--workers', type=int, nargs='+', default=sorted({1, 2, os.cpu_count() or 1}))
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    config = StreamConfig(posts=0, comments=args.comments, modactions=0, duplicate_rate=0.0, seed=args.seed)
+    comments = [CommentEvent.from_praw(item) for _, item in SyntheticReddit(config).stream()]
+    print(f"{len(comments)} comments, {os.cpu_count()} CPUs")
+    seconds = run_inline(comments)
+    print(f"inline      {len(comments) / seconds:>9.0f} items/s")
+    for workers in args.workers:
+        seconds = run_pool(comments, workers, args.batch_size)
+        print(f"{workers:>2} workers  {len(comments) / seconds:>9.0f} items/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+# Synthetic Reddit objects for benchmarks
+# Plain attribute objects shaped like the praw models the savers read, with a
+# seeded generator so every run sees the same stream.
+
+import random
+import string
+from dataclasses import dataclass
+from itertools import accumulate
+from types import SimpleNamespace
+from typing import Any, Iterator, Optional
+
+
+class FakeRedditor(SimpleNamespace):
+    def __str__(self) -> str:
+        return self.name
+
+
+class FakeSubmission(SimpleNamespace):
+    pass
+
+
+class FakeComment(SimpleNamespace):
+    pass
+
+
+class FakeModAction(SimpleNamespace):
+    pass
+
+
+SUBREDDITS: tuple[str, ...] = ("python", "learnpython", "pythonhelp", "django")
+ACTIONS: tuple[str, ...] = ("removecomment", "removelink", "approvecomment", "approvelink", "spamcomment", "banuser", "editflair")
+WORDS: tuple[str, ...] = tuple(
+    "python list dict async import error help please code function class loop install pip venv "
+    "pandas numpy django flask test string file json api request thanks question why how".split()
+)
+
+
+@dataclass
+class StreamConfig:
+    posts: int = 500
+    comments: int = 5000
+    modactions: int = 500
+    users: int = 2000
+    # Zipf exponent of the author distribution: a few users write most items
+    author_skew: float = 1.1
+    # Share of items delivered a second time, as streams do around restarts
+    duplicate_rate: float = 0.05
+    # Share of items whose author deleted their account
+    deleted_rate: float = 0.03
+    # Share of comments on posts older than the generated ones
+    old_post_rate: float = 0.1
+    seed: int = 42
+    start: float = 1_750_000_000.0
+
+
+class SyntheticReddit:
+    """
+    Generates a reproducible, interleaved stream of posts, comments and mod
+    actions. Items come out as ``(stream, item)`` pairs in creation order, with
+    mod actions already wrapped in the ``{"modaction", "target"}`` dict the
+    savers take.
+    """
+
+    def __init__(self, config: Optional[StreamConfig] = None) -> None:
+        self.config: StreamConfig = config or StreamConfig()
+        self.rng: random.Random = random.Random(self.config.seed)
+        self.users: list[FakeRedditor] = [self._redditor(i) for i in range(self.config.users)]
+        weights = [1.0 / (rank + 1) ** self.config.author_skew for rank in range(self.config.users)]
+        self._cum_weights: list[float] = list(accumulate(weights))
+        self._posts: list[FakeSubmission] = []
+        self._clock: float = self.config.start
+
+    def _redditor(self, i: int) -> FakeRedditor:
+        return FakeRedditor(
+            name=f"user_{i}",
+            id=f"{i:x}",
+            fullname=f"t2_{i:x}",
+            link_karma=self.rng.randrange(100_000),
+            comment_karma=self.rng.randrange(100_000),
+            is_mod=i < 5,
+            icon_img=None,
+        )
+
+    def _author(self) -> Optional[FakeRedditor]:
+        if self.rng.random() < self.config.deleted_rate:
+            return None
+        return self.rng.choices(self.users, cum_weights=self._cum_weights)[0]
+
+    def _text(self, words: int) -> str:
+        return " ".join(self.rng.choices(WORDS, k=words))
+
+    def _tick(self) -> float:
+        self._clock += self.rng.expovariate(1.0)
+        return self._clock
+
+    def _id(self, prefix: str, n: int) -> str:
+        return f"{prefix}{n:06x}"
+
+    def post(self, n: int, created_utc: Optional[float] = None) -> FakeSubmission:
+        author = self._author()
+        return FakeSubmission(
+            id=self._id("p", n),
+            fullname=f"t3_{self._id('p', n)}",
+            title=self._text(self.rng.randint(4, 14)).capitalize(),
+            selftext=self._text(self.rng.randint(0, 120)),
+            created_utc=created_utc if created_utc is not None else self._tick(),
+            url=f"https://www.reddit.com/r/python/comments/{self._id('p', n)}/",
+            score=self.rng.randrange(500),
+            num_comments=0,
+            subreddit=self.rng.choice(SUBREDDITS),
+            author=author,
+            author_fullname=author.fullname if author else None,
+            link_flair_text=None,
+        )
+
+    def comment(self, n: int) -> FakeComment:
+        if not self._posts or self.rng.random() < self.config.old_post_rate:
+            submission = self.post(1_000_000 + n, created_utc=self.config.start - self.rng.randrange(86400))
+        else:
+            submission = self.rng.choice(self._posts[-50:])
+        author = self._author()
+        parent = f"t3_{submission.id}" if self.rng.random() < 0.4 else f"t1_{self._id('c', self.rng.randrange(max(n, 1)))}"
+        return FakeComment(
+            id=self._id("c", n),
+            fullname=f"t1_{self._id('c', n)}",
+            body=self._text(self.rng.randint(3, 80)),
+            created_utc=self._tick(),
+            score=self.rng.randrange(100),
+            parent_id=parent,
+            link_id=f"t3_{submission.id}",
+            subreddit=submission.subreddit,
+            submission=submission,
+            author=author,
+            author_fullname=author.fullname if author else None,
+        )
+
+    def modaction(self, n: int) -> dict[str, Any]:
+        mod = self.users[self.rng.randrange(5)]
+        target = self._author()
+        action = FakeModAction(
+            id=f"ModAction_{n:08x}-{''.join(self.rng.choices(string.hexdigits.lower(), k=8))}",
+            action=self.rng.choice(ACTIONS),
+            mod=mod,
+            mod_id36=mod.id,
+            target_author=target.name if target else "[deleted]",
+            target_fullname=f"t1_{self._id('c', self.rng.randrange(n + 1))}",
+            description=None,
+            details=self.rng.choice([None, "spam", "rule 1", "low effort"]),
+            created_utc=self._tick(),
+            subreddit=self.rng.choice(SUBREDDITS),
+        )
+        return {"modaction": action, "target": target or FakeRedditor(name="[deleted]", link_karma=0, comment_karma=0, is_mod=False, icon_img=None)}
+
+    def stream(self) -> Iterator[tuple[str, Any]]:
+        """Interleave the configured number of items in proportion, with duplicates."""
+        remaining = {"posts": self.config.posts, "comments": self.config.comments, "modactions": self.config.modactions}
+        made = {name: 0 for name in remaining}
+        recent: list[tuple[str, Any]] = []
+        while any(remaining.values()):
+            name = self.rng.choices(list(remaining), weights=list(remaining.values()))[0]
+            n = made[name]
+            if name == "posts":
+                item: Any = self.post(n)
+                self._posts.append(item)
+            elif name == "comments":
+                item = self.comment(n)
+            else:
+                item = self.modaction(n)
+            made[name] += 1
+            remaining[name] -= 1
+            recent.append((name, item))
+            recent = recent[-200:]
+            yield name, item
+            if self.rng.random() < self.config.duplicate_rate:
+                yield self.rng.choice(recent)
+
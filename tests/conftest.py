@@ -0,0 +1,46 @@
+import time
+from pathlib import Path
+from typing import Optional
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from PygBrother.events import CommentEvent, PostEvent, UserRef
+from PygBrother.models import Base
+from PygBrother.search import ensure_search_index
+
+
+@pytest.fixture
+def sqlite_engine(tmp_path: Path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'pygbrother.db'}")
+    Base.metadata.create_all(engine)
+    yield engine
+    engine.dispose()
+
+@pytest.fixture
+def search_engine(sqlite_engine: Engine) -> Engine:
+    assert ensure_search_index(sqlite_engine)
+    return sqlite_engine
+
+def _user(author: str | UserRef) -> UserRef:
+    return author if isinstance(author, UserRef) else UserRef(author)
+
+def post_event(
+    reddit_id: str, title: str = 'Hello', selftext: str = 'Body', subreddit: str = 'testsub',
+    author: str | UserRef = 'alice', created_utc: Optional[float] = None,
+) -> PostEvent:
+    return PostEvent(
+        id=reddit_id, fullname=f't3_{reddit_id}', title=title, selftext=selftext,
+        created_utc=time.time() if created_utc is None else created_utc,
+        url='', score=1, num_comments=0, subreddit=subreddit, author=_user(author),
+    )
+
+def comment_event(
+    reddit_id: str, post: PostEvent, body: str = 'Nice', author: str | UserRef = 'bob',
+    created_utc: Optional[float] = None, parent_id: Optional[str] = None,
+) -> CommentEvent:
+    """A comment on ``post``, replying to the post itself unless ``parent_id`` is given."""
+    return CommentEvent(
+        id=reddit_id, fullname=f't1_{reddit_id}', body=body, created_utc=time.time() if created_utc is None else created_utc,
+        score=1, parent_id=parent_id or post.fullname, link_id=post.fullname, subreddit=post.subreddit,
+        author=_user(author), submission=post,
+    )
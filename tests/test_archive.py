@@ -0,0 +1,86 @@
+import json
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import pyarrow.parquet as pq
+from sqlalchemy import select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+from PygBrother.archive import Archive, Archiver, get, query
+from PygBrother.batch_saver import BatchDatabaseSaver
+from PygBrother.events import ModActionEvent, UserRef
+from PygBrother.models import CommentModel, ModActionModel
+from PygBrother.search import search
+from conftest import comment_event, post_event
+
+NOW = datetime(2025, 6, 15, tzinfo=timezone.utc).timestamp()
+DAY = 24 * 3600
+
+PYTHON = post_event('p1', selftext='', subreddit='python', created_utc=NOW - 400 * DAY)
+RUST = post_event('p2', selftext='', subreddit='rust', created_utc=NOW - 400 * DAY)
+
+def save_history(Session: sessionmaker) -> None:
+    saver = BatchDatabaseSaver(Session, batch_size=100, flush_interval=0, search_index=True)
+    # Two months in r/python and one in r/rust are old enough to archive
+    saver.save_comment(comment_event('c1', PYTHON, 'archived words c1', 'bob', NOW - 200 * DAY))
+    saver.save_comment(comment_event('c2', PYTHON, 'archived words c2', 'carol', NOW - 198 * DAY))
+    saver.save_comment(comment_event('c3', PYTHON, 'archived words c3', 'bob', NOW - 250 * DAY))
+    saver.save_comment(comment_event('c4', RUST, 'archived words c4', 'bob', NOW - 220 * DAY))
+    saver.save_comment(comment_event('c5', PYTHON, 'archived words c5', 'bob', NOW - 10 * DAY))
+    saver.save_modaction(ModActionEvent(
+        id='m1', action='removecomment', mod=UserRef('mod1'), target_author='bob', target_fullname='t1_c3',
+        description=None, details=None, created_utc=NOW - 240 * DAY, subreddit='python',
+    ))
+    saver.close()
+
+
+def test_archiver_moves_old_rows_to_parquet(search_engine: Engine, tmp_path: Path):
+    Session = sessionmaker(bind=search_engine)
+    save_history(Session)
+    archiver = Archiver(Session, tmp_path / 'archive', after=timedelta(days=180), batch_size=2)
+    assert archiver.run_once(now=datetime.fromtimestamp(NOW, tz=timezone.utc)) == {'comments': 4, 'modactions': 1}
+    with Session() as session:
+        assert list(session.scalars(select(CommentModel.reddit_id))) == ['c5']
+        assert session.scalar(select(ModActionModel.id)) is None
+        # Archived comments leave the search index with the hot table
+        assert session.scalar(text("SELECT count(*) FROM search_fts WHERE rowid & 1 = 1")) == 1
+
+    manifest = json.loads((tmp_path / 'archive' / 'manifest.json').read_text())['files']
+    assert {(entry['table'], entry['subreddit'], entry['month']) for entry in manifest} == {
+        ('comments', 'python', '2024-10'), ('comments', 'python', '2024-11'), ('comments', 'rust', '2024-11'),
+        ('modactions', 'python', '2024-10'),
+    }
+    assert sum(entry['rows'] for entry in manifest if entry['table'] == 'comments') == 4
+    for entry in manifest:
+        assert entry['path'].startswith(f"{entry['table']}/subreddit={entry['subreddit']}/month={entry['month']}/")
+        metadata = pq.ParquetFile(tmp_path / 'archive' / entry['path']).metadata
+        assert metadata.row_group(0).column(0).compression == 'ZSTD'
+    # Nothing is left to archive
+    assert archiver.run_once(now=datetime.fromtimestamp(NOW, tz=timezone.utc)) == {'comments': 0, 'modactions': 0}
+
+
+def test_query_reads_archive_and_live_table(search_engine: Engine, tmp_path: Path):
+    Session = sessionmaker(bind=search_engine)
+    save_history(Session)
+    Archiver(Session, tmp_path / 'archive', after=timedelta(days=180)).run_once(now=datetime.fromtimestamp(NOW, tz=timezone.utc))
+    # A fresh Archive reads the manifest back
+    archive = Archive(tmp_path / 'archive')
+    with Session() as session:
+        bob = query(session, archive, 'comments', subreddit='python', where={'author_id': 'bob'})
+        assert [row['reddit_id'] for row in bob] == ['c5', 'c1', 'c3']
+        assert all(row['created_utc'].tzinfo is not None for row in bob)
+        since = datetime.fromtimestamp(NOW - 210 * DAY, tz=timezone.utc)
+        assert [row['reddit_id'] for row in query(session, archive, 'comments', since=since)] == ['c5', 'c2', 'c1']
+        assert len(archive.select('comments', since=since)) == 1
+        assert [row['reddit_id'] for row in query(session, archive, 'comments', limit=2)] == ['c5', 'c2']
+        assert get(session, archive, 'comments', 'c4')['subreddit'] == 'rust'
+        assert get(session, archive, 'modactions', 'm1')['target_author_id'] == 'bob'
+        assert get(session, archive, 'comments', 'missing') is None
+        assert [hit.item.reddit_id for hit in search(session, 'archived words')] == ['c5']
+
+    # Fetched again after it was archived: returned once, from the live table
+    saver = BatchDatabaseSaver(Session, batch_size=100, flush_interval=0)
+    saver.save_comment(comment_event('c4', RUST, 'archived words c4', 'bob', NOW - 220 * DAY))
+    saver.close()
+    with Session() as session:
+        rows = query(session, archive, 'comments', where={'reddit_id': 'c4'})
+        assert len(rows) == 1 and rows[0]['id'] == session.scalar(select(CommentModel.id).where(CommentModel.reddit_id == 'c4'))
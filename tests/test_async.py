@@ -0,0 +1,117 @@
+import asyncio
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator
+import asyncpraw
+import asyncprawcore
+from asyncpraw.models import Submission
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from PygBrother.async_fetcher import AsyncPublisher, AsyncRedditFetcher
+from PygBrother.async_main import async_database_url, prepare_database
+from PygBrother.async_saver import AsyncDatabaseSaver
+from PygBrother.events import ModActionEvent, PostEvent, UserRef
+from PygBrother.models import CommentModel, ModActionModel, PostModel, UserModel
+from conftest import comment_event, post_event
+
+NOW = time.time()
+
+
+def test_async_database_url():
+    assert async_database_url('postgresql+psycopg2://u:p@localhost:5432/db') == 'postgresql+asyncpg://u:p@localhost:5432/db'
+    assert async_database_url('sqlite:///pygbrother.db') == 'sqlite+aiosqlite:///pygbrother.db'
+
+
+def test_async_saver_writes_batches(tmp_path: Path):
+    async def scenario() -> None:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'async.db'}")
+        await prepare_database(engine)
+        saver = AsyncDatabaseSaver(async_sessionmaker(engine), batch_size=3, flush_interval=0.05)
+        saver.start()
+        post = post_event('p1')
+        await saver.save_post(post)
+        await saver.save_comment(comment_event('c1', post))
+        # A stub of a post we never saw, built from the comment alone
+        await saver.save_comment(comment_event('c2', post_event('p2')))
+        assert saver.pending() == 0
+        await saver.save_modaction(ModActionEvent(
+            id='ModAction_1', action='removecomment', mod=UserRef('mod1', 't2_m1'), target_author='bob',
+            target_fullname='t1_c1', description=None, details='spam', created_utc=NOW, subreddit='testsub',
+        ))
+        await saver.save_post(post)
+        await asyncio.sleep(0.2)
+        assert saver.pending() == 0
+        await saver.close()
+        async with engine.connect() as connection:
+            assert set(await connection.scalars(select(PostModel.reddit_id))) == {'p1', 'p2'}
+            assert set(await connection.scalars(select(CommentModel.reddit_id))) == {'c1', 'c2'}
+            assert list(await connection.scalars(select(ModActionModel.mod))) == ['mod1']
+            assert set(await connection.scalars(select(UserModel.name))) == {'alice', 'bob', 'mod1'}
+        await engine.dispose()
+
+    asyncio.run(scenario())
+
+
+def test_async_publisher_keeps_key_order_and_isolates_failures():
+    async def scenario() -> None:
+        publisher: AsyncPublisher[tuple[str, int]] = AsyncPublisher("test", workers=3, maxsize=6, key=lambda item: item[0])
+        seen: list[tuple[str, int]] = []
+
+        async def slow(item: tuple[str, int]) -> None:
+            await asyncio.sleep(0.001 * (item[1] % 3))
+            seen.append(item)
+
+        def failing(item: tuple[str, int]) -> None:
+            raise RuntimeError("boom")
+
+        publisher.subscribe(failing)
+        publisher.subscribe(slow)
+        for i in range(30):
+            await publisher.notify(("abc"[i % 3], i))
+        await publisher.close()
+        assert len(seen) == 30
+        for key in "abc":
+            assert [i for k, i in seen if k == key] == [i for i in range(30) if "abc"[i % 3] == key]
+
+    asyncio.run(scenario())
+
+
+def test_fetcher_reopens_stream_after_error():
+    async def scenario() -> None:
+        reddit = asyncpraw.Reddit(client_id='x', client_secret='y', user_agent='PygBrother tests')
+        fetcher = AsyncRedditFetcher(reddit, ['testsub'], 'tester', requests_per_minute=6000)
+        fetcher.min_backoff = fetcher.max_backoff = 0.01
+        opened: list[str] = []
+        published: list[Any] = []
+
+        def submission(reddit_id: str) -> Submission:
+            return Submission(reddit, _data={
+                'id': reddit_id, 'name': f't3_{reddit_id}', 'title': 'Hello', 'selftext': '', 'created_utc': NOW,
+                'url': '', 'score': 1, 'num_comments': 0, 'subreddit': 'testsub', 'author': 'alice',
+            })
+
+        async def stream(name: str) -> AsyncIterator[Any]:
+            if name != "posts":
+                while True:
+                    yield None
+            first = opened.count(name) == 1
+            yield submission('p1' if first else 'p2')
+            if first:
+                raise asyncprawcore.exceptions.ServerError(type('Response', (), {'status': 503})())
+            yield None
+            fetcher.stop()
+            yield None
+
+        def open_stream(name: str) -> AsyncIterator[Any]:
+            opened.append(name)
+            return stream(name)
+
+        fetcher._open_stream = open_stream  # type: ignore[method-assign]
+        fetcher.post_publisher.subscribe(published.append)
+        await asyncio.wait_for(fetcher.run(), 5)
+        assert [post.id for post in published] == ['p1', 'p2']
+        assert all(isinstance(post, PostEvent) for post in published)
+        assert opened.count("posts") == 2
+        await reddit.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,91 @@
+import pytest
+from datetime import datetime, timezone
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from PygBrother.models import PostModel, BackfillCursorModel
+from PygBrother.batch_saver import BatchDatabaseSaver
+from PygBrother.backfill import Backfiller
+from PygBrother.scheduler import RateLimiter
+
+START = datetime(2025, 6, 1, tzinfo=timezone.utc).timestamp()
+
+def make_submission(i: int) -> MagicMock:
+    author = MagicMock()
+    author.name = f'user{i % 3}'
+    author.link_karma = 1
+    author.comment_karma = 2
+    author.is_mod = False
+    author.icon_img = None
+    post = MagicMock()
+    post.id = f'p{i}'
+    post.fullname = f't3_p{i}'
+    post.title = f'Post {i}'
+    post.selftext = ''
+    post.created_utc = START - i * 3600
+    post.url = 'http://reddit.com/post'
+    post.score = 1
+    post.num_comments = 0
+    post.subreddit = 'testsub'
+    post.author = author
+    return post
+
+@pytest.fixture
+def fake_fetcher():
+    # Newest first, one post per hour going back 50 hours
+    posts = [make_submission(i) for i in range(50)]
+    calls: list[dict[str, str]] = []
+    def new(limit: int, params: dict[str, str]):
+        calls.append(params)
+        start = 0
+        if 'after' in params:
+            start = next(i for i, p in enumerate(posts) if p.fullname == params['after']) + 1
+        return iter(posts[start:start + limit])
+    subreddit = SimpleNamespace(display_name='testsub', new=new)
+    return SimpleNamespace(subreddit=subreddit, rate_limiter=RateLimiter(60000), max_backoff=0.01, calls=calls)
+
+
+def test_backfill_pages_until_date_and_saves_cursor(sqlite_engine: Engine, fake_fetcher: SimpleNamespace):
+    Session = sessionmaker(bind=sqlite_engine)
+    saver = BatchDatabaseSaver(Session, batch_size=1000, flush_interval=0)
+    until = datetime.fromtimestamp(START - 24.5 * 3600, tz=timezone.utc)
+    Backfiller(fake_fetcher, saver, Session, until=until, page_size=10).run(["posts"])
+    with Session() as session:
+        assert session.query(PostModel).count() == 25
+        cursor = session.query(BackfillCursorModel).filter_by(subreddit='testsub', stream='posts').one()
+        assert cursor.done == 1
+        assert cursor.items == 25
+        assert cursor.cursor == 't3_p24'
+    assert len(fake_fetcher.calls) == 3
+
+def test_backfill_resumes_from_cursor(sqlite_engine: Engine, fake_fetcher: SimpleNamespace):
+    Session = sessionmaker(bind=sqlite_engine)
+    with Session() as session:
+        session.add(BackfillCursorModel(subreddit='testsub', stream='posts', cursor='t3_p39', items=40, done=0))
+        session.commit()
+    saver = BatchDatabaseSaver(Session, batch_size=1000, flush_interval=0)
+    Backfiller(fake_fetcher, saver, Session, page_size=100).run(["posts"])
+    assert fake_fetcher.calls[0] == {'after': 't3_p39'}
+    with Session() as session:
+        assert session.query(PostModel).count() == 10
+        assert session.query(BackfillCursorModel).one().items == 50
+    # A finished backfill is not redone
+    Backfiller(fake_fetcher, saver, Session).run(["posts"])
+    assert len(fake_fetcher.calls) == 2
+
+def test_backfill_stops_when_an_automatic_flush_fails(sqlite_engine: Engine, fake_fetcher: SimpleNamespace):
+    Session = sessionmaker(bind=sqlite_engine)
+    def failing_session():
+        session = Session()
+        def commit() -> None:
+            raise OperationalError("COMMIT", {}, Exception("disk full"))
+        session.commit = commit  # type: ignore[method-assign]
+        return session
+    # A full page fills the batch, so the saver flushes it before the backfiller does
+    saver = BatchDatabaseSaver(failing_session, batch_size=10, flush_interval=0)
+    Backfiller(fake_fetcher, saver, Session, page_size=10).run(["posts"])
+    assert len(fake_fetcher.calls) == 1
+    with Session() as session:
+        assert session.query(BackfillCursorModel).count() == 0
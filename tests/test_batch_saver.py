@@ -0,0 +1,116 @@
+import time
+import pytest
+from unittest.mock import MagicMock
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker, Session
+from PygBrother.models import UserModel, PostModel, CommentModel, ModActionModel
+from PygBrother.batch_saver import BatchDatabaseSaver
+
+@pytest.fixture
+def db_session(sqlite_engine: Engine):
+    session = sessionmaker(bind=sqlite_engine)()
+    yield session
+    session.close()
+
+@pytest.fixture
+def batch_saver(sqlite_engine: Engine):
+    saver = BatchDatabaseSaver(sessionmaker(bind=sqlite_engine), batch_size=100, flush_interval=0)
+    yield saver
+    saver.close()
+
+def make_redditor(name: str) -> MagicMock:
+    user = MagicMock()
+    user.name = name
+    user.link_karma = 1
+    user.comment_karma = 2
+    user.is_mod = False
+    user.icon_img = None
+    return user
+
+def make_submission(post_id: str, author: MagicMock) -> MagicMock:
+    post = MagicMock()
+    post.id = post_id
+    post.title = f'Post {post_id}'
+    post.selftext = 'Body of post'
+    post.created_utc = time.time()
+    post.url = 'http://reddit.com/post'
+    post.score = 1
+    post.num_comments = 0
+    post.subreddit = 'testsub'
+    post.author = author
+    return post
+
+def make_comment(comment_id: str, author: MagicMock, submission: MagicMock) -> MagicMock:
+    comment = MagicMock()
+    comment.id = comment_id
+    comment.body = f'Comment {comment_id}'
+    comment.created_utc = time.time()
+    comment.score = 1
+    comment.parent_id = f't3_{submission.id}'
+    comment.subreddit = 'testsub'
+    comment.author = author
+    comment.submission = submission
+    return comment
+
+
+def test_buffers_until_flush(batch_saver: BatchDatabaseSaver, db_session: Session):
+    author = make_redditor('alice')
+    batch_saver.save_post(make_submission('p1', author))
+    assert batch_saver.pending() == 1
+    assert db_session.query(PostModel).count() == 0
+    batch_saver.flush()
+    assert batch_saver.pending() == 0
+    assert db_session.query(PostModel).filter_by(reddit_id='p1').first() is not None
+    assert db_session.query(UserModel).filter_by(reddit_id='alice').first() is not None
+
+def test_flushes_when_batch_is_full(sqlite_engine: Engine, db_session: Session):
+    saver = BatchDatabaseSaver(sessionmaker(bind=sqlite_engine), batch_size=3, flush_interval=0)
+    author = make_redditor('alice')
+    for i in range(3):
+        saver.save_post(make_submission(f'p{i}', author))
+    assert saver.pending() == 0
+    assert db_session.query(PostModel).count() == 3
+    assert db_session.query(UserModel).count() == 1
+
+def test_comments_bring_their_post_and_users(batch_saver: BatchDatabaseSaver, db_session: Session):
+    poster = make_redditor('poster')
+    commenter = make_redditor('commenter')
+    submission = make_submission('p1', poster)
+    for i in range(5):
+        batch_saver.save_comment(make_comment(f'c{i}', commenter, submission))
+    batch_saver.flush()
+    assert db_session.query(CommentModel).count() == 5
+    assert db_session.query(PostModel).count() == 1
+    assert {u.reddit_id for u in db_session.query(UserModel)} == {'poster', 'commenter'}
+
+def test_duplicates_across_batches_are_ignored(batch_saver: BatchDatabaseSaver, db_session: Session):
+    author = make_redditor('alice')
+    submission = make_submission('p1', author)
+    comment = make_comment('c1', author, submission)
+    batch_saver.save_comment(comment)
+    batch_saver.flush()
+    batch_saver.save_comment(comment)
+    batch_saver.save_post(submission)
+    batch_saver.flush()
+    assert db_session.query(CommentModel).count() == 1
+    assert db_session.query(PostModel).count() == 1
+    assert db_session.query(UserModel).count() == 1
+
+def test_save_modaction(batch_saver: BatchDatabaseSaver, db_session: Session):
+    modaction = MagicMock()
+    modaction.id = 'ModAction_1'
+    modaction.action = 'removecomment'
+    modaction.mod = make_redditor('moderator')
+    modaction.mod.id = 'm1'
+    modaction.target_author = 'target'
+    modaction.target_fullname = 't1_c1'
+    modaction.description = None
+    modaction.details = 'remove'
+    modaction.created_utc = time.time()
+    modaction.subreddit = 'testsub'
+    batch_saver.save_modaction({"modaction": modaction, "target": make_redditor('target')})
+    batch_saver.flush()
+    saved = db_session.query(ModActionModel).filter_by(reddit_id='ModAction_1').first()
+    assert saved is not None
+    assert saved.target_author_id == 'target'
+    assert {u.reddit_id for u in db_session.query(UserModel)} == {'moderator', 'target'}
@@ -0,0 +1,46 @@
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from PygBrother.batch_saver import BatchDatabaseSaver
+from PygBrother.bulk_loader import copy_buffer, copy_supported
+from PygBrother.events import CommentEvent, PostEvent, UserRef
+from PygBrother.models import Base, CommentModel, PostModel
+
+NOW = time.time()
+
+
+def test_copy_buffer_escapes_text_format():
+    rows = [
+        {'reddit_id': 'c1', 'body': 'tab\there\nnew line \\ backslash', 'score': 3, 'created_utc': datetime(2025, 1, 2, 3, 4, 5, tzinfo=timezone.utc)},
+        {'reddit_id': 'c2', 'body': None, 'score': 0, 'created_utc': None},
+    ]
+    lines = copy_buffer(rows, ['reddit_id', 'body', 'score', 'created_utc']).read().splitlines()
+    assert lines == [
+        'c1\ttab\\there\\nnew line \\\\ backslash\t3\t2025-01-02T03:04:05+00:00',
+        'c2\t\\N\t0\t\\N',
+    ]
+
+
+def test_copy_threshold_falls_back_to_executemany_on_sqlite(tmp_path: Path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'bulk.db'}")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as session:
+        assert not copy_supported(session)
+    saver = BatchDatabaseSaver(Session, batch_size=1000, flush_interval=0, copy_threshold=1)
+    post = PostEvent(
+        id='p1', fullname='t3_p1', title='Hello', selftext=None, created_utc=NOW, url='', score=1,
+        num_comments=0, subreddit='testsub', author=UserRef('alice'),
+    )
+    for i in range(50):
+        saver.save_comment(CommentEvent(
+            id=f'c{i}', fullname=f't1_c{i}', body='Nice', created_utc=NOW, score=1, parent_id='t3_p1',
+            link_id='t3_p1', subreddit='testsub', author=UserRef('bob'), submission=post,
+        ))
+    saver.close()
+    with Session() as session:
+        assert session.query(PostModel).count() == 1
+        assert session.query(CommentModel).count() == 50
+    engine.dispose()
@@ -0,0 +1,153 @@
+from collections import OrderedDict
+import time
+from threading import Event, Lock, Thread
+from types import SimpleNamespace
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+from PygBrother.batch_saver import BatchDatabaseSaver
+from PygBrother.events import PostEvent, UserRef
+from PygBrother.models import StreamCheckpointModel
+from PygBrother.checkpoints import Checkpoint, CheckpointStore
+from PygBrother.reddit_fetcher import Publisher, RedditFetcher
+from PygBrother.scheduler import RateLimiter
+
+START = 1_750_000_000.0
+
+def make_post(i: int) -> SimpleNamespace:
+    return SimpleNamespace(id=f'p{i}', fullname=f't3_p{i}', title=f'Post {i}', author=None, created_utc=START + i * 60, subreddit='testsub')
+
+def make_fetcher(posts: list[SimpleNamespace], store: CheckpointStore) -> tuple[RedditFetcher, list[dict[str, str]]]:
+    # Listing of 250 posts, newest first, answering before= and after= like Reddit does
+    newest_first = list(reversed(posts))
+    calls: list[dict[str, str]] = []
+    def new(limit: int, params: dict[str, str]):
+        calls.append(dict(params))
+        if 'before' in params:
+            end = next(i for i, p in enumerate(newest_first) if p.fullname == params['before'])
+            return iter(newest_first[max(0, end - limit):end])
+        start = 0
+        if 'after' in params:
+            start = next(i for i, p in enumerate(newest_first) if p.fullname == params['after']) + 1
+        return iter(newest_first[start:start + limit])
+    fetcher = RedditFetcher.__new__(RedditFetcher)
+    fetcher.subreddit = SimpleNamespace(display_name='testsub', new=new)
+    fetcher.subreddit_names = ['testsub']
+    fetcher.rate_limiter = RateLimiter(60000)
+    fetcher.stop_event = Event()
+    fetcher.stream_lag = {}
+    fetcher.checkpoints = store
+    fetcher._resume_after = {}
+    fetcher._handed_out = {name: OrderedDict() for name in ("posts", "comments", "modactions")}
+    fetcher.events = False
+    fetcher.post_publisher = Publisher()
+    return fetcher, calls
+
+
+def test_store_keeps_newest_position_and_flushes(sqlite_engine: Engine):
+    Session = sessionmaker(bind=sqlite_engine)
+    store = CheckpointStore(Session, flush_interval=3600)
+    store.update("posts", "TestSub", "t3_b", START + 60)
+    store.update("posts", "testsub", "t3_a", START)
+    with Session() as session:
+        assert session.query(StreamCheckpointModel).count() == 0
+    store.flush()
+    assert store.load("posts", ["testsub"]) == {'testsub': Checkpoint("t3_b", START + 60)}
+    store.update("posts", "testsub", "t3_c", START + 120)
+    store.flush()
+    with Session() as session:
+        assert session.query(StreamCheckpointModel).one().fullname == "t3_c"
+
+def test_catch_up_replays_gap_oldest_first(sqlite_engine: Engine):
+    Session = sessionmaker(bind=sqlite_engine)
+    store = CheckpointStore(Session, flush_interval=3600)
+    posts = [make_post(i) for i in range(250)]
+    store.update("posts", "testsub", posts[9].fullname, posts[9].created_utc)
+    store.flush()
+    fetcher, calls = make_fetcher(posts, store)
+    received: list[int] = []
+    fetcher.post_publisher.subscribe(lambda post: received.append(int(post.id[1:])))
+    fetcher.catch_up()
+    assert received == list(range(10, 250))
+    assert calls[0] == {'before': 't3_p9'}
+    # The live stream drops what the catch-up already handed out
+    live = fetcher._skip_handed_out("posts", iter([posts[248], None, posts[249], make_post(250)]))
+    assert [post.id if post else None for post in live] == [None, 'p250']
+    store.flush()
+    assert store.load("posts", ["testsub"])["testsub"].fullname == 't3_p249'
+
+def test_catch_up_falls_back_when_checkpoint_item_is_gone(sqlite_engine: Engine):
+    Session = sessionmaker(bind=sqlite_engine)
+    store = CheckpointStore(Session, flush_interval=3600)
+    posts = [make_post(i) for i in range(30)]
+    # The checkpointed post was deleted, so before= has nothing to anchor on
+    store.update("posts", "testsub", "t3_deleted", posts[20].created_utc - 1)
+    store.flush()
+    fetcher, calls = make_fetcher(posts, store)
+    fetcher.subreddit.new = lambda limit, params, new=fetcher.subreddit.new: iter([]) if 'before' in params else new(limit, params)
+    received: list[str] = []
+    fetcher.post_publisher.subscribe(lambda post: received.append(post.id))
+    fetcher.catch_up()
+    assert received == [f'p{i}' for i in range(20, 30)]
+
+def test_checkpoint_waits_for_saver_commit(sqlite_engine: Engine):
+    Session = sessionmaker(bind=sqlite_engine)
+    store = CheckpointStore(Session, flush_interval=3600, wait_for_commit=True)
+    fetcher, _ = make_fetcher([], store)
+    saver = BatchDatabaseSaver(Session, batch_size=100, flush_interval=0, on_commit=store.confirm)
+    fetcher.post_publisher.subscribe(saver.save_post)
+    posts = [PostEvent(
+        id=f'p{i}', fullname=f't3_p{i}', title=f'Post {i}', selftext='', created_utc=START + i * 60,
+        url='', score=1, num_comments=0, subreddit='testsub', author=UserRef('alice'),
+    ) for i in range(3)]
+    for post in posts:
+        fetcher._process_post(post)
+    # Handed out but only buffered: a crash now must not skip them on restart
+    store.flush()
+    assert store.load("posts", ["testsub"]) == {}
+    assert saver.flush()
+    store.flush()
+    assert store.load("posts", ["testsub"])["testsub"].fullname == 't3_p2'
+
+    # Confirmed out of order, the checkpoint stops before the first unsaved item
+    for i in (3, 4):
+        store.expect("posts", "testsub", f't3_p{i}', START + i * 60)
+    store.confirm("posts", ['t3_p4'])
+    store.flush()
+    assert store.load("posts", ["testsub"])["testsub"].fullname == 't3_p2'
+    store.confirm("posts", ['t3_p3'])
+    store.flush()
+    assert store.load("posts", ["testsub"])["testsub"].fullname == 't3_p4'
+
+def test_streams_reopen_on_the_new_subreddit_after_a_recheck():
+    opened: list[tuple[str, dict]] = []
+    def combined(name: str) -> SimpleNamespace:
+        def comments(**options):
+            opened.append((name, options))
+            while True:
+                yield None
+        return SimpleNamespace(display_name=name, stream=SimpleNamespace(comments=comments))
+    fetcher = RedditFetcher.__new__(RedditFetcher)
+    fetcher.subreddit = combined('a+b')
+    fetcher.rate_limiter = RateLimiter(60000)
+    fetcher.stop_event = Event()
+    fetcher.min_backoff = fetcher.max_backoff = 0.01
+    fetcher._stream_enabled = {'comments': Event()}
+    fetcher._stream_enabled['comments'].set()
+    fetcher._recheck_lock = Lock()
+    fetcher._resume_after = {}
+    fetcher._handed_out = {'comments': OrderedDict()}
+    fetcher._opened_utc = {}
+    fetcher._subreddit_generation = 0
+    thread = Thread(target=fetcher._poll_stream, args=('comments', fetcher._open_stream('comments'), lambda item: None))
+    thread.start()
+    # Another stream lost r/b and rebuilt the combined subreddit
+    fetcher.subreddit = combined('a')
+    fetcher._subreddit_generation += 1
+    time.sleep(0.2)
+    fetcher.stop_event.set()
+    thread.join()
+    assert [name for name, _ in opened] == ['a+b', 'a']
+    assert opened[0][1]['skip_existing']
+    # Nothing was handed out yet: keep what arrived since the first open instead of skipping it
+    assert not opened[1][1]['skip_existing']
+    assert fetcher._resume_after['comments'] == fetcher._opened_utc['comments']
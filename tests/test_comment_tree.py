@@ -0,0 +1,75 @@
+import time
+import pytest
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+from PygBrother.batch_saver import BatchDatabaseSaver
+from PygBrother.comment_tree import ancestors, rebuild_comment_tree, subtree, thread
+from PygBrother.db_saver import DatabaseSaver
+from PygBrother.models import CommentTreeModel
+from conftest import comment_event, post_event
+
+NOW = time.time()
+
+POST = post_event('p1', created_utc=NOW)
+
+# c1 ── c2 ── c3 ── c4
+#   └── c5
+# c6
+THREAD = {'c1': 't3_p1', 'c2': 't1_c1', 'c3': 't1_c2', 'c4': 't1_c3', 'c5': 't1_c1', 'c6': 't3_p1'}
+# Children before their parents, across several batches
+ARRIVALS = [['c4', 'c6'], ['c3', 'c5'], ['c2'], ['c1']]
+
+def stored_paths(engine: Engine) -> dict[str, tuple[str, int, str | None]]:
+    with engine.connect() as connection:
+        return {
+            row.reddit_id: (row.path, row.depth, row.pending_parent)
+            for row in connection.execute(select(CommentTreeModel.__table__))
+        }
+
+EXPECTED = {
+    'c1': ('c1/', 0, None), 'c2': ('c1/c2/', 1, None), 'c3': ('c1/c2/c3/', 2, None),
+    'c4': ('c1/c2/c3/c4/', 3, None), 'c5': ('c1/c5/', 1, None), 'c6': ('c6/', 0, None),
+}
+
+
+@pytest.mark.parametrize("batched", [False, True])
+def test_savers_graft_children_that_arrive_first(sqlite_engine: Engine, batched: bool):
+    Session = sessionmaker(bind=sqlite_engine)
+    saver: DatabaseSaver | BatchDatabaseSaver
+    if batched:
+        saver = BatchDatabaseSaver(Session, batch_size=100, flush_interval=0, comment_tree=True)
+    else:
+        saver = DatabaseSaver(Session, comment_tree=True)
+    for batch in ARRIVALS:
+        for reddit_id in batch:
+            saver.save_comment(comment_event(reddit_id, POST, created_utc=NOW, parent_id=THREAD[reddit_id]))
+        if batched:
+            saver.flush()
+        if batch == ['c3', 'c5']:
+            # c3 waits for c2, c5 for c1; c4 now hangs below c3
+            paths = stored_paths(sqlite_engine)
+            assert paths['c3'] == ('c2/c3/', 1, 'c2')
+            assert paths['c4'] == ('c2/c3/c4/', 2, None)
+    if batched:
+        saver.close()
+    assert stored_paths(sqlite_engine) == EXPECTED
+
+
+def test_subtree_ancestors_and_rebuild(sqlite_engine: Engine):
+    Session = sessionmaker(bind=sqlite_engine)
+    saver = BatchDatabaseSaver(Session, batch_size=100, flush_interval=0, comment_tree=True)
+    for reddit_id, parent_id in THREAD.items():
+        saver.save_comment(comment_event(reddit_id, POST, created_utc=NOW, parent_id=parent_id))
+    saver.close()
+    with Session() as session:
+        assert [(comment.reddit_id, depth) for comment, depth in subtree(session, 'c1')] == [
+            ('c1', 0), ('c2', 1), ('c3', 2), ('c4', 3), ('c5', 1),
+        ]
+        assert [(comment.reddit_id, depth) for comment, depth in subtree(session, 'c2', max_depth=1)] == [('c2', 0), ('c3', 1)]
+        assert [comment.reddit_id for comment in ancestors(session, 'c4')] == ['c1', 'c2', 'c3']
+        assert ancestors(session, 'c6') == []
+        assert [comment.reddit_id for comment, _ in thread(session, 'p1')] == ['c1', 'c2', 'c3', 'c4', 'c5', 'c6']
+        assert rebuild_comment_tree(session, batch_size=2) == 6
+        session.commit()
+    assert stored_paths(sqlite_engine) == EXPECTED
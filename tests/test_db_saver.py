@@ -4,6 +4,10 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from PygBrother.models import Base, UserModel, PostModel, CommentModel
 from PygBrother.db_saver import DatabaseSaver
+from PygBrother.batch_saver import BatchDatabaseSaver
+from PygBrother.bulk_loader import copy_supported
+from PygBrother.events import CommentEvent, PostEvent, UserRef
+from PygBrother.search import ensure_search_index, search
 from unittest.mock import MagicMock
 import time
 from testcontainers.postgres import PostgresContainer
@@ -120,3 +124,41 @@ def test_multi_save_comment(db_saver: DatabaseSaver, db_session: Session, mock_c
     assert user is not None
     post = db_session.query(PostModel).filter_by(reddit_id=mock_comment.submission.id).first()
     assert post is not None
+
+def test_batch_saver_copies_large_batches(pg_engine: Engine, db_session: Session):
+    Session = sessionmaker(bind=pg_engine)
+    assert copy_supported(db_session)
+    post = PostEvent(
+        id='copy1', fullname='t3_copy1', title='Copied', selftext='tab\there', created_utc=time.time(), url='',
+        score=1, num_comments=0, subreddit='testsub', author=UserRef('copyuser'),
+    )
+    for attempt in range(2):
+        # The second run conflicts with every stored row
+        saver = BatchDatabaseSaver(Session, batch_size=1000, flush_interval=0, copy_threshold=10)
+        for i in range(100):
+            saver.save_comment(CommentEvent(
+                id=f'copy{i}', fullname=f't1_copy{i}', body=f'line\nbreak {i}', created_utc=time.time(), score=i,
+                parent_id='t3_copy1', link_id='t3_copy1', subreddit='testsub', author=UserRef('copyuser'), submission=post,
+            ))
+        saver.close()
+    assert db_session.query(CommentModel).filter(CommentModel.post_id == 'copy1').count() == 100
+    assert db_session.query(CommentModel).filter_by(reddit_id='copy7').one().body == 'line\nbreak 7'
+    assert db_session.query(PostModel).filter_by(reddit_id='copy1').one().body == 'tab\there'
+
+def test_search_index_on_postgres(pg_engine: Engine, db_session: Session):
+    Session = sessionmaker(bind=pg_engine)
+    assert ensure_search_index(pg_engine)
+    post = PostEvent(
+        id='fts1', fullname='t3_fts1', title='Tsvector ranking', selftext='GIN indexes make this fast', created_utc=time.time(),
+        url='', score=1, num_comments=0, subreddit='ftssub', author=UserRef('ftsuser'),
+    )
+    saver = BatchDatabaseSaver(Session, batch_size=100, flush_interval=0, search_index=True)
+    saver.save_post(post)
+    saver.save_comment(CommentEvent(
+        id='fts2', fullname='t1_fts2', body='Ranking comments by indexes', created_utc=time.time(), score=1,
+        parent_id='t3_fts1', link_id='t3_fts1', subreddit='ftssub', author=UserRef('ftsuser'), submission=post,
+    ))
+    saver.close()
+    hits = search(db_session, 'ranking indexes', subreddit='ftssub')
+    assert [hit.item.reddit_id for hit in hits] == ['fts1', 'fts2']
+    assert [hit.item.reddit_id for hit in search(db_session, 'ranking -tsvector', subreddit='ftssub')] == ['fts2']
@@ -0,0 +1,101 @@
+import pickle
+import time
+import dataclasses
+from datetime import timezone
+import pytest
+import praw
+from praw.models import Comment, ModAction, Submission
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+from PygBrother.events import CommentEvent, ModActionEvent, PostEvent, UserRef
+from PygBrother.models import CommentModel, ModActionModel, PostModel, UserModel
+from PygBrother.batch_saver import BatchDatabaseSaver
+from PygBrother.db_saver import DatabaseSaver
+from PygBrother.reddit_fetcher import submission_key, subreddit_of
+
+NOW = time.time()
+
+@pytest.fixture
+def reddit():
+    # Never authenticates: any request would fail the test
+    return praw.Reddit(client_id='x', client_secret='y', user_agent='PygBrother tests')
+
+def make_submission(reddit: praw.Reddit) -> Submission:
+    return Submission(reddit, _data={
+        'id': 'p1', 'name': 't3_p1', 'title': 'Hello', 'selftext': 'Body', 'created_utc': NOW - 60,
+        'url': 'https://www.reddit.com/r/testsub/comments/p1/', 'score': 3, 'num_comments': 1,
+        'subreddit': 'testsub', 'author': 'alice', 'author_fullname': 't2_a1',
+    })
+
+def make_comment(reddit: praw.Reddit) -> Comment:
+    return Comment(reddit, _data={
+        'id': 'c1', 'name': 't1_c1', 'body': 'Nice post', 'created_utc': NOW, 'score': 1,
+        'parent_id': 't3_p2', 'link_id': 't3_p2', 'link_title': 'Older post', 'link_author': 'carol',
+        'link_url': 'https://www.reddit.com/r/testsub/comments/p2/', 'num_comments': 4,
+        'subreddit': 'testsub', 'author': 'bob', 'author_fullname': 't2_b1',
+    })
+
+def make_modaction(reddit: praw.Reddit) -> ModAction:
+    return ModAction(reddit, _data={
+        'id': 'ModAction_1', 'action': 'removecomment', 'mod': 'mod1', 'mod_id36': 'm1',
+        'target_author': 'bob', 'target_fullname': 't1_c1', 'description': None, 'details': 'spam',
+        'created_utc': NOW, 'subreddit': 'testsub',
+    })
+
+
+def test_events_are_compact_immutable_and_picklable(reddit: praw.Reddit):
+    comment = CommentEvent.from_praw(make_comment(reddit))
+    assert comment.author == UserRef('bob', 't2_b1')
+    assert comment.submission == PostEvent(
+        id='p2', fullname='t3_p2', title='Older post', selftext=None, created_utc=None,
+        url='https://www.reddit.com/r/testsub/comments/p2/', score=0, num_comments=4,
+        subreddit='testsub', author=UserRef('carol'),
+    )
+    assert not hasattr(comment, '__dict__')
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        comment.body = 'edited'  # type: ignore[misc]
+    assert pickle.loads(pickle.dumps(comment)) == comment
+    modaction = ModActionEvent.from_praw(make_modaction(reddit))
+    assert modaction.mod == UserRef('mod1', 't2_m1')
+    assert modaction.target == UserRef('bob')
+    assert subreddit_of(modaction) == 'testsub'
+    assert submission_key(comment) == 'p2'
+    assert submission_key(PostEvent.from_praw(make_submission(reddit))) == 'p1'
+
+
+@pytest.mark.parametrize("batched", [False, True])
+def test_savers_store_events_like_praw_objects(reddit: praw.Reddit, sqlite_engine: Engine, batched: bool):
+    Session = sessionmaker(bind=sqlite_engine)
+    saver = BatchDatabaseSaver(Session, batch_size=100, flush_interval=0) if batched else DatabaseSaver(Session)
+    saver.save_post(PostEvent.from_praw(make_submission(reddit)))
+    saver.save_comment(CommentEvent.from_praw(make_comment(reddit)))
+    saver.save_modaction(ModActionEvent.from_praw(make_modaction(reddit)))
+    if isinstance(saver, BatchDatabaseSaver):
+        saver.close()
+    with Session() as session:
+        post = session.query(PostModel).filter_by(reddit_id='p1').one()
+        assert (post.title, post.body, post.author_id) == ('Hello', 'Body', 'alice')
+        stub = session.query(PostModel).filter_by(reddit_id='p2').one()
+        assert (stub.title, stub.body, stub.author_id) == ('Older post', None, 'carol')
+        comment = session.query(CommentModel).filter_by(reddit_id='c1').one()
+        assert (comment.post_id, comment.author_id) == ('p2', 'bob')
+        modaction = session.query(ModActionModel).one()
+        assert (modaction.mod, modaction.mod_id, modaction.target_author_id) == ('mod1', 'm1', 'bob')
+        users = {user.name: user.fullname for user in session.query(UserModel)}
+        assert users == {'alice': 't2_a1', 'bob': 't2_b1', 'carol': None, 'mod1': 't2_m1'}
+
+@pytest.mark.parametrize("batched", [False, True])
+def test_post_saved_after_its_comment_fills_in_the_stub(reddit: praw.Reddit, sqlite_engine: Engine, batched: bool):
+    Session = sessionmaker(bind=sqlite_engine)
+    saver = BatchDatabaseSaver(Session, batch_size=1, flush_interval=0) if batched else DatabaseSaver(Session)
+    saver.save_comment(CommentEvent.from_praw(make_comment(reddit)))
+    submission = make_submission(reddit)
+    submission.id, submission.name, submission.author_fullname = 'p2', 't3_p2', 't2_c1'
+    saver.save_post(PostEvent.from_praw(submission))
+    if isinstance(saver, BatchDatabaseSaver):
+        saver.close()
+    with Session() as session:
+        post = session.query(PostModel).filter_by(reddit_id='p2').one()
+        assert (post.title, post.body, post.stub) == ('Hello', 'Body', 0)
+        assert post.created_utc.replace(tzinfo=timezone.utc).timestamp() == pytest.approx(NOW - 60)
+        assert session.query(PostModel).count() == 1
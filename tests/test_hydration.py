@@ -0,0 +1,47 @@
+import pytest
+from pathlib import Path
+from threading import Event
+from types import SimpleNamespace
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from PygBrother.models import Base, PostModel
+from PygBrother.reddit_fetcher import RedditFetcher
+from PygBrother.scheduler import RateLimiter
+
+
+@pytest.fixture
+def fetcher():
+    # Reddit knows posts p0..p249; info() answers in its own order, skipping unknown IDs
+    known = {f't3_p{i}' for i in range(250)}
+    calls: list[list[str]] = []
+    def info(fullnames: list[str]):
+        calls.append(list(fullnames))
+        return [SimpleNamespace(fullname=f, id=f[3:]) for f in sorted(fullnames) if f in known]
+    fetcher = RedditFetcher.__new__(RedditFetcher)
+    fetcher.reddit = SimpleNamespace(info=info)
+    fetcher.rate_limiter = RateLimiter(60000)
+    fetcher.stop_event = Event()
+    fetcher.calls = calls
+    return fetcher
+
+
+def test_fetch_posts_in_batches_of_100_in_input_order(fetcher: RedditFetcher):
+    ids = [f'p{i}' for i in range(249, -1, -1)] + ['t3_gone']
+    result = fetcher.fetch_posts_by_ids(ids)
+    assert [len(call) for call in fetcher.calls] == [100, 100, 51]
+    assert [post.id for post in result.items] == [f'p{i}' for i in range(249, -1, -1)]
+    assert result.missing == ['t3_gone']
+    assert result.stored == []
+
+def test_fetch_posts_skips_ids_already_stored(fetcher: RedditFetcher, tmp_path: Path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'hydrate.db'}")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as session:
+        session.add(PostModel(reddit_id='p1', title='Stored'))
+        session.commit()
+    result = fetcher.fetch_posts_by_ids(['p0', 't3_p1', 'p2'], session_factory=Session)
+    assert fetcher.calls == [['t3_p0', 't3_p2']]
+    assert [post.id for post in result.items] == ['p0', 'p2']
+    assert [row.title for row in result.stored] == ['Stored']
+    engine.dispose()
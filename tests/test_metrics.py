@@ -0,0 +1,44 @@
+import urllib.request
+import pytest
+from PygBrother import metrics
+from PygBrother.metrics import Counter, Histogram
+from PygBrother.reddit_fetcher import Publisher
+
+
+@pytest.fixture
+def enabled():
+    metrics.enable()
+    yield metrics.get_registry()
+    metrics.get_registry().enabled = False
+
+def test_disabled_instruments_record_nothing():
+    counter = Counter("test_disabled_total", "Test counter.", ("stream",))
+    histogram = Histogram("test_disabled_seconds", "Test histogram.")
+    counter.inc("posts")
+    histogram.observe(0.1)
+    with histogram.time():
+        pass
+    assert counter.value("posts") == 0
+    assert histogram.count() == 0
+
+def test_histogram_renders_cumulative_buckets(enabled: metrics.Registry):
+    histogram = Histogram("test_latency_seconds", "Test histogram.", ("stream",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value, "posts")
+    text = histogram.render()
+    assert 'test_latency_seconds_bucket{stream="posts",le="0.1"} 1\n' in text
+    assert 'test_latency_seconds_bucket{stream="posts",le="1"} 3\n' in text
+    assert 'test_latency_seconds_bucket{stream="posts",le="+Inf"} 4\n' in text
+    assert 'test_latency_seconds_count{stream="posts"} 4\n' in text
+
+def test_http_endpoint_serves_publisher_metrics(enabled: metrics.Registry):
+    publisher: Publisher[int] = Publisher("test_http")
+    publisher.subscribe(lambda item: None)
+    publisher.notify(1)
+    server = metrics.start_http_server(0)
+    try:
+        body = urllib.request.urlopen(f"http://127.0.0.1:{server.server_port}/metrics").read().decode()
+    finally:
+        server.shutdown()
+    assert '# TYPE pygbrother_dispatch_seconds histogram' in body
+    assert 'pygbrother_dispatch_seconds_count{publisher="test_http"} 1' in body
@@ -0,0 +1,48 @@
+import os
+import re
+from pathlib import Path
+from threading import Lock
+from PygBrother.process_subscriber import ProcessSubscriber
+
+SPAM = re.compile(r"buy|cheap|free money")
+
+def check_body(item: tuple[int, str]) -> str | None:
+    return "remove" if SPAM.search(item[1]) else None
+
+def crash_once(item: tuple[int, str]) -> int:
+    # The first worker to see item 7 dies, as if it had segfaulted
+    marker = Path(item[1])
+    if item[0] == 7 and not marker.exists():
+        marker.touch()
+        os._exit(1)
+    if item[0] == 3:
+        raise ValueError("bad item")
+    return item[0]
+
+
+def test_results_come_back_through_callback():
+    results: list[tuple[int, str]] = []
+    lock = Lock()
+    def on_result(item: tuple[int, str], result: str) -> None:
+        with lock:
+            results.append((item[0], result))
+    subscriber = ProcessSubscriber(check_body, on_result=on_result, workers=2, batch_size=8)
+    for i in range(50):
+        subscriber((i, "buy cheap watches" if i % 10 == 0 else "how do I install pip"))
+    subscriber.close()
+    assert sorted(results) == [(i, "remove") for i in range(0, 50, 10)]
+    assert subscriber.depth() == 0
+
+def test_crashed_worker_is_replaced_and_batch_retried(tmp_path: Path):
+    results: list[int] = []
+    lock = Lock()
+    def on_result(item: tuple[int, str], result: int) -> None:
+        with lock:
+            results.append(result)
+    subscriber = ProcessSubscriber(crash_once, on_result=on_result, workers=2, batch_size=4)
+    for i in range(20):
+        subscriber((i, str(tmp_path / "crashed")))
+    subscriber.close()
+    assert subscriber.restarts >= 1
+    # Item 3 raised and is reported as an error; every other item made it once
+    assert sorted(results) == [i for i in range(20) if i != 3]
@@ -0,0 +1,98 @@
+import time
+from threading import Event, Lock, Thread
+from types import SimpleNamespace
+from PygBrother.reddit_fetcher import Publisher, QueuedPublisher, split_subreddits, submission_key
+
+
+def test_inline_publisher_notifies_in_order():
+    received: list[int] = []
+    publisher: Publisher[int] = Publisher()
+    publisher.subscribe(received.append)
+    for i in range(5):
+        publisher.notify(i)
+    publisher.close()
+    assert received == [0, 1, 2, 3, 4]
+
+def test_queued_publisher_keeps_order_per_key():
+    received: dict[str, list[int]] = {}
+    lock = Lock()
+    def record(item: tuple[str, int]) -> None:
+        with lock:
+            received.setdefault(item[0], []).append(item[1])
+    publisher: QueuedPublisher[tuple[str, int]] = QueuedPublisher("test", workers=4, maxsize=100, key=lambda item: item[0])
+    publisher.subscribe(record)
+    for i in range(200):
+        publisher.notify((f"k{i % 7}", i))
+    publisher.close()
+    assert sum(len(items) for items in received.values()) == 200
+    for items in received.values():
+        assert items == sorted(items)
+
+def test_drop_oldest_when_full():
+    release = Event()
+    received: list[int] = []
+    def slow(item: int) -> None:
+        release.wait()
+        received.append(item)
+    publisher: QueuedPublisher[int] = QueuedPublisher("test", workers=1, maxsize=2, on_full='drop_oldest')
+    publisher.subscribe(slow)
+    publisher.notify(0)
+    time.sleep(0.05)  # let the worker pick item 0 up
+    for i in range(1, 6):
+        publisher.notify(i)
+    assert publisher.depth() == 2
+    assert publisher.dropped == 3
+    release.set()
+    publisher.close()
+    assert received == [0, 4, 5]
+
+def test_blocked_notify_drops_item_when_closed():
+    release = Event()
+    received: list[int] = []
+    def slow(item: int) -> None:
+        release.wait()
+        received.append(item)
+    publisher: QueuedPublisher[int] = QueuedPublisher("test", workers=1, maxsize=1)
+    publisher.subscribe(slow)
+    publisher.notify(0)
+    time.sleep(0.05)  # let the worker pick item 0 up
+    publisher.notify(1)
+    blocked = Thread(target=publisher.notify, args=(2,))
+    blocked.start()
+    time.sleep(0.05)
+    closer = Thread(target=publisher.close)
+    closer.start()
+    blocked.join(1)
+    assert not blocked.is_alive()
+    release.set()
+    closer.join(1)
+    assert received == [0, 1]
+
+def test_failing_subscriber_does_not_stop_workers():
+    received: list[int] = []
+    def failing(item: int) -> None:
+        raise RuntimeError("boom")
+    publisher: QueuedPublisher[int] = QueuedPublisher("test", workers=2)
+    publisher.subscribe(failing)
+    publisher.subscribe(received.append)
+    for i in range(10):
+        publisher.notify(i)
+    publisher.close()
+    assert sorted(received) == list(range(10))
+
+def test_submission_key_groups_comments_with_their_post():
+    post = SimpleNamespace(id='abc')
+    comment = SimpleNamespace(id='c1', link_id='t3_abc')
+    assert submission_key(post) == submission_key(comment) == 'abc'
+
+def test_subscribe_filters_by_subreddit():
+    received: list[str] = []
+    publisher: Publisher[SimpleNamespace] = Publisher()
+    publisher.subscribe(lambda item: received.append(item.id), subreddit='Python')
+    publisher.notify(SimpleNamespace(id='p1', subreddit='python'))
+    publisher.notify(SimpleNamespace(id='p2', subreddit='learnpython'))
+    publisher.notify({"modaction": SimpleNamespace(id="m1", subreddit="other"), "target": None})
+    assert received == ['p1']
+
+def test_split_subreddits():
+    assert split_subreddits('python, learnpython+pythonhelp') == ['python', 'learnpython', 'pythonhelp']
@@ -0,0 +1,82 @@
+import time
+from collections import Counter
+from threading import Thread
+import pytest
+from PygBrother.reddit_fetcher import RedditFetcher
+from PygBrother.replay import Recording, ReplayRequestor, replay_kwargs, requestor_of
+
+START = 1_700_000_000.0
+PRAW_CONFIG = {'client_id': 'id', 'client_secret': 'secret', 'refresh_token': 'token', 'user_agent': 'PygBrother replay test'}
+
+
+@pytest.fixture
+def recording() -> Recording:
+    recording = Recording()
+    recording.me = {"name": "replay_bot", "id": "1"}
+    recording.subreddits["testsub"] = {"display_name": "testsub", "name": "t5_1", "id": "1", "user_is_moderator": True}
+    recording.add_listing("new", [{
+        "id": f"p{i}", "name": f"t3_p{i}", "title": f"Post {i}", "author": f"user{i % 3}", "selftext": "",
+        "url": "https://example.com", "score": 1, "num_comments": 0, "subreddit": "testsub", "created_utc": START + i * 10,
+    } for i in range(20)])
+    recording.add_listing("comments", [{
+        "id": f"c{i}", "name": f"t1_c{i}", "body": f"Comment {i}", "author": f"user{i % 5}", "link_id": f"t3_p{i % 20}",
+        "parent_id": f"t3_p{i % 20}", "score": 1, "subreddit": "testsub", "created_utc": START + 1 + i * 4,
+    } for i in range(50)])
+    recording.add_listing("log", [{
+        "id": f"ModAction_{i}", "action": "removecomment", "mod": "replay_bot", "mod_id36": "1", "target_author": f"user{i % 4}",
+        "target_fullname": f"t1_c{i}", "subreddit": "testsub", "created_utc": START + 2 + i * 20, "description": None, "details": None,
+    } for i in range(10)])
+    return recording
+
+def run_fetcher(fetcher: RedditFetcher, seconds: float, concurrent: bool = False) -> None:
+    fetcher.min_backoff = 0.01
+    fetcher.max_backoff = 0.05
+    thread = Thread(target=fetcher.run, kwargs={'concurrent': concurrent})
+    thread.start()
+    time.sleep(seconds)
+    fetcher.stop()
+    thread.join()
+
+def collect(fetcher: RedditFetcher) -> dict[str, list[str]]:
+    received: dict[str, list[str]] = {"posts": [], "comments": [], "modactions": []}
+    fetcher.post_publisher.subscribe(lambda post: received["posts"].append(post.id))
+    fetcher.comment_publisher.subscribe(lambda comment: received["comments"].append(comment.id))
+    fetcher.modaction_publisher.subscribe(lambda event: received["modactions"].append(event["modaction"].id))
+    return received
+
+
+@pytest.mark.parametrize("concurrent", [False, True])
+def test_replay_delivers_every_item_once_despite_429s(recording: Recording, concurrent: bool):
+    # The whole recording plays in about 2 seconds, three times over with the multiplier
+    fetcher = RedditFetcher("testsub", PRAW_CONFIG, requests_per_minute=60000,
+                            reddit_kwargs=replay_kwargs(recording, speed=100, rate_multiplier=3, error_rate=0.1, backlog=1))
+    assert fetcher.username == "replay_bot"
+    received = collect(fetcher)
+    run_fetcher(fetcher, 3.0, concurrent)
+    requestor = requestor_of(fetcher.reddit)
+    assert isinstance(requestor, ReplayRequestor) and requestor.exhausted() and requestor.errors > 0
+    for stream, total in (("posts", 60), ("comments", 150), ("modactions", 30)):
+        assert max(Counter(received[stream]).values()) == 1
+        # Only what existed at startup is skipped
+        assert total - 3 <= len(received[stream]) <= total
+
+def test_paused_stream_resumes_without_gap(recording: Recording):
+    fetcher = RedditFetcher("testsub", PRAW_CONFIG, requests_per_minute=60000, reddit_kwargs=replay_kwargs(recording, speed=100))
+    received = collect(fetcher)
+    fetcher.min_backoff = 0.01
+    fetcher.max_backoff = 0.05
+    thread = Thread(target=fetcher.run)
+    thread.start()
+    time.sleep(0.3)
+    fetcher.pause_stream("comments")
+    time.sleep(0.1)
+    while_paused = len(received["comments"])
+    time.sleep(1.5)
+    assert len(received["comments"]) == while_paused
+    fetcher.resume_stream("comments")
+    time.sleep(1.0)
+    fetcher.stop()
+    thread.join()
+    # Everything that arrived while paused is delivered once resumed, in order
+    first = int(received["comments"][0][1:])
+    assert received["comments"] == [f"c{i}" for i in range(first, 50)]
@@ -0,0 +1,101 @@
+import os
+import pytest
+from pathlib import Path
+from types import SimpleNamespace
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from PygBrother.models import Base, ModerationRuleModel
+from PygBrother.rules import CompiledRules, FileRuleSource, Rule, RuleEngine, RuleMatch, TableRuleSource
+
+RULES = [
+    Rule("crypto", "keyword", ("free bitcoin", "crypto giveaway")),
+    Rule("free", "keyword", ("free",)),
+    Rule("bitcoin", "keyword", ("bitcoin",)),
+    Rule("shortener", "domain", ("bit.ly",), action="remove"),
+    Rule("phone", "regex", (r"\+?\d{3}[ -]?\d{3}[ -]?\d{4}",)),
+    Rule("call", "regex", (r"\+?\d{3}",)),
+    Rule("shouting", "regex", (r"\bNOW\b",), case_sensitive=True),
+]
+
+def names(matches: list[RuleMatch]) -> list[str]:
+    return [match.rule.name for match in matches]
+
+
+def test_every_overlapping_rule_is_found_in_one_pass():
+    compiled = CompiledRules(RULES)
+    text = "Get FREE   Bitcoin at https://www.bit.ly/x or call +555 123 4567 NOW"
+    assert names(compiled.match(text)) == ["crypto", "free", "bitcoin", "shortener", "phone", "call", "shouting"]
+    assert compiled.match(text)[0].text == "free bitcoin"
+    assert compiled.match("freebitcoin at notbit.ly, now") == []
+    assert names(compiled.match("a crypto  giveaway on sub.bit.ly")) == ["crypto", "shortener"]
+
+def test_invalid_rules_are_rejected():
+    with pytest.raises(ValueError):
+        CompiledRules([Rule("broken", "regex", ("(unclosed",))])
+    with pytest.raises(ValueError):
+        CompiledRules([Rule("everything", "regex", (r"\d*",))])
+    with pytest.raises(ValueError):
+        Rule.from_dict({"name": "odd", "kind": "glob", "patterns": ["*"]})
+
+def test_patterns_with_group_references_keep_their_meaning():
+    compiled = CompiledRules([
+        Rule("xx", "regex", (r"(x)\1",)),
+        Rule("yy", "regex", (r"(y)\1",)),
+        Rule("price", "regex", (r"(?P<amount>\d+) ?usd",)),
+        Rule("cost", "regex", (r"cost (?P<amount>\d+)",)),
+        Rule("plain", "regex", (r"(free|cheap) pills",)),
+    ])
+    assert names(compiled.match("yy")) == ["yy"]
+    assert names(compiled.match("xx and yy")) == ["xx", "yy"]
+    assert names(compiled.match("xy")) == []
+    assert names(compiled.match("it will cost 20 USD, cheap pills")) == ["price", "cost", "plain"]
+
+def test_patterns_with_global_inline_flags_are_kept_apart():
+    compiled = CompiledRules([
+        Rule("spam", "regex", (r"(?i)SPAM",), case_sensitive=True),
+        Rule("verbose", "regex", (r"(?x) buy \s+ now",)),
+        Rule("plain", "regex", (r"cheap",)),
+    ])
+    assert names(compiled.match("Spam: BUY NOW, cheap")) == ["spam", "verbose", "plain"]
+    assert names(compiled.match("buynow")) == []
+
+def test_engine_hot_reloads_rule_file(tmp_path: Path):
+    path = tmp_path / "rules.toml"
+    path.write_text('[[rule]]\nname = "spam"\npatterns = ["buy now"]\nstreams = ["comments"]\n')
+    hits: list[tuple[str, list[str]]] = []
+    engine = RuleEngine(FileRuleSource(path), on_match=lambda item, matches: hits.append((item.id, names(matches))), reload_interval=0)
+    engine.check_comment(SimpleNamespace(id="c1", body="Buy now!"))
+    engine.check_post(SimpleNamespace(id="p1", title="buy now", selftext="", url=None))
+    path.write_text('[[rule]]\nname = "spam"\npatterns = ["cheap watches"]\naction = "remove"\n')
+    os.utime(path, ns=(1, 1))
+    engine.check_comment(SimpleNamespace(id="c2", body="buy now"))
+    engine.check_post(SimpleNamespace(id="p2", title="Cheap watches", selftext="", url=None))
+    # A broken file keeps the rules that were loaded
+    path.write_text('[[rule]]\nname = "bad"\nkind = "regex"\npatterns = ["("]\n')
+    engine.check_comment(SimpleNamespace(id="c3", body="cheap watches"))
+    assert hits == [("c1", ["spam"]), ("p2", ["spam"]), ("c3", ["spam"])]
+
+def test_table_source_groups_rows_and_sees_changes(tmp_path: Path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'rules.db'}")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as session:
+        session.add_all([
+            ModerationRuleModel(name="spam", pattern="buy now"),
+            ModerationRuleModel(name="spam", pattern="cheap watches"),
+            ModerationRuleModel(name="links", kind="domain", pattern="example.com", action="remove", streams="posts"),
+            ModerationRuleModel(name="old", pattern="legacy", enabled=0),
+        ])
+        session.commit()
+    source = TableRuleSource(Session)
+    rule_engine = RuleEngine(source, reload_interval=3600)
+    assert sorted(len(compiled) for compiled in rule_engine.compiled.values()) == [1, 2]
+    assert names(rule_engine.evaluate("comments", "cheap watches at example.com")) == ["spam"]
+    version = source.version()
+    with Session() as session:
+        session.query(ModerationRuleModel).filter_by(name="old").update({"enabled": 1})
+        session.commit()
+    assert source.version() != version
+    assert rule_engine.reload()
+    assert names(rule_engine.evaluate("comments", "legacy")) == ["old"]
+    engine.dispose()
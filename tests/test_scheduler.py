@@ -0,0 +1,58 @@
+import time
+import pytest
+from threading import Event
+from PygBrother.scheduler import AdaptiveScheduler, RateLimiter
+
+
+def test_rate_limiter_allows_burst_then_throttles():
+    limiter = RateLimiter(requests_per_minute=600, burst=5)
+    start = time.monotonic()
+    for _ in range(5):
+        assert limiter.acquire("posts")
+    assert time.monotonic() - start < 0.05
+    assert limiter.acquire("posts")
+    # 600 rpm refills one token every 0.1s
+    assert time.monotonic() - start >= 0.08
+
+def test_rate_limiter_stops_waiting_on_stop_event():
+    limiter = RateLimiter(requests_per_minute=1, burst=1)
+    stop_event = Event()
+    assert limiter.acquire("posts", stop_event)
+    stop_event.set()
+    assert not limiter.acquire("posts", stop_event)
+
+def test_adaptive_scheduler_follows_remaining_budget():
+    limits = {'remaining': 1000, 'used': 0}
+    scheduler = AdaptiveScheduler(requests_per_minute=100, limits=lambda: limits, reserve=0.0)
+    assert scheduler.overall_rate() == 100
+    limits.update(remaining=60, used=940)
+    assert scheduler.overall_rate() == pytest.approx(6.0)
+    limits.update(remaining=0, used=1000)
+    assert scheduler.overall_rate() == 0
+
+def test_adaptive_scheduler_shares_by_arrival_rate():
+    scheduler = AdaptiveScheduler(requests_per_minute=100)
+    scheduler.record("comments", 0)
+    scheduler.record("posts", 0)
+    time.sleep(0.05)
+    scheduler.record("comments", 50)
+    scheduler.record("posts", 0)
+    assert scheduler.share("comments") > 0.9
+    scheduler.register("backfill", 1000.0)
+    assert scheduler.share("backfill") > scheduler.share("comments")
+    scheduler.unregister("backfill")
+    assert scheduler.share("comments") > 0.9
+
+def test_rate_limiter_caps_registered_consumer_at_its_share():
+    limiter = RateLimiter(requests_per_minute=600, burst=20)
+    limiter.register("backfill", 0.25)
+    start = time.monotonic()
+    for _ in range(3):
+        assert limiter.acquire("backfill")
+    # A quarter of 600 rpm is one request every 0.4s, while the burst is left to the streams
+    assert time.monotonic() - start >= 0.75
+    for _ in range(10):
+        assert limiter.acquire("posts")
+    assert time.monotonic() - start < 1.0
+    limiter.unregister("backfill")
+    assert limiter.acquire("backfill")
@@ -0,0 +1,64 @@
+from pathlib import Path
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, create_engine, inspect, select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.schema import CreateTable
+from sqlalchemy.orm import sessionmaker
+from PygBrother.db_saver import DatabaseSaver
+from PygBrother.events import PostEvent, UserRef
+from PygBrother.models import Base, UserModel
+from PygBrother.schema import ensure_columns, ensure_indexes, missing_columns, partitioned_table
+
+
+def test_ensure_indexes_adds_missing_indexes(tmp_path: Path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'schema.db'}")
+    Base.metadata.create_all(engine)
+    # A database created before the indexes were declared
+    for index in Base.metadata.tables['comments'].indexes:
+        index.drop(engine)
+    created = ensure_indexes(engine)
+    assert created == len(Base.metadata.tables['comments'].indexes)
+    names = {index['name'] for index in inspect(engine).get_indexes('comments')}
+    assert {'ix_comments_author_created', 'ix_comments_subreddit_created'} <= names
+    assert ensure_indexes(engine) == 0
+    engine.dispose()
+
+def create_baseline_schema(engine) -> None:
+    """The tables as the first release created them, before users.fullname, users.enriched_utc and posts.stub."""
+    Table(
+        'users', MetaData(),
+        Column('id', Integer, primary_key=True), Column('reddit_id', String, unique=True, nullable=False),
+        Column('name', String, nullable=False), Column('created_utc', DateTime), Column('link_karma', Integer),
+        Column('comment_karma', Integer), Column('is_mod', Integer), Column('icon_img', String),
+    ).create(engine)
+    Base.metadata.create_all(engine, tables=[table for table in Base.metadata.sorted_tables if table.name != 'users'])
+    with engine.begin() as connection:
+        connection.execute(text('ALTER TABLE posts DROP COLUMN stub'))
+
+def test_ensure_columns_upgrades_baseline_database(tmp_path: Path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'baseline.db'}")
+    create_baseline_schema(engine)
+    assert missing_columns(engine) == {'users': ['fullname', 'enriched_utc'], 'posts': ['stub']}
+    # Indexes on the missing columns wait for them instead of failing startup
+    assert ensure_indexes(engine) == 0
+    assert ensure_columns(engine) == 3
+    assert ensure_indexes(engine) == 2
+    assert missing_columns(engine) == {}
+    assert ensure_columns(engine) == 0
+
+    Session = sessionmaker(bind=engine)
+    DatabaseSaver(Session).save_post(PostEvent(
+        id='p1', fullname='t3_p1', title='Hello', selftext='', created_utc=1_700_000_000.0,
+        url='', score=1, num_comments=0, subreddit='python', author=UserRef('alice', fullname='t2_alice'),
+    ))
+    with Session() as session:
+        assert session.scalar(select(UserModel.fullname).where(UserModel.name == 'alice')) == 't2_alice'
+    engine.dispose()
+
+def test_partitioned_table_keys_include_created_utc():
+    table = partitioned_table('comments', MetaData())
+    ddl = str(CreateTable(table).compile(dialect=postgresql.dialect()))
+    assert 'PARTITION BY RANGE (created_utc)' in ddl
+    assert 'PRIMARY KEY (id, created_utc)' in ddl
+    assert 'UNIQUE (reddit_id, created_utc)' in ddl
+    # The models themselves are untouched
+    assert list(Base.metadata.tables['comments'].primary_key.columns.keys()) == ['id']
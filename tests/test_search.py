@@ -0,0 +1,71 @@
+import time
+from datetime import datetime, timezone
+import pytest
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+from PygBrother.batch_saver import BatchDatabaseSaver
+from PygBrother.db_saver import DatabaseSaver
+from PygBrother.search import fts5_query, reindex, search
+from conftest import comment_event, post_event
+
+NOW = time.time()
+DAY = 24 * 3600
+
+def save_items(saver: DatabaseSaver | BatchDatabaseSaver) -> None:
+    p1 = post_event('p1', 'Rate limits in praw', 'How do I stay under the rate limit?', 'python', 'alice', NOW)
+    p2 = post_event('p2', 'Async streams', 'Streaming comments with asyncpraw', 'python', 'bob', NOW - 10 * DAY)
+    p3 = post_event('p3', 'Weekly thread', 'Post your rate limit questions here', 'learnpython', 'carol', NOW)
+    for post in (p1, p2, p3):
+        saver.save_post(post)
+    saver.save_comment(comment_event('c1', p1, 'The rate limiter sleeps between requests', 'bob', NOW))
+    saver.save_comment(comment_event('c2', p1, 'Limits are per OAuth client', 'carol', NOW))
+    saver.save_comment(comment_event('c1', p1, 'The rate limiter sleeps between requests', 'bob', NOW))
+    if isinstance(saver, BatchDatabaseSaver):
+        saver.close()
+
+
+def test_fts5_query():
+    assert fts5_query('rate limit') == '"rate" "limit"'
+    assert fts5_query('"rate limit" -praw') == '"rate limit" NOT "praw"'
+    assert fts5_query('praw or asyncpraw') == '"praw" OR "asyncpraw"'
+    assert fts5_query('AND( "') == '"AND("'
+    assert fts5_query('-praw or') == ''
+
+
+@pytest.mark.parametrize("batched", [False, True])
+def test_savers_index_and_search_filters(search_engine: Engine, batched: bool):
+    Session = sessionmaker(bind=search_engine)
+    if batched:
+        save_items(BatchDatabaseSaver(Session, batch_size=100, flush_interval=0, search_index=True))
+    else:
+        save_items(DatabaseSaver(Session, search_index=True))
+    with Session() as session, session.begin():
+        # c1 was saved twice but is indexed once
+        assert session.scalar(text("SELECT count(*) FROM search_fts")) == 5
+        hits = search(session, 'rate limit')
+        assert {(hit.kind, hit.item.reddit_id) for hit in hits} == {('posts', 'p1'), ('posts', 'p3'), ('comments', 'c1')}
+        # Matches in the title rank above matches in the body
+        assert hits[0].item.reddit_id == 'p1'
+        assert [hit.item.reddit_id for hit in search(session, 'rate limit', subreddit='python')] == ['p1', 'c1']
+        assert [hit.item.reddit_id for hit in search(session, 'rate limit', author='bob')] == ['c1']
+        assert [hit.item.reddit_id for hit in search(session, 'rate limit', kinds=('comments',))] == ['c1']
+        assert [hit.item.reddit_id for hit in search(session, 'streaming')] == ['p2']
+        assert search(session, 'streaming', since=datetime.fromtimestamp(NOW - DAY, tz=timezone.utc)) == []
+        # Stemmed, so "rate limiter" matches the phrase too
+        assert [hit.item.reddit_id for hit in search(session, '"rate limit" -questions')] == ['p1', 'c1']
+        pages = [hit.item.reddit_id for offset in range(3) for hit in search(session, 'rate limit', limit=1, offset=offset)]
+        assert pages == [hit.item.reddit_id for hit in hits]
+
+
+def test_reindex_existing_rows(search_engine: Engine):
+    Session = sessionmaker(bind=search_engine)
+    save_items(BatchDatabaseSaver(Session, batch_size=100, flush_interval=0))
+    with Session() as session:
+        assert search(session, 'rate limit') == []
+        assert reindex(session, batch_size=2) == 5
+        session.commit()
+        assert len(search(session, 'rate limit')) == 3
+        # Reindexing again replaces the index instead of adding to it
+        assert reindex(session) == 5
+        assert session.scalar(text("SELECT count(*) FROM search_fts")) == 5
@@ -0,0 +1,101 @@
+import time
+import pytest
+from unittest.mock import MagicMock
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+from PygBrother.models import UserModel, PostModel, CommentModel
+from PygBrother.db_saver import DatabaseSaver
+from PygBrother.seen_index import BloomFilter, SeenIndex
+
+@pytest.fixture
+def mock_comment():
+    user = MagicMock()
+    user.name = 'mockuser'
+    user.link_karma = 1
+    user.comment_karma = 2
+    user.is_mod = False
+    user.icon_img = None
+    post = MagicMock()
+    post.id = 'abc123'
+    post.title = 'Test Post'
+    post.selftext = 'Body of post'
+    post.created_utc = time.time()
+    post.url = 'http://reddit.com/post'
+    post.score = 10
+    post.num_comments = 2
+    post.subreddit = 'testsub'
+    post.author = user
+    comment = MagicMock()
+    comment.id = 'cmt123'
+    comment.body = 'Test comment body'
+    comment.created_utc = time.time()
+    comment.score = 5
+    comment.parent_id = 't3_abc123'
+    comment.subreddit = 'testsub'
+    comment.author = user
+    comment.submission = post
+    return comment
+
+def count_selects(engine: Engine) -> list[str]:
+    statements: list[str] = []
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            statements.append(statement)
+    return statements
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000)
+    for i in range(1000):
+        bloom.add(f'id{i}')
+    assert all(f'id{i}' in bloom for i in range(1000))
+    false_positives = sum(f'other{i}' in bloom for i in range(1000))
+    assert false_positives < 50
+
+def test_lru_evicts_oldest():
+    index = SeenIndex(max_size=2)
+    index.add('posts', ['a', 'b'])
+    assert index.known('posts', 'a') is True
+    index.add('posts', ['c'])
+    assert index.known('posts', 'b') is None
+    assert index.known('posts', 'a') is True
+    assert index.known('comments', 'a') is None
+
+def test_track_only_records_committed_rows(sqlite_engine: Engine):
+    index = SeenIndex()
+    Session = sessionmaker(bind=sqlite_engine)
+    session = Session()
+    index.track(session)
+    session.add(UserModel(reddit_id='rolled', name='rolled'))
+    session.flush()
+    session.rollback()
+    assert index.known('users', 'rolled') is None
+    session.add(UserModel(reddit_id='kept', name='kept'))
+    session.commit()
+    assert index.known('users', 'kept') is True
+    session.close()
+
+def test_warm_loads_bloom_filter(sqlite_engine: Engine):
+    Session = sessionmaker(bind=sqlite_engine)
+    with Session() as session:
+        session.add_all([UserModel(reddit_id=f'u{i}', name=f'u{i}') for i in range(10)])
+        session.commit()
+        index = SeenIndex(max_size=5, bloom_capacity=100)
+        index.warm(session, [UserModel, PostModel])
+    assert index.known('users', 'u9') is True
+    assert index.known('users', 'u0') is None
+    assert index.known('users', 'never-seen') is False
+    assert index.known('posts', 'anything') is False
+
+def test_saver_skips_queries_for_known_ids(sqlite_engine: Engine, mock_comment: MagicMock):
+    Session = sessionmaker(bind=sqlite_engine)
+    saver = DatabaseSaver(Session, seen_index=SeenIndex())
+    saver.save_comment(mock_comment)
+    selects = count_selects(sqlite_engine)
+    saver.save_comment(mock_comment)
+    assert selects == []
+    with Session() as session:
+        assert session.query(CommentModel).count() == 1
+        assert session.query(PostModel).count() == 1
@@ -0,0 +1,108 @@
+import sqlite3
+import time
+from pathlib import Path
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import IntegrityError, OperationalError, SQLAlchemyError
+from sqlalchemy.orm import sessionmaker
+from PygBrother.models import Base, CommentModel, PostModel
+from PygBrother.spool import Spool, SpooledDatabaseSaver
+from conftest import comment_event, post_event
+
+
+def test_spool_keeps_items_while_database_is_down_and_replays_them(tmp_path: Path):
+    # A database file in a missing directory cannot be opened: OperationalError on every write
+    down = sessionmaker(bind=create_engine(f"sqlite:///{tmp_path / 'missing' / 'main.db'}"))
+    saver = SpooledDatabaseSaver(down, tmp_path / 'spool.db', batch_size=10, min_backoff=0.01, max_backoff=0.01)
+    post = post_event('p1')
+    saver.save_post(post)
+    for i in range(25):
+        saver.save_comment(comment_event(f'c{i}', post))
+    saver.close(timeout=0.2)
+    spool = Spool(tmp_path / 'spool.db')
+    assert spool.depth() == 26
+    spool.close()
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'main.db'}")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    saver = SpooledDatabaseSaver(Session, tmp_path / 'spool.db', batch_size=10)
+    # Saved again after the restart: the replay must not duplicate it
+    saver.save_post(post)
+    saver.close()
+    assert saver.pending() == 0
+    with Session() as session:
+        assert session.query(PostModel).count() == 1
+        assert session.query(CommentModel).count() == 25
+    engine.dispose()
+
+
+# A schema error is an OperationalError on SQLite too, but the database is up
+@pytest.mark.parametrize("error", [
+    IntegrityError("INSERT", {}, Exception("poisoned")),
+    OperationalError("INSERT", {}, sqlite3.OperationalError("poisoned: no such column")),
+])
+def test_spool_buries_items_that_keep_failing(tmp_path: Path, error: SQLAlchemyError):
+    engine = create_engine(f"sqlite:///{tmp_path / 'main.db'}")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+
+    def session_factory():
+        session = Session()
+        original = session.commit
+
+        def commit() -> None:
+            # Reject any batch holding the poisoned comment
+            if session.query(CommentModel).filter_by(reddit_id='bad').count():
+                raise error
+            original()
+        session.commit = commit  # type: ignore[method-assign]
+        return session
+
+    saver = SpooledDatabaseSaver(session_factory, tmp_path / 'spool.db', batch_size=10, max_attempts=2)
+    post = post_event('p1')
+    saver.save_comment(comment_event('good', post))
+    saver.save_comment(comment_event('bad', post))
+    saver.close(timeout=5)
+    assert saver.pending() == 0
+    with Session() as session:
+        assert [comment.reddit_id for comment in session.query(CommentModel)] == ['good']
+    dead = sqlite3.connect(tmp_path / 'spool.db').execute("SELECT error FROM spool_dead").fetchall()
+    assert len(dead) == 1 and 'poisoned' in dead[0][0]
+    engine.dispose()
+
+
+class Deadlock(Exception):
+    pgcode = '40P01'
+
+def test_spool_retries_deadlocks_without_burying(tmp_path: Path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'main.db'}")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    failures: list[float] = []
+
+    def session_factory():
+        session = Session()
+        original = session.commit
+
+        def commit() -> None:
+            # The first writes lose to a concurrent transaction
+            if len(failures) < 4:
+                failures.append(time.monotonic())
+                raise OperationalError("INSERT", {}, Deadlock("deadlock detected"))
+            original()
+        session.commit = commit  # type: ignore[method-assign]
+        return session
+
+    saver = SpooledDatabaseSaver(session_factory, tmp_path / 'spool.db', batch_size=10, max_attempts=2, min_backoff=0.05)
+    post = post_event('p1')
+    saver.save_comment(comment_event('c1', post))
+    saver.save_comment(comment_event('c2', post))
+    saver.close(timeout=5)
+    assert saver.pending() == 0
+    # Backed off between attempts instead of retrying back-to-back
+    assert failures[-1] - failures[0] >= 0.05 + 0.1 + 0.2
+    with Session() as session:
+        assert session.query(CommentModel).count() == 2
+    assert sqlite3.connect(tmp_path / 'spool.db').execute("SELECT count(*) FROM spool_dead").fetchone() == (0,)
+    engine.dispose()
@@ -0,0 +1,83 @@
+import json
+import time
+from pathlib import Path
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from PygBrother import schema
+from PygBrother.reddit_fetcher import RedditFetcher
+from PygBrother.replay import Recording, replay_kwargs
+from PygBrother.schema import ensure_schema, schema_version, stored_schema_version
+from PygBrother.startup import CachedIdentity, IdentityCache, StartupTimer
+
+PRAW_CONFIG = {'client_id': 'id', 'client_secret': 'secret', 'refresh_token': 'token', 'user_agent': 'PygBrother startup test'}
+
+
+def test_identity_cache_round_trip_and_ttl(tmp_path: Path):
+    cache = IdentityCache(tmp_path / 'identity.json', ttl=60)
+    key = IdentityCache.key(PRAW_CONFIG)
+    assert cache.get(key) is None
+    cache.put(key, CachedIdentity('bot', ['python'], time.time()))
+    assert cache.get(key) == CachedIdentity('bot', ['python'], cache.get(key).checked_utc)
+    # The file holds neither credential, only a hash of them
+    assert 'token' not in (tmp_path / 'identity.json').read_text()
+    assert (tmp_path / 'identity.json').stat().st_mode & 0o777 == 0o600
+    cache.put(key, CachedIdentity('bot', ['python'], time.time() - 120))
+    assert cache.get(key) is None
+    assert IdentityCache.key({**PRAW_CONFIG, 'refresh_token': 'other'}) != key
+
+
+def test_fetcher_reuses_cached_identity(tmp_path: Path):
+    recording = Recording()
+    recording.me = {"name": "replay_bot", "id": "1"}
+    recording.subreddits["testsub"] = {"display_name": "testsub", "name": "t5_1", "id": "1", "user_is_moderator": True}
+    cache = IdentityCache(tmp_path / 'identity.json')
+    fetcher = RedditFetcher("testsub", PRAW_CONFIG, reddit_kwargs=replay_kwargs(recording), identity_cache=cache)
+    assert fetcher.username == "replay_bot"
+    assert cache.get(IdentityCache.key(PRAW_CONFIG)).moderated == ["testsub"]
+
+    # While the entry is fresh, Reddit is not asked who the account is
+    recording.me = {"name": "renamed_bot", "id": "1"}
+    fetcher = RedditFetcher("TestSub", PRAW_CONFIG, reddit_kwargs=replay_kwargs(recording), identity_cache=cache)
+    assert fetcher.username == "replay_bot"
+    # A subreddit the cache has not seen is checked again
+    recording.subreddits["other"] = {"display_name": "other", "name": "t5_2", "id": "2", "user_is_moderator": True}
+    fetcher = RedditFetcher("testsub+other", PRAW_CONFIG, reddit_kwargs=replay_kwargs(recording), identity_cache=cache)
+    assert fetcher.username == "renamed_bot"
+    assert json.loads((tmp_path / 'identity.json').read_text())[IdentityCache.key(PRAW_CONFIG)]['moderated'] == ["other", "testsub"]
+
+
+def test_ensure_schema_skips_current_schema(tmp_path: Path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'schema.db'}")
+    assert stored_schema_version(engine) is None
+    assert ensure_schema(engine, skip_if_current=True)
+    assert stored_schema_version(engine) == schema_version()
+    assert 'comments' in inspect(engine).get_table_names()
+    assert not ensure_schema(engine, skip_if_current=True)
+    # Without fast start the checks always run
+    assert ensure_schema(engine)
+
+    timer = StartupTimer()
+    with timer.phase("schema"):
+        ensure_schema(engine, skip_if_current=True)
+    timer.record("reddit auth", 0.5, background=True)
+    assert timer.summary().startswith("Started in ")
+    assert "schema 0." in timer.summary() and "reddit auth 0.50s (in parallel)" in timer.summary()
+    engine.dispose()
+
+
+def test_ensure_schema_keeps_checking_until_columns_exist(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'schema.db'}")
+    ensure_schema(engine)
+    with engine.begin() as connection:
+        connection.execute(text("DELETE FROM schema_meta"))
+        connection.execute(text("DROP INDEX ix_users_fullname"))
+        connection.execute(text("ALTER TABLE users DROP COLUMN fullname"))
+    # A column the upgrade could not add keeps the database from being recorded as current
+    monkeypatch.setattr(schema, 'ensure_columns', lambda engine: 0)
+    assert ensure_schema(engine, skip_if_current=True)
+    assert stored_schema_version(engine) is None
+    monkeypatch.undo()
+    assert ensure_schema(engine, skip_if_current=True)
+    assert stored_schema_version(engine) == schema_version()
+    assert 'fullname' in {column['name'] for column in inspect(engine).get_columns('users')}
+    engine.dispose()
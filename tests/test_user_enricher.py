@@ -0,0 +1,72 @@
+import time
+import pytest
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+from PygBrother.models import UserModel
+from PygBrother.db_saver import DatabaseSaver
+from PygBrother.user_enricher import UserEnricher
+
+@pytest.fixture
+def mock_reddit():
+    reddit = MagicMock()
+    reddit.redditors.partial_redditors.side_effect = lambda ids: iter([
+        SimpleNamespace(fullname=fullname, name='alice', link_karma=11, comment_karma=22, profile_img='http://img')
+        for fullname in ids
+    ])
+    return reddit
+
+@pytest.fixture
+def mock_submission():
+    author = MagicMock()
+    author.name = 'alice'
+    post = MagicMock()
+    post.id = 'abc123'
+    post.title = 'Test Post'
+    post.selftext = 'Body of post'
+    post.created_utc = time.time()
+    post.url = 'http://reddit.com/post'
+    post.score = 10
+    post.num_comments = 2
+    post.subreddit = 'testsub'
+    post.author = author
+    post.author_fullname = 't2_alice'
+    return post
+
+
+def test_saver_defers_profile_fetch(sqlite_engine: Engine, mock_reddit: MagicMock, mock_submission: MagicMock):
+    Session = sessionmaker(bind=sqlite_engine)
+    enricher = UserEnricher(mock_reddit, Session, min_interval=0)
+    DatabaseSaver(Session, enricher=enricher).save_post(mock_submission)
+    with Session() as session:
+        user = session.query(UserModel).filter_by(reddit_id='alice').one()
+        assert user.fullname == 't2_alice'
+        assert user.enriched_utc is None
+    assert enricher.queue.get_nowait() == ('alice', 't2_alice')
+
+def test_enrich_batches_by_fullname(sqlite_engine: Engine, mock_reddit: MagicMock):
+    Session = sessionmaker(bind=sqlite_engine)
+    with Session() as session:
+        session.add(UserModel.from_name('alice', 't2_alice'))
+        session.commit()
+    enricher = UserEnricher(mock_reddit, Session, min_interval=0)
+    enricher.enrich({'alice': 't2_alice'})
+    mock_reddit.redditors.partial_redditors.assert_called_once()
+    mock_reddit.redditor.assert_not_called()
+    with Session() as session:
+        user = session.query(UserModel).filter_by(reddit_id='alice').one()
+        assert user.link_karma == 11
+        assert user.comment_karma == 22
+        assert user.enriched_utc is not None
+
+def test_stale_users_are_requeued(sqlite_engine: Engine, mock_reddit: MagicMock):
+    Session = sessionmaker(bind=sqlite_engine)
+    with Session() as session:
+        session.add(UserModel.from_name('alice', 't2_alice'))
+        session.add(UserModel.from_name('[deleted]'))
+        session.commit()
+    enricher = UserEnricher(mock_reddit, Session, min_interval=0, ttl=60)
+    enricher._enqueue_stale()
+    assert enricher.queue.qsize() == 1
+    assert enricher.queue.get_nowait() == ('alice', 't2_alice')
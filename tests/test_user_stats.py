@@ -0,0 +1,78 @@
+import time
+from datetime import datetime, timezone
+import pytest
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+from PygBrother.batch_saver import BatchDatabaseSaver
+from PygBrother.db_saver import DatabaseSaver
+from PygBrother.events import ModActionEvent, UserRef
+from PygBrother.models import UserDailyStatsModel, UserStatsModel
+from PygBrother.user_stats import get_user_stats, prune_user_stats, rebuild_user_stats
+from conftest import comment_event, post_event
+
+NOW = time.time()
+DAY = 24 * 3600
+
+def modaction_event(reddit_id: str, action: str, target: str) -> ModActionEvent:
+    return ModActionEvent(
+        id=reddit_id, action=action, mod=UserRef('mod1'), target_author=target, target_fullname=None,
+        description=None, details=None, created_utc=NOW, subreddit='testsub',
+    )
+
+def save_history(saver: DatabaseSaver | BatchDatabaseSaver) -> None:
+    old = post_event('p1', author='alice', created_utc=NOW - 10 * DAY)
+    saver.save_post(old)
+    saver.save_post(post_event('p2', author='alice', created_utc=NOW))
+    saver.save_comment(comment_event('c1', old, author='bob', created_utc=NOW - 2 * DAY))
+    saver.save_comment(comment_event('c2', old, author='bob', created_utc=NOW))
+    saver.save_comment(comment_event('c2', old, author='bob', created_utc=NOW))
+    saver.save_modaction(modaction_event('m1', 'removecomment', 'bob'))
+    saver.save_modaction(modaction_event('m2', 'banuser', 'bob'))
+    if isinstance(saver, BatchDatabaseSaver):
+        saver.flush()
+        # Saved again in a later batch: already stored, so not counted again
+        saver.save_comment(comment_event('c1', old, author='bob', created_utc=NOW - 2 * DAY))
+        saver.save_post(old)
+        saver.close()
+
+
+@pytest.mark.parametrize("batched", [False, True])
+def test_savers_maintain_user_stats(sqlite_engine: Engine, batched: bool):
+    Session = sessionmaker(bind=sqlite_engine)
+    saver = BatchDatabaseSaver(Session, flush_interval=0, user_stats=True) if batched else DatabaseSaver(Session, user_stats=True)
+    save_history(saver)
+    with Session() as session:
+        alice = get_user_stats(session, 'alice')
+        assert alice is not None
+        assert (alice.posts, alice.comments, alice.mod_actions) == (2, 0, 0)
+        assert alice.first_seen_utc.date() == datetime.fromtimestamp(NOW - 10 * DAY, timezone.utc).date()
+        assert alice.windows[7]['posts'] == 1 and alice.windows[30]['posts'] == 2
+        bob = get_user_stats(session, 'bob')
+        assert bob is not None
+        assert (bob.comments, bob.removals, bob.bans, bob.mod_actions) == (2, 1, 1, 2)
+        assert dict(bob.windows[7]) == {'comments': 2, 'removecomment': 1, 'banuser': 1}
+        assert get_user_stats(session, 'mod1') is None
+
+
+def test_rebuild_matches_incremental_stats(sqlite_engine: Engine):
+    Session = sessionmaker(bind=sqlite_engine)
+    save_history(BatchDatabaseSaver(Session, flush_interval=0, user_stats=True))
+
+    def snapshot() -> tuple[set[tuple], set[tuple]]:
+        with Session() as session:
+            stats = {(s.user_id, s.posts, s.comments, s.removals, s.bans, s.mod_actions, s.first_seen_utc, s.last_seen_utc)
+                     for s in session.scalars(select(UserStatsModel))}
+            days = {(d.user_id, d.day, d.kind, d.count) for d in session.scalars(select(UserDailyStatsModel))}
+        return stats, days
+
+    incremental = snapshot()
+    with Session() as session:
+        assert rebuild_user_stats(session) == 2
+        session.commit()
+    assert snapshot() == incremental
+    with Session() as session:
+        today = datetime.fromtimestamp(NOW, timezone.utc).date()
+        assert prune_user_stats(session, keep_days=7, today=today) == 1
+        session.commit()
+        assert get_user_stats(session, 'alice', today=today).windows[30]['posts'] == 1